@@ -0,0 +1,562 @@
+import argparse
+import json
+import numpy as np
+import pandas as pd
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import os
+
+import instrumentation
+import main
+
+"""
+Benchmarks of the preprocessing transformers.
+Every benchmark builds its own synthetic data, so it can be run without the supplied sample files:
+
+    python benchmark.py
+
+The scaling benchmark profiles loading and every preparation step at growing input sizes, writes the results as JSON
+and compares them with an earlier run:
+
+    python benchmark.py scaling --sizes 10000 100000 1000000 --output results.json
+    python benchmark.py scaling --sizes 10000 100000 1000000 --baseline results.json
+
+The sharding benchmark compares serial preprocessing with preprocessing sharded by chromosome over 1 to N processes:
+
+    python benchmark.py sharding --variants 1000000 --workers 1 2 4 8
+
+The startup benchmark measures the cold start of the pipeline and fails if importing main loads plotting or machine learning libraries:
+
+    python benchmark.py startup
+"""
+
+"""
+Custom function creating synthetic copy caller results in the CNVpytor column layout.
+Segments are disjoint and sorted within every chromosome, as CNVpytor reports them.
+"""
+def synthetic_cnv_calls(segments, chromosomes=22, seed=0):
+    rng = np.random.default_rng(seed)
+    chroms = np.repeat(np.arange(1, chromosomes + 1), int(np.ceil(segments / chromosomes)))[:segments]
+    starts = np.empty(segments, dtype=np.int64)
+    ends = np.empty(segments, dtype=np.int64)
+    for chrom in np.unique(chroms):
+        mask = chroms == chrom
+        # Alternating gaps and segment lengths keep segments disjoint
+        lengths = rng.integers(10000, 100000, size=(mask.sum(), 2))
+        bounds = np.cumsum(lengths.ravel()).reshape(-1, 2)
+        starts[mask] = bounds[:, 0] + 1
+        ends[mask] = bounds[:, 1]
+    return pd.DataFrame({
+        'file_name': 'file',
+        'method': 'rd_mean_shift',
+        'CNV Type': 'deletion',
+        'chr': chroms.astype(str),
+        'CNV Region Start': starts.astype(float),
+        'CNV Region End': ends.astype(float),
+        'CNV size': (ends - starts + 1).astype(float),
+        'CNV level': rng.uniform(0.0, 4.0, size=segments),
+    })
+
+"""
+Custom function creating synthetic variants with the columns used by CopyCallsMergeTransformer.
+"""
+def synthetic_variants(variants, cnv_df, seed=0):
+    rng = np.random.default_rng(seed)
+    chroms = rng.choice(cnv_df['chr'].unique(), size=variants)
+    positions = rng.integers(1, int(cnv_df['CNV Region End'].max()), size=variants)
+    return pd.DataFrame({'CHROM': np.char.add('chr', chroms.astype(str)), 'POS': positions})
+
+"""
+Lengths of human chromosomes 1-22, X and Y (GRCh37), used to place synthetic variants and copy number bins.
+"""
+CHROMOSOME_LENGTHS = {
+    '1': 249250621, '2': 243199373, '3': 198022430, '4': 191154276, '5': 180915260, '6': 171115067, '7': 159138663,
+    '8': 146364022, '9': 141213431, '10': 135534747, '11': 135006516, '12': 133851895, '13': 115169878, '14': 107349540,
+    '15': 102531392, '16': 90354753, '17': 81195210, '18': 78077248, '19': 59128983, '20': 63025520, '21': 48129895,
+    '22': 51304566, 'X': 155270560, 'Y': 59373566,
+}
+
+"""
+Custom function returning names and lengths of the first given number of chromosomes.
+"""
+def chromosome_lengths(chromosomes):
+    names = list(CHROMOSOME_LENGTHS)[:chromosomes]
+    return np.array(names), np.array([CHROMOSOME_LENGTHS[name] for name in names], dtype=np.int64)
+
+"""
+Custom function writing a synthetic single-sample VCF file. The file is fully determined by the seed.
+Variants are spread over chromosomes proportionally to their length and sorted by position. Total read depth follows
+a negative binomial distribution with the given mean, so there is a realistic spread of low and high coverage sites.
+The FORMAT layout can be chosen from the keys GT, AD, DP, GQ, PL and AF; by default it is the layout of the supplied sample.
+Every hundredth record is multi-allelic, with one more alternative allele depth.
+Records are written in blocks, so files larger than memory can be created.
+"""
+def write_synthetic_vcf(path, variants, chromosomes=22, seed=0, block=100000, depth=30, dispersion=5, format_keys=('GT', 'AD', 'DP', 'GQ', 'PL')):
+    rng = np.random.default_rng(seed)
+    names, lengths = chromosome_lengths(chromosomes)
+    counts = np.floor(variants * lengths / lengths.sum()).astype(np.int64)
+    counts[:variants - counts.sum()] += 1
+    bounds = np.cumsum(counts)
+
+    with open(path, 'w') as f:
+        f.write('##fileformat=VCFv4.2\n')
+        f.write('##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+        f.write('#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE\n')
+        for offset in range(0, variants, block):
+            n = min(block, variants - offset)
+            number = offset + np.arange(n)
+
+            # Evenly spaced slots along every chromosome with a random position inside every slot keep records sorted
+            chrom = np.searchsorted(bounds, number, side='right')
+            index = number - (bounds[chrom] - counts[chrom])
+            spacing = np.maximum(lengths[chrom] // np.maximum(counts[chrom], 1), 1)
+            positions = index * spacing + rng.integers(0, spacing) + 1
+
+            # Negative binomial depth with the given mean; heterozygous sites carry about half alternative reads
+            total = rng.negative_binomial(dispersion, dispersion / (dispersion + depth), size=n) + 1
+            heterozygous = rng.random(n) < 0.8
+            alt = pd.Series(rng.binomial(total, np.where(heterozygous, 0.5, 0.98)))
+            ref = pd.Series(total) - alt
+            gq = pd.Series(rng.integers(0, 100, size=n))
+            multi = pd.Series(number % 100 == 99)
+            values = {
+                'GT': pd.Series(np.where(heterozygous, '0/1', '1/1')),
+                'AD': ref.astype(str) + ',' + alt.astype(str) + np.where(multi, ',0', ''),
+                'DP': (ref + alt).astype(str),
+                'GQ': gq.astype(str),
+                'PL': pd.Series(rng.integers(0, 500, size=n)).astype(str) + ',0,' + pd.Series(rng.integers(0, 500, size=n)).astype(str),
+                'AF': (alt / (ref + alt)).round(3).astype(str),
+            }
+            sample = values[format_keys[0]]
+            for key in format_keys[1:]:
+                sample = sample + ':' + values[key]
+
+            frame = pd.DataFrame({
+                'CHROM': 'chr' + pd.Series(names[chrom]), 'POS': positions, 'ID': '.', 'REF': 'A', 'ALT': np.where(multi, 'C,G', 'C'),
+                'QUAL': '50', 'FILTER': 'PASS',
+                'INFO': 'DP=' + (ref + alt).astype(str) + ';AF=' + values['AF'] + ';MQ=60',
+                'FORMAT': ':'.join(format_keys),
+                'SAMPLE': sample,
+            })
+            frame.to_csv(f, sep='\t', header=False, index=False)
+
+"""
+Reference implementation of the original copy number lookup.
+Scans all segments for every read, regardless of the chromosome.
+"""
+def legacy_find_range(data, pos):
+    for i, row in data.iterrows():
+        if row.iloc[4] <= pos <= row.iloc[5]:
+            return row.iloc[7]
+    return None
+
+"""
+Custom function timing the whole CopyCallsMergeTransformer (preparing the segments, building the index and looking up all variants).
+"""
+def time_copy_calls_merge(cnv_df, X):
+    transformer = main.CopyCallsMergeTransformer(cnv_df.copy(), contigs='all')
+    X = X.copy()
+    start = time.perf_counter()
+    transformer.transform(X)
+    return time.perf_counter() - start
+
+"""
+Benchmark comparing the original row loop of CopyCallsMergeTransformer with the whole transformer using CopyNumberIndex,
+for called segments and for whole-genome 10 kb copy caller bins.
+The row loop is only timed on a subset of variants and extrapolated, as it is quadratic.
+"""
+def benchmark_copy_number_lookup(variants=100000, segments=500, legacy_variants=200, granularity=10000):
+    cnv_df = synthetic_cnv_calls(segments)
+    X = synthetic_variants(variants, cnv_df)
+    data = cnv_df[cnv_df['CNV level'].round() != 0]
+
+    start = time.perf_counter()
+    X['POS'].iloc[:legacy_variants].apply(lambda pos: legacy_find_range(data, pos))
+    legacy = (time.perf_counter() - start) * variants / legacy_variants
+    indexed = time_copy_calls_merge(cnv_df, X)
+    print(f'copy number lookup ({variants} variants, {segments} segments): '
+          f'row loop ~{legacy:.2f} s (extrapolated), transformer {indexed:.4f} s, speedup ~{legacy / indexed:.0f}x')
+
+    bins = synthetic_cnv_bins(granularity)
+    print(f'copy number merge ({variants} variants, {len(bins)} bins of {granularity} bp): '
+          f'transformer {time_copy_calls_merge(bins, synthetic_variants(variants, bins)):.4f} s')
+
+"""
+Reference implementation of the extraction and the parsing the tool-input transformers did before sharing the parsed variant table.
+Every one of the four transformers split allelic depth and cast the counts, two of them also built mutation_id and variant frequency.
+"""
+def legacy_tool_input_parsing(X):
+    X[['GENOTYPE', 'ALLELIC DEPTH', 'DEPTH', 'GENOTYPE QUALITY', 'PHRED-SCALED LIKELIHOODS']] = X.iloc[:, 9].str.split(":", expand=True)
+    X["GENOTYPE QUALITY"] = X["GENOTYPE QUALITY"].astype('int')
+    for transformer in range(4):
+        temp = pd.DataFrame()
+        temp[['var_counts', 'ref_counts', 'none']] = X['ALLELIC DEPTH'].str.split(',', expand=True)
+        temp['var_counts'] = temp['var_counts'].astype(int)
+        temp['ref_counts'] = temp['ref_counts'].astype(int)
+        if transformer in (0, 3):
+            temp['mutation_id'] = X['CHROM'] + ':' + X['POS'].astype(str)
+        if transformer != 2:
+            temp['variant_freq'] = temp['var_counts'] / (temp['ref_counts'] + temp['var_counts'])
+
+"""
+Custom function measuring wall time and, in a second run, peak traced memory of a function applied to a copy of X.
+Tracing slows allocations down, so time is measured without it.
+"""
+def measure(function, X):
+    data = X.copy()
+    start = time.perf_counter()
+    function(data)
+    elapsed = time.perf_counter() - start
+
+    data = X.copy()
+    tracemalloc.start()
+    function(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+"""
+Benchmark comparing repeated parsing in every tool-input transformer with the variant table parsed once by VcfDataExtractionTransformer.
+Both sides include splitting of the sample column.
+"""
+def benchmark_variant_table(variants=1000000):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'variants.vcf')
+        write_synthetic_vcf(path, variants)
+        X = main.load_vcf_file(path)
+
+    legacy_time, legacy_peak = measure(legacy_tool_input_parsing, X)
+    shared_time, shared_peak = measure(main.VcfDataExtractionTransformer().transform, X)
+
+    print(f'tool-input parsing ({variants} variants): per-transformer parsing {legacy_time:.2f} s / {legacy_peak / 2**20:.0f} MB peak, '
+          f'shared variant table {shared_time:.2f} s / {shared_peak / 2**20:.0f} MB peak')
+
+"""
+Custom function loading a VCF file in a fresh process, which reports its own peak RSS (see instrumentation.peak_rss_bytes),
+so measurements do not influence each other.
+Returns number of loaded variants and peak RSS in bytes.
+
+:param mode: 'stream' iterates over chunks without keeping them (iter_vcf_chunks), 'chunked' loads the whole table in chunks
+             (load_vcf_file with chunksize, as cli.py --chunksize does), 'direct' loads the whole table at once
+"""
+def loading_peak_rss(path, mode, chunksize=10000):
+    code = (
+        'import sys, instrumentation, main\n'
+        'path, mode, chunksize = sys.argv[1], sys.argv[2], int(sys.argv[3])\n'
+        'if mode == "stream":\n'
+        '    rows = sum(len(chunk) for chunk in main.iter_vcf_chunks(path, chunksize=chunksize))\n'
+        'else:\n'
+        '    rows = len(main.load_vcf_file(path, chunksize=chunksize if mode == "chunked" else None))\n'
+        'print(rows, instrumentation.peak_rss_bytes())\n'
+    )
+    output = subprocess.run([sys.executable, '-c', code, path, mode, str(chunksize)], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    rows, peak = output.stdout.split()
+    return int(rows), int(peak)
+
+"""
+Benchmark of peak memory of chunked VCF loading.
+With streaming, peak RSS stays flat as the input grows, because only one chunk is held at a time: peak RSS of every size may exceed
+the one of the smallest size by at most the tolerance (a fraction), while the input grows many times. The smallest size must span
+several chunks, otherwise it is measured without the chunk buffers of the larger ones.
+Loading the whole table in chunks keeps the table, but must not take more memory than loading it at once (plus the tolerance).
+Returns False if a bound is exceeded.
+"""
+def benchmark_streaming_memory(sizes=(100000, 400000, 1600000), chunksize=10000, tolerance=0.1):
+    if min(sizes) < 4 * chunksize:
+        raise ValueError(f'The smallest size {min(sizes)} must span at least 4 chunks of {chunksize} variants')
+    peaks = []
+    with tempfile.TemporaryDirectory() as directory:
+        for variants in sorted(sizes):
+            path = os.path.join(directory, f'{variants}.vcf')
+            write_synthetic_vcf(path, variants)
+            rows, peak = loading_peak_rss(path, 'stream', chunksize)
+            peaks.append(peak)
+            print(f'streamed VCF loading ({rows} variants, {os.path.getsize(path) / 2**20:.0f} MB): peak RSS {peak / 2**20:.0f} MB')
+        _, chunked = loading_peak_rss(path, 'chunked', chunksize)
+        _, direct = loading_peak_rss(path, 'direct', chunksize)
+
+    bound = peaks[0] * (1 + tolerance)
+    print(f'peak RSS bound: {bound / 2**20:.0f} MB ({tolerance:.0%} over the smallest input), largest peak {max(peaks) / 2**20:.0f} MB')
+    print(f'whole table of {max(sizes)} variants: peak RSS {chunked / 2**20:.0f} MB in chunks, {direct / 2**20:.0f} MB at once')
+    return max(peaks) <= bound and chunked <= direct * (1 + tolerance)
+
+"""
+Custom function creating synthetic copy caller results tiling the chromosomes with bins of the given granularity,
+as CNVpytor reports them for small bin sizes. Every tenth bin is missing, so gaps have to be filled.
+"""
+def synthetic_cnv_bins(granularity, chromosomes=24, seed=0):
+    rng = np.random.default_rng(seed)
+    names, lengths = chromosome_lengths(chromosomes)
+    bins = lengths // granularity
+    starts = np.concatenate([np.arange(count, dtype=np.int64) * granularity + 1 for count in bins])
+    chroms = np.repeat(names, bins)
+    keep = rng.random(len(starts)) >= 0.1
+    starts, chroms = starts[keep], chroms[keep]
+    return pd.DataFrame({
+        'chr': chroms,
+        'CNV Region Start': starts.astype(float),
+        'CNV Region End': (starts + granularity - 1).astype(float),
+        'CNV level': rng.uniform(0.5, 4.0, size=len(starts)),
+    })
+
+"""
+Custom function writing synthetic copy caller results matching write_synthetic_vcf into a file in the CNVpytor layout (see main.load_cnv_file).
+"""
+def write_synthetic_cnv(path, granularity, chromosomes=22, seed=0):
+    data = synthetic_cnv_bins(granularity, chromosomes, seed)
+    frame = pd.DataFrame({column: 0.0 for column in main.CNV_COLUMNS}, index=data.index)
+    frame['file_name'] = 'file'
+    frame['method'] = 'rd_mean_shift'
+    frame['CNV Type'] = np.where(data['CNV level'] < 2, 'deletion', 'duplication')
+    frame[data.columns] = data
+    frame['CNV size'] = data['CNV Region End'] - data['CNV Region Start'] + 1
+    frame.to_csv(path, sep='\t', header=False, index=False)
+
+"""
+Reference implementation of the original gap filling of CoverageFileTransformer, without the export.
+Shifts segment ends by one row over the whole table and sorts by chromosome name only.
+"""
+def legacy_fill_segment_gaps(data):
+    temp = pd.DataFrame({'chr': data['chr'].values, 'start': data['CNV Region Start'].values, 'stop': data['CNV Region End'].values,
+                         'segment_mean': data['CNV level'].fillna(2.0).apply(np.round).astype('int').values})
+    temp = temp[temp['segment_mean'] != 0]
+    temp['prev_end'] = temp['stop'].shift()
+    new_df = pd.DataFrame({'chr': temp['chr'], 'end': temp['start'], 'start': temp['prev_end']})
+    temp2 = pd.DataFrame({'chr': temp['chr'].values, 'start': temp['start'].values, 'end': temp['stop'].values, 'logR': temp['segment_mean'].values})
+    merge_result = pd.concat([temp2, new_df]).sort_values(by=['chr'])
+    merge_result['logR'] = merge_result['logR'].fillna(2.0).astype('int')
+    return merge_result[merge_result['end'] - merge_result['start'] > 2]
+
+"""
+Benchmark of gap filling of copy number segments at several bin sizes of the copy caller.
+1 kb bins give genome-scale segment counts (millions of segments).
+"""
+def benchmark_segment_gap_filling(granularities=(1000, 10000, 100000)):
+    for granularity in granularities:
+        data = synthetic_cnv_bins(granularity)
+
+        start = time.perf_counter()
+        legacy_fill_segment_gaps(data)
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        main.fill_segment_gaps(data['chr'], data['CNV Region Start'], data['CNV Region End'], data['CNV level'].round().astype('int'))
+        vectorized = time.perf_counter() - start
+
+        print(f'segment gap filling ({granularity} bp bins, {len(data)} segments): '
+              f'row shift and sort {legacy:.2f} s, per-chromosome complement {vectorized:.2f} s')
+
+"""
+Benchmark of memory of the variant table after extraction, with all columns and with the compact schema.
+"""
+def benchmark_compact_schema(variants=1000000):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'variants.vcf')
+        write_synthetic_vcf(path, variants)
+        X = main.VcfDataExtractionTransformer().transform(main.load_vcf_file(path))
+
+    full = main.memory_usage(X).sum()
+    compact = main.memory_usage(main.CompactSchemaTransformer().transform(X)).sum()
+    arrow = main.memory_usage(main.CompactSchemaTransformer(arrow=True).transform(X)).sum()
+    print(f'variant table memory ({variants} variants): all columns {full / 2**20:.0f} MB, '
+          f'compact schema {compact / 2**20:.0f} MB, compact schema with Arrow strings {arrow / 2**20:.0f} MB')
+
+"""
+Custom function measuring extraction, quality filter and copy number merge run serially and sharded by chromosome
+(see main.ShardedPreprocessing) with growing numbers of worker processes. Sharded results must equal the serial result.
+Speed-up is bounded by the number of cores of the machine, which is printed with the results.
+"""
+def benchmark_sharded_preprocessing(variants=1000000, workers=(1, 2, 4, 8), granularity=10000):
+    def steps(cnv_df):
+        return [('vcfDataExtraction', main.VcfDataExtractionTransformer()),
+                ('filterQuality', main.FilterQualityTransformer(percentage=90)),
+                ('copyCallsMerge', main.CopyCallsMergeTransformer(cnv_df.copy()))]
+
+    with tempfile.TemporaryDirectory() as directory:
+        vcf = os.path.join(directory, 'variants.vcf')
+        cnv = os.path.join(directory, 'cnv.tsv')
+        write_synthetic_vcf(vcf, variants)
+        write_synthetic_cnv(cnv, granularity)
+        X = main.load_vcf_file(vcf)
+        cnv_df = main.load_cnv_file(cnv)
+
+    start = time.perf_counter()
+    expected = X.copy()
+    for _, step in steps(cnv_df):
+        expected = step.transform(expected)
+    serial = time.perf_counter() - start
+    print(f'sharded preprocessing ({variants} variants, {os.cpu_count()} cores): serial {serial:.2f} s')
+
+    for count in workers:
+        start = time.perf_counter()
+        result = main.ShardedPreprocessing(steps(cnv_df), workers=count).transform(X.copy())
+        elapsed = time.perf_counter() - start
+        identical = result.equals(expected) and (result.dtypes == expected.dtypes).all()
+        print(f'  {count} workers: {elapsed:.2f} s, speed-up {serial / elapsed:.2f}x, identical to serial: {identical}')
+
+"""
+Modules which main must not import, as they take seconds to import and are only needed to build a sklearn Pipeline or to plot.
+"""
+LAZY_MODULES = ['sklearn', 'seaborn', 'matplotlib', 'scipy']
+
+"""
+Custom function measuring start of a fresh interpreter which imports main, compared with one which also imports the plotting
+and machine learning libraries, as importing main did before they were imported lazily. The best of several runs is reported.
+Returns False if main imported any of LAZY_MODULES.
+"""
+def benchmark_cold_start(runs=5):
+    code = ('import sys, time\n'
+            'start = time.perf_counter()\n'
+            '{imports}\n'
+            'print(time.perf_counter() - start, ",".join(m for m in {lazy!r} if m in sys.modules))\n')
+    eager = 'import sklearn.base, sklearn.pipeline, seaborn, matplotlib.pyplot, main'
+    results = {}
+    for name, imports in (('import main', 'import main'), ('eager imports', eager), ('cli.py --help', None)):
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            if imports is None:
+                subprocess.run([sys.executable, 'cli.py', '--help'], capture_output=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+                times.append(time.perf_counter() - start)
+                continue
+            output = subprocess.run([sys.executable, '-c', code.format(imports=imports, lazy=LAZY_MODULES)], capture_output=True, text=True,
+                                    check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.split()
+            times.append(float(output[0]))
+            results[name] = output[1:]
+        print(f'cold start, {name}: {min(times):.2f} s')
+
+    loaded = results['import main']
+    print('modules imported by main: ' + (loaded[0] if loaded else 'none of ' + ', '.join(LAZY_MODULES)))
+    return not loaded
+
+"""
+Custom function profiling loading and every preparation step of the pipeline on the given files, without running the tools.
+Input files of the tools are prepared one after another instead of in one ParallelExport step, so every exporter is a stage of its own.
+Returns one record per stage with wall time, CPU time, peak RSS of the process and row counts (see instrumentation).
+"""
+def profile_pipeline(vcf, cnv, workdir, compact=False):
+    records = []
+
+    def load(stage, function, path):
+        wall, cpu = time.perf_counter(), time.process_time()
+        data = function(path)
+        records.append({'stage': stage, 'wall_time': time.perf_counter() - wall, 'cpu_time': time.process_time() - cpu,
+                        'peak_rss': instrumentation.peak_rss_bytes(),
+                        'rows_in': None, 'rows_out': len(data)})
+        return data
+
+    X = load('load_vcf_file', main.load_vcf_file, vcf)
+    cnv_df = load('load_cnv_file', main.load_cnv_file, cnv)
+    steps, report = instrumentation.instrument(main.build_steps(cnv_df, workdir=workdir, tools=[], compact=compact, parallel_export=False))
+    main.run_steps(steps, X)
+    return records + [{key: stage[key] for key in ('stage', 'wall_time', 'cpu_time', 'peak_rss', 'rows_in', 'rows_out')} for stage in report.stages]
+
+"""
+Custom function comparing results of the scaling benchmark with a baseline run.
+A stage regressed if its wall time or peak RSS grew by more than the tolerance (a fraction) at the same input size.
+Differences of wall time below min_time seconds are ignored, as they are dominated by noise in very short stages.
+"""
+def compare_with_baseline(records, baseline, tolerance=0.25, min_time=0.05):
+    current = pd.DataFrame(records).set_index(['variants', 'stage'])
+    previous = pd.DataFrame(baseline).set_index(['variants', 'stage'])
+    comparison = pd.DataFrame(index=current.index, data={
+        'baseline_time': previous['wall_time'],
+        'wall_time': current['wall_time'],
+        'baseline_peak_rss': previous['peak_rss'],
+        'peak_rss': current['peak_rss'],
+    }).dropna()
+    comparison['time_ratio'] = comparison['wall_time'] / comparison['baseline_time']
+    comparison['rss_ratio'] = comparison['peak_rss'] / comparison['baseline_peak_rss']
+    slower = (comparison['time_ratio'] > 1 + tolerance) & (comparison['wall_time'] - comparison['baseline_time'] > min_time)
+    comparison['regression'] = slower | (comparison['rss_ratio'] > 1 + tolerance)
+    return comparison.reset_index()
+
+"""
+Benchmark of loading and of every preparation step at growing numbers of variants, with copy number bins of the given granularity.
+Every size runs in a fresh process, so peak RSS is measured without influence of the previous sizes.
+Returns records with wall time, CPU time, throughput (variants per second) and peak RSS for every size and stage,
+which are also written as JSON into output. With a baseline file, results are compared with it (see compare_with_baseline).
+"""
+def benchmark_pipeline_scaling(sizes=(10**4, 10**5, 10**6, 10**7), granularity=10000, seed=0, compact=False, output=None, baseline=None, tolerance=0.25):
+    code = (
+        'import json, sys, benchmark\n'
+        'print(json.dumps(benchmark.profile_pipeline(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4] == "1")))\n'
+    )
+    records = []
+    with tempfile.TemporaryDirectory() as directory:
+        cnv = os.path.join(directory, 'cnv.tsv')
+        write_synthetic_cnv(cnv, granularity, seed=seed)
+        for variants in sizes:
+            vcf = os.path.join(directory, f'{variants}.vcf')
+            write_synthetic_vcf(vcf, variants, seed=seed)
+            result = subprocess.run([sys.executable, '-c', code, vcf, cnv, os.path.join(directory, 'work'), '1' if compact else '0'],
+                                    capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            for record in json.loads(result.stdout.splitlines()[-1]):
+                record['variants'] = variants
+                record['throughput'] = variants / record['wall_time'] if record['wall_time'] > 0 else None
+                records.append(record)
+            os.remove(vcf)
+
+    frame = pd.DataFrame(records)
+    print(f'pipeline scaling ({granularity} bp copy number bins, seed {seed}):')
+    print(frame.pivot(index='stage', columns='variants', values='wall_time').reindex(frame['stage'].unique()).round(3).to_string())
+    print('peak RSS (MB):')
+    print((frame.groupby('variants')['peak_rss'].max() / 2**20).round(0).to_string())
+
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump({'benchmark': 'pipeline_scaling', 'granularity': granularity, 'seed': seed, 'compact': compact,
+                       'python': sys.version.split()[0], 'pandas': pd.__version__, 'records': records}, f, indent=2)
+
+    if baseline is not None:
+        with open(baseline) as f:
+            comparison = compare_with_baseline(records, json.load(f)['records'], tolerance)
+        print(f'comparison with {baseline}:')
+        print(comparison[['variants', 'stage', 'baseline_time', 'wall_time', 'time_ratio', 'rss_ratio', 'regression']].round(3).to_string(index=False))
+        return records, comparison
+    return records, None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the preprocessing transformers.')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    scaling = subparsers.add_parser('scaling', help='profile loading and preparation steps at growing input sizes')
+    scaling.add_argument('--sizes', type=int, nargs='+', default=[10**4, 10**5, 10**6, 10**7], help='numbers of variants')
+    scaling.add_argument('--granularity', type=int, default=10000, help='bin size of synthetic copy number calls (1000, 10000 or 100000)')
+    scaling.add_argument('--seed', type=int, default=0)
+    scaling.add_argument('--compact', action='store_true', help='use the compact schema of the variant table')
+    scaling.add_argument('--output', help='JSON file for the results')
+    scaling.add_argument('--baseline', help='JSON file of an earlier run to compare with')
+    scaling.add_argument('--tolerance', type=float, default=0.25, help='allowed growth of time and memory before a stage counts as regressed')
+    sharding = subparsers.add_parser('sharding', help='compare serial and chromosome-sharded preprocessing')
+    sharding.add_argument('--variants', type=int, default=1000000)
+    sharding.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='numbers of worker processes')
+    streaming = subparsers.add_parser('streaming', help='measure peak memory of chunked VCF loading and fail if it grows with the input')
+    streaming.add_argument('--sizes', type=int, nargs='+', default=[100000, 400000, 1600000], help='numbers of variants')
+    streaming.add_argument('--chunksize', type=int, default=10000, help='chunk size, the smallest size must span at least 4 chunks')
+    streaming.add_argument('--tolerance', type=float, default=0.1, help='allowed growth of peak RSS over the one of the smallest input')
+    subparsers.add_parser('startup', help='measure import time of main and fail if it imports plotting or machine learning libraries')
+    args = parser.parse_args()
+
+    if args.benchmark == 'scaling':
+        _, comparison = benchmark_pipeline_scaling(args.sizes, args.granularity, args.seed, args.compact, args.output, args.baseline, args.tolerance)
+        # Regressions make the run fail, so it can guard changes automatically
+        if comparison is not None and comparison['regression'].any():
+            sys.exit(1)
+    elif args.benchmark == 'streaming':
+        sys.exit(0 if benchmark_streaming_memory(args.sizes, args.chunksize, args.tolerance) else 1)
+    elif args.benchmark == 'startup':
+        sys.exit(0 if benchmark_cold_start() else 1)
+    elif args.benchmark == 'sharding':
+        benchmark_sharded_preprocessing(args.variants, args.workers)
+    else:
+        benchmark_copy_number_lookup()
+        benchmark_streaming_memory()
+        benchmark_variant_table()
+        benchmark_segment_gap_filling()
+        benchmark_compact_schema()
+        benchmark_sharded_preprocessing()
+        benchmark_cold_start()
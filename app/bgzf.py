@@ -0,0 +1,273 @@
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import re
+import struct
+import zlib
+
+"""
+Reading of BGZF-compressed files (bgzip, .vcf.gz) and their tabix (.tbi) or CSI (.csi) indices.
+BGZF files are a series of independent gzip blocks of at most 64 KB, so blocks are decompressed in parallel.
+Positions in such files are virtual offsets: the compressed offset of the block shifted by 16 bits plus the offset inside the block.
+"""
+
+BGZF_MAGIC = b'\x1f\x8b\x08\x04'
+
+"""
+Custom function checking whether the file is BGZF-compressed.
+Plain gzip files start with the same bytes, but do not carry the BC extra field with the block size.
+"""
+def is_bgzf(path):
+    with open(path, 'rb') as f:
+        header = f.read(18)
+    return len(header) == 18 and header[:4] == BGZF_MAGIC and header[12:14] == b'BC'
+
+"""
+Custom generator of raw BGZF blocks.
+Reads the file sequentially from the given compressed offset and yields (compressed offset, block bytes) pairs.
+"""
+def iter_blocks(f, coffset=0):
+    f.seek(coffset)
+    while True:
+        header = f.read(12)
+        if len(header) < 12:
+            return
+        if header[:4] != BGZF_MAGIC:
+            raise ValueError(f'Invalid BGZF block at offset {coffset}')
+        xlen = struct.unpack('<H', header[10:12])[0]
+        extra = f.read(xlen)
+
+        # Searching extra subfields for the BC subfield holding the block size
+        bsize = None
+        i = 0
+        while i + 4 <= len(extra):
+            slen = struct.unpack('<H', extra[i + 2:i + 4])[0]
+            if extra[i:i + 2] == b'BC':
+                bsize = struct.unpack('<H', extra[i + 4:i + 6])[0]
+            i += 4 + slen
+        if bsize is None:
+            raise ValueError(f'BGZF block at offset {coffset} has no block size')
+
+        block = header + extra + f.read(bsize + 1 - 12 - xlen)
+        yield coffset, block
+        coffset += bsize + 1
+
+"""
+Custom function decompressing one raw BGZF block. zlib releases the GIL, so blocks are decompressed in parallel threads.
+"""
+def inflate_block(block):
+    xlen = struct.unpack('<H', block[10:12])[0]
+    return zlib.decompress(block[12 + xlen:-8], -15)
+
+"""
+Custom generator of decompressed data.
+Yields decompressed bytes of the whole file, or only of the given virtual offset ranges [begin, end).
+Blocks are read in batches and every batch is decompressed in parallel by the given number of threads.
+"""
+def decompress(path, chunks=None, threads=None, batch=64):
+    if chunks is None:
+        chunks = [(0, None)]
+    with open(path, 'rb') as f, ThreadPoolExecutor(threads or os.cpu_count()) as executor:
+        for begin, end in chunks:
+            start, skip = begin >> 16, begin & 0xFFFF
+            stop, cut = (None, None) if end is None else (end >> 16, end & 0xFFFF)
+            blocks = iter_blocks(f, start)
+            while True:
+                pending = []
+                for coffset, block in blocks:
+                    if stop is not None and coffset > stop:
+                        break
+                    pending.append((coffset, block))
+                    if len(pending) == batch:
+                        break
+                if not pending:
+                    break
+                for (coffset, _), data in zip(pending, executor.map(inflate_block, [block for _, block in pending])):
+                    # Trimming the first and last block of the range to the virtual offsets
+                    if coffset == stop:
+                        data = data[:cut]
+                    if coffset == start:
+                        data = data[skip:]
+                    yield data
+                if stop is not None and pending[-1][0] >= stop:
+                    break
+                if len(pending) < batch:
+                    break
+
+class ChunkStream(io.RawIOBase):
+    """
+    A read-only file object over a generator of byte strings, so that decompressed data can be parsed by pandas as a stream.
+    """
+
+    def __init__(self, pieces):
+        """
+        Initialize method.
+
+        :param pieces: iterable of byte strings
+        """
+        self.pieces = iter(pieces)
+        self.rest = memoryview(b'')
+
+    def readable(self):
+        return True
+
+    def close(self):
+        # Closing the generator releases the underlying file and threads
+        if hasattr(self.pieces, 'close'):
+            self.pieces.close()
+        super().close()
+
+    def readinto(self, buffer):
+        while not len(self.rest):
+            piece = next(self.pieces, None)
+            if piece is None:
+                return 0
+            self.rest = memoryview(piece)
+        size = min(len(buffer), len(self.rest))
+        buffer[:size] = self.rest[:size]
+        self.rest = self.rest[size:]
+        return size
+
+"""
+Custom function opening a BGZF file as a buffered binary file object with parallel block decompression.
+If chunks are given, only these virtual offset ranges are read.
+Small batches keep reads of a few blocks (e.g. just the header) cheap.
+"""
+def open_bgzf(path, chunks=None, threads=None, batch=64):
+    return io.BufferedReader(ChunkStream(decompress(path, chunks, threads, batch)), buffer_size=1 << 20)
+
+"""
+Custom function parsing a region in the samtools notation: 'chr1', 'chr1:1000' or 'chr1:1000-2000'.
+Returns contig and 1-based inclusive start and end; missing bounds cover the whole contig.
+"""
+def parse_region(region):
+    match = re.fullmatch(r'(.+?)(?::([\d,]+)(?:-([\d,]+))?)?', str(region).strip())
+    contig, start, end = match.groups()
+    start = int(start.replace(',', '')) if start else 1
+    end = int(end.replace(',', '')) if end else 2**31 - 1
+    return contig, start, end
+
+"""
+Custom function computing the 0-based half-open interval [begin, end) covered by an index bin.
+Follows the binning scheme of the SAM/tabix specification, generalized for CSI indices.
+Returns None for pseudo-bins which hold index metadata instead of records.
+"""
+def bin_interval(bin_id, min_shift=14, depth=5):
+    first = 0
+    for level in range(depth + 1):
+        count = 1 << (level * 3)
+        if bin_id < first + count:
+            shift = min_shift + (depth - level) * 3
+            begin = (bin_id - first) << shift
+            return begin, begin + (1 << shift)
+        first += count
+    return None
+
+class TabixIndex:
+    """
+    Index of a BGZF-compressed file in tabix (.tbi) or CSI (.csi) format.
+    """
+
+    def __init__(self, path):
+        """
+        Initialize method. Loads the whole index into memory, which is small even for whole genomes.
+
+        :param path: path to .tbi or .csi file
+        """
+        data = b''.join(decompress(path, threads=1))
+        self.names = []
+        self.references = []
+        self.linear = []
+
+        magic = data[:4]
+        if magic == b'TBI\x01':
+            self.min_shift, self.depth = 14, 5
+            n_ref = struct.unpack_from('<i', data, 4)[0]
+            l_nm = struct.unpack_from('<i', data, 32)[0]
+            self.names = data[36:36 + l_nm].split(b'\x00')[:n_ref]
+            offset = 36 + l_nm
+        elif magic == b'CSI\x01':
+            self.min_shift, self.depth, l_aux = struct.unpack_from('<iii', data, 4)
+            # Auxiliary data of VCF indices holds the tabix header with contig names
+            if l_aux >= 28:
+                l_nm = struct.unpack_from('<i', data, 16 + 24)[0]
+                self.names = data[16 + 28:16 + 28 + l_nm].split(b'\x00')
+            offset = 16 + l_aux
+            n_ref = struct.unpack_from('<i', data, offset)[0]
+            self.names = self.names[:n_ref]
+            offset += 4
+        else:
+            raise ValueError(f'{path} is not a tabix or CSI index')
+        self.names = [name.decode() for name in self.names]
+
+        # Reading bins with their chunks of virtual offsets for every reference sequence
+        for _ in range(n_ref):
+            bins = {}
+            n_bin = struct.unpack_from('<i', data, offset)[0]
+            offset += 4
+            for _ in range(n_bin):
+                if magic == b'TBI\x01':
+                    bin_id, n_chunk = struct.unpack_from('<Ii', data, offset)
+                    offset += 8
+                else:
+                    bin_id, _, n_chunk = struct.unpack_from('<IQi', data, offset)
+                    offset += 16
+                bins[bin_id] = list(struct.iter_unpack('<QQ', data[offset:offset + 16 * n_chunk]))
+                offset += 16 * n_chunk
+            self.references.append(bins)
+
+            # Only tabix indices have the linear index of the smallest offset of every 16 kb window
+            if magic == b'TBI\x01':
+                n_intv = struct.unpack_from('<i', data, offset)[0]
+                offset += 4
+                self.linear.append(struct.unpack_from(f'<{n_intv}Q', data, offset))
+                offset += 8 * n_intv
+
+    """
+    Custom function finding the index file next to a BGZF file. Returns None if the file is not indexed.
+    """
+    @staticmethod
+    def find(path):
+        for suffix in ('.tbi', '.csi'):
+            if os.path.exists(path + suffix):
+                return path + suffix
+        return None
+
+    def chunks(self, contig, start=1, end=2**31 - 1):
+        """
+        Function returning virtual offset ranges which contain all records of contig between 1-based start and end.
+
+        :param contig: contig name as stored in the index
+        :param start: first position of the region
+        :param end: last position of the region
+        """
+        if contig not in self.names:
+            return []
+        reference = self.names.index(contig)
+        bins = self.references[reference]
+
+        # Skipping chunks which end before the first record of the region according to the linear index
+        min_offset = 0
+        if self.linear and self.linear[reference]:
+            window = min((start - 1) >> 14, len(self.linear[reference]) - 1)
+            min_offset = self.linear[reference][window]
+
+        # Only bins present in the index are checked, which is far fewer than all bins a whole contig spans
+        chunks = []
+        for bin_id, bin_chunks in bins.items():
+            interval = bin_interval(bin_id, self.min_shift, self.depth)
+            if interval is not None and interval[0] < end and interval[1] > start - 1:
+                chunks.extend(chunk for chunk in bin_chunks if chunk[1] > min_offset)
+        return merge_chunks(chunks)
+
+"""
+Custom function sorting virtual offset ranges and merging the overlapping ones, so no block is read twice.
+"""
+def merge_chunks(chunks):
+    merged = []
+    for begin, end in sorted(chunks):
+        if merged and begin <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((begin, end))
+    return merged
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+"""
+Content-addressed cache of tool results.
+A tool run is identified by the hash of its commands and the contents of its input files. If a run with the same key
+finished before, its output directory is restored from the cache instead of running the tool again.
+Only files written by the run are cached. The cache records which files of every output directory came from a tool run,
+so restoring results replaces them and leaves other files in the directory (e.g. of other tools) alone.
+"""
+
+"""
+Custom function hashing file contents in blocks, so large input files are never loaded at once.
+"""
+def file_digest(path, block=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(block), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+"""
+Custom function computing total size of all files in a directory.
+"""
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+"""
+Custom function describing all files in a directory by size and modification time, keyed by paths relative to the directory.
+Files written after the snapshot are found by comparing it with a later one.
+"""
+def directory_snapshot(path):
+    snapshot = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            status = os.stat(os.path.join(root, name))
+            snapshot[os.path.relpath(os.path.join(root, name), path)] = (status.st_size, status.st_mtime_ns)
+    return snapshot
+
+class ResultCache:
+    """
+    Cache of tool output directories with a size cap. Least recently used entries are evicted first.
+    """
+
+    def __init__(self, root='./.cache/results', max_bytes=5 * 2**30):
+        """
+        Initialize method.
+
+        :param root: directory where cached results are stored
+        :param max_bytes: maximum total size of cached results
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, task):
+        """
+        Function computing cache key of a task from its name, commands (including all parameters) and contents of its input files.
+
+        :param task: ToolTask
+        """
+        digest = hashlib.sha256(json.dumps([task.name, task.commands]).encode())
+        for path in sorted(task.inputs):
+            digest.update(file_digest(path).encode())
+        return digest.hexdigest()
+
+    def record_path(self, directory):
+        """
+        Function returning path of the record of files the tool wrote into an output directory. Records are kept
+        in the .outputs folder of the cache, which eviction leaves alone.
+        """
+        digest = hashlib.sha256(os.path.abspath(directory).encode()).hexdigest()
+        return os.path.join(self.root, '.outputs', digest + '.json')
+
+    def recorded_files(self, directory):
+        """
+        Function returning paths (relative to the directory) of files the last stored or restored run wrote into an output directory.
+        """
+        try:
+            with open(self.record_path(directory)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def record_files(self, directory, files):
+        """
+        Function recording paths (relative to the directory) of files a run wrote into an output directory.
+        """
+        path = self.record_path(directory)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(descriptor, 'w') as f:
+            json.dump(sorted(files), f)
+        os.replace(temporary, path)
+
+    def restore(self, key, directory):
+        """
+        Function copying cached results into the output directory. Returns True on a cache hit.
+        Files recorded from the last run in the directory are removed first, so results of runs with other parameters are never
+        mixed with the restored ones. Other files in the directory are kept.
+
+        :param key: cache key of the task
+        :param directory: output directory of the task
+        """
+        entry = os.path.join(self.root, key)
+        if not os.path.isdir(entry):
+            return False
+        for path in self.recorded_files(directory):
+            try:
+                os.remove(os.path.join(directory, path))
+            except FileNotFoundError:
+                pass
+        shutil.copytree(entry, directory, dirs_exist_ok=True)
+        self.record_files(directory, directory_snapshot(entry))
+        # Marking the entry as recently used
+        os.utime(entry)
+        return True
+
+    def store(self, key, directory, snapshot=None):
+        """
+        Function storing files a finished task wrote into its output directory and evicting old entries above the size cap.
+
+        :param key: cache key of the task
+        :param directory: output directory of the task
+        :param snapshot: directory_snapshot of the output directory taken before the task started; files it lists unchanged
+                         were left by earlier runs and are not stored. All files are stored without it
+        """
+        entry = os.path.join(self.root, key)
+        if not os.path.isdir(directory):
+            return
+        snapshot = snapshot or {}
+        files = [path for path, status in directory_snapshot(directory).items() if snapshot.get(path) != status]
+        self.record_files(directory, files)
+        if os.path.isdir(entry):
+            return
+        # Copying into a temporary directory first, so an interrupted copy never looks like a valid entry
+        temporary = tempfile.mkdtemp(dir=self.root, prefix='.tmp-')
+        for path in files:
+            os.makedirs(os.path.dirname(os.path.join(temporary, path)), exist_ok=True)
+            shutil.copy2(os.path.join(directory, path), os.path.join(temporary, path))
+        os.replace(temporary, entry)
+        # Marking the new entry as recently used, eviction goes by modification times of entries
+        os.utime(entry)
+        self.evict()
+
+    def evict(self):
+        """
+        Function removing least recently used entries until the cache fits into max_bytes.
+        The most recently used entry is always kept, even if it alone exceeds the cap.
+        """
+        entries = [os.path.join(self.root, name) for name in os.listdir(self.root) if not name.startswith('.')]
+        entries.sort(key=os.path.getmtime)
+        sizes = {entry: directory_size(entry) for entry in entries}
+        total = sum(sizes.values())
+        for entry in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= sizes[entry]
@@ -0,0 +1,223 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import writers
+from cache import ResultCache, file_digest
+from tablecache import is_fresh, source_metadata
+
+"""
+Resumable runs of pipeline steps.
+Every step gets a key hashed from the key of the step before it, its name and its parameters (including data it holds, e.g. the copy
+caller results), and the first key is hashed from the contents of the input files. After a step finishes, a checkpoint stores
+the table it returned (if it changes the table) and a description of the files it wrote. A rerun skips steps whose checkpoints
+are valid, loads the table of the last skipped step and runs the rest. Changing a parameter changes the keys of its step and of
+all steps after it, so only they run again, and input files whose content does not change are not rewritten (see writers.write_table).
+Tools run with a result cache, so a tool runs again only if its parameters or input files changed.
+"""
+
+"""
+Version of the checkpoint layout. Checkpoints written by other versions are ignored.
+"""
+CHECKPOINT_VERSION = '1'
+
+"""
+Attributes set while transformers run, or not changing their results (number of threads, worker processes, cache), left out of keys.
+"""
+RUNTIME_ATTRIBUTES = {'cache', 'index', 'report', 'result', 'sampler', 'threads', 'workers'}
+
+"""
+Custom function hashing a dataframe or series, including its column names and types.
+"""
+def frame_digest(frame):
+    if isinstance(frame, pd.Series):
+        frame = frame.to_frame()
+    digest = hashlib.sha256(json.dumps([[str(column) for column in frame.columns], [str(dtype) for dtype in frame.dtypes]]).encode())
+    try:
+        hashes = pd.util.hash_pandas_object(frame, index=True)
+    except TypeError:
+        # Object columns with values of mixed types are hashed by their text
+        hashes = pd.util.hash_pandas_object(frame.astype(str), index=True)
+    digest.update(hashes.values.tobytes())
+    return digest.hexdigest()
+
+"""
+Custom function describing parameters of a transformer as a structure of plain values, which is hashed into step keys.
+Nested transformers (steps of ParallelExport, tools of ParallelTools) are described recursively, tables by their hashes.
+"""
+def fingerprint(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return ['frame', frame_digest(value)]
+    if isinstance(value, np.ndarray):
+        return ['array', str(value.dtype), list(value.shape), hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()]
+    if isinstance(value, (list, tuple)):
+        return [fingerprint(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): fingerprint(item) for key, item in value.items()}
+    if hasattr(value, '__dict__'):
+        parameters = {name: fingerprint(item) for name, item in vars(value).items() if name not in RUNTIME_ATTRIBUTES}
+        return [type(value).__name__, parameters]
+    return value
+
+"""
+Custom function computing the key of the pipeline input from contents of the input files and options of loading them.
+"""
+def source_key(paths, options=None):
+    digest = hashlib.sha256(json.dumps([CHECKPOINT_VERSION, options], sort_keys=True, default=str).encode())
+    for path in paths:
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()
+
+"""
+Custom function computing keys of all steps. Keys must be computed before the steps run, as some steps change data
+held by others (CopyCallsMergeTransformer rounds the copy numbers shared with the exporters).
+"""
+def step_keys(steps, source):
+    keys = []
+    key = source
+    for name, step in steps:
+        key = hashlib.sha256(json.dumps([key, name, fingerprint(step)], sort_keys=True, default=str).encode()).hexdigest()
+        keys.append(key)
+    return keys
+
+"""
+Custom function returning tools run by a step: the tools of ParallelTools, the step itself if it is a tool, otherwise none.
+"""
+def step_tools(step):
+    if hasattr(step, 'tools'):
+        return step.tools
+    return [step] if hasattr(step, 'task') else []
+
+"""
+Custom function writing a file atomically, write(f) writes the content into the open binary file.
+"""
+def write_atomic(path, write):
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            write(f)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+class Checkpoints:
+    """
+    Folder of step checkpoints. A checkpoint of a step consists of a record (JSON with the files the step wrote),
+    the table the step returned and an empty table with the columns it received.
+    Only the checkpoint of the latest key of every step is kept.
+    """
+
+    def __init__(self, root='./.checkpoints'):
+        """
+        Initialize method.
+
+        :param root: directory where checkpoints are stored
+        """
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name, key, suffix):
+        """
+        Function returning path of a part of the checkpoint of a step.
+        """
+        return os.path.join(self.root, f'{name}.{key}{suffix}')
+
+    def record(self, name, key):
+        """
+        Function returning the record of a valid checkpoint, or None if it is missing or any file the step wrote was changed since.
+        """
+        try:
+            with open(self.path(name, key, '.json')) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get('version') != CHECKPOINT_VERSION:
+            return None
+        if record['table'] and not all(os.path.exists(self.path(name, key, suffix)) for suffix in ('.table.pkl', '.input.pkl')):
+            return None
+        for path, metadata in record['files'].items():
+            if not os.path.isfile(path) or not is_fresh(metadata, path):
+                return None
+        return record
+
+    def load(self, name, key, part):
+        """
+        Function loading the returned table ('table') or the empty input table ('input') of a step.
+        """
+        with open(self.path(name, key, f'.{part}.pkl'), 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, name, key, files, table=None, empty=None):
+        """
+        Function storing the checkpoint of a finished step and removing checkpoints of the step with other keys.
+
+        :param files: paths of files written by the step
+        :param table: table returned by the step, None for steps which do not change the table
+        :param empty: table received by the step without rows, stored with the table
+        """
+        if table is not None:
+            write_atomic(self.path(name, key, '.table.pkl'), lambda f: pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL))
+            write_atomic(self.path(name, key, '.input.pkl'), lambda f: pickle.dump(empty, f, protocol=pickle.HIGHEST_PROTOCOL))
+        record = {'version': CHECKPOINT_VERSION, 'step': name, 'table': table is not None,
+                  'files': {path: source_metadata(path) for path in sorted(set(files)) if os.path.isfile(path)}}
+        # The record is written last, so a step interrupted while saving has no checkpoint
+        write_atomic(self.path(name, key, '.json'), lambda f: f.write(json.dumps(record, indent=1).encode()))
+
+        current = {self.path(name, key, suffix) for suffix in ('.json', '.table.pkl', '.input.pkl')}
+        for path in glob.glob(os.path.join(glob.escape(self.root), glob.escape(name) + '.*')):
+            if path not in current and not path.endswith('.tmp'):
+                os.unlink(path)
+
+"""
+Custom function running steps as run_steps does, resuming from the first step without a valid checkpoint. Returns the resulting table.
+
+:param steps: list of (name, transformer) pairs, e.g. from main.build_steps
+:param load: function loading the pipeline input, called only if the first step runs
+:param source: key of the pipeline input (see source_key)
+:param root: directory of checkpoints, e.g. inside the work directory of the sample
+"""
+def run_checkpointed(steps, load, source, root='./.checkpoints'):
+    checkpoints = Checkpoints(root)
+    keys = step_keys(steps, source)
+
+    # Tools without a result cache get one next to the checkpoints, so only tools with changed parameters or inputs run again
+    results = None
+    for _, step in steps:
+        for holder in [step] + step_tools(step):
+            if hasattr(holder, 'cache') and holder.cache is None:
+                results = results or ResultCache(os.path.join(root, 'results'))
+                holder.cache = results
+
+    first = 0
+    while first < len(steps) and checkpoints.record(steps[first][0], keys[first]) is not None:
+        first += 1
+
+    # Skipped steps run once over no rows, so their effects on shared data are the same as in a full run (see ShardedPreprocessing)
+    latest = None
+    for (name, step), key in zip(steps[:first], keys[:first]):
+        if step.changes_data:
+            step.transform(checkpoints.load(name, key, 'input'))
+            latest = (name, key)
+    X = load() if latest is None else checkpoints.load(*latest, 'table')
+    if first:
+        print(f'resuming after step {steps[first - 1][0]}')
+
+    for (name, step), key in zip(steps[first:], keys[first:]):
+        empty = X.iloc[:0] if step.changes_data else None
+        with writers.recording() as files:
+            X = step.transform(X)
+        tools = step_tools(step)
+        if not all(tool.result is not None and tool.result.ok for tool in tools):
+            # Failed tools leave no checkpoint, so the next run starts from this step
+            continue
+        for task in [tool.task() for tool in tools]:
+            files += [os.path.join(directory, file) for directory, _, names in os.walk(task.output_dir) for file in names]
+        checkpoints.save(name, key, files, X if step.changes_data else None, empty)
+    return X
@@ -0,0 +1,235 @@
+import argparse
+import os
+import sys
+import time
+
+"""
+Command line interface of the pipeline, for runs without JupyterLab:
+
+    python cli.py prepare --vcf DO52567.vcf --cnv copyCaller/results/output.tsv --workdir runs/DO52567
+    python cli.py run-tools --workdir runs/DO52567 --tools PyCloneVI FastClone --cores 4
+    python cli.py run --vcf DO52567.vcf --cnv copyCaller/results/output.tsv --workdir runs/DO52567
+    python cli.py cohort manifest.tsv --root cohort --jobs 4
+    python cli.py summarize --workdir runs/DO52567
+    python cli.py run --vcf DO52567.vcf --cnv copyCaller/results/output.tsv --workdir runs/DO52567 --resume --restarts 20
+
+Commands are run from the app folder, where the R scripts of the tools are. The pipeline modules are imported only once
+the arguments are parsed, and plotting libraries only when PyCloneVI results are plotted, so runs start quickly.
+"""
+
+"""
+Tools which can be run, in the order they are started.
+"""
+TOOLS = ['PyCloneVI', 'TitanCNA', 'SciClone', 'FastClone']
+
+"""
+Custom function adding arguments of input file preparation.
+"""
+def add_prepare_arguments(parser):
+    parser.add_argument('--vcf', required=True, help='VCF file of the sample (plain, gzip or bgzip)')
+    parser.add_argument('--cnv', required=True, help='copy caller results in the CNVpytor format')
+    add_preparation_option_arguments(parser)
+    parser.add_argument('--resume', action='store_true', help='keep checkpoints of all steps in the work directory and run only changed steps')
+
+"""
+Custom function adding options of input file preparation, shared by single samples and cohorts.
+"""
+def add_preparation_option_arguments(parser):
+    parser.add_argument('--samples', type=int, default=300, help='number of loci sampled for the PyClone input')
+    parser.add_argument('--percentage', type=int, default=90, help='minimum genotype quality of kept reads')
+    parser.add_argument('--seed', type=int, help='seed of the PyClone sampling')
+    parser.add_argument('--stratify', nargs='+', choices=['depth', 'vaf', 'copy_number'], help='strata of the PyClone sampling')
+    parser.add_argument('--replicates', type=int, default=1, help='number of PyClone input files sampled independently')
+    # Names of main.CONTIG_SETS, listed here so parsing arguments does not import main
+    parser.add_argument('--contigs', default='default', choices=['default', 'autosomes', 'canonical', 'all'], help='kept chromosomes')
+    parser.add_argument('--regions', nargs='+', help='load only these regions of an indexed VCF file, e.g. chr1 chr2:1000-2000')
+    parser.add_argument('--chunksize', type=int, help='load the VCF file in chunks of this many records')
+    parser.add_argument('--workers', type=int, help='prepare chromosomes in this many processes')
+    parser.add_argument('--compact', action='store_true', help='use the compact schema of the variant table')
+    parser.add_argument('--table-cache', action='store_true', help='keep parsed VCF and CNV tables next to the files for later runs')
+
+"""
+Custom function adding options of the tools, used by make_tools.
+"""
+def add_tool_option_arguments(parser):
+    parser.add_argument('--titan-cores', type=int, default=1, help='number of cores of TitanCNA')
+    parser.add_argument('--clusters', type=int, default=40, help='maximum number of PyClone-VI clusters')
+    parser.add_argument('--density', default='beta-binomial', choices=['beta-binomial', 'binomial'], help='PyClone-VI emission density')
+    parser.add_argument('--restarts', type=int, default=10, help='number of PyClone-VI restarts')
+
+"""
+Custom function adding arguments of tool runs.
+"""
+def add_tool_arguments(parser):
+    parser.add_argument('--tools', nargs='+', choices=TOOLS, default=TOOLS, help='tools to run')
+    parser.add_argument('--cores', type=int, help='number of cores all tools may use at once, all cores by default')
+    add_tool_option_arguments(parser)
+    add_cache_arguments(parser)
+
+"""
+Custom function adding arguments of the tool result cache, see result_cache.
+"""
+def add_cache_arguments(parser):
+    parser.add_argument('--result-cache', help='folder of the tool result cache, tools are always run without it')
+    parser.add_argument('--cache-size', type=float, default=5, help='maximum size of the tool result cache in GB')
+
+"""
+Custom function adding arguments of the summary of tool results.
+"""
+def add_summary_arguments(parser):
+    parser.add_argument('--burnin', type=int, default=0, help='number of first PyClone MCMC iterations left out of the summary')
+    parser.add_argument('--thin', type=int, default=1, help='every thin-th PyClone MCMC iteration is used in the summary')
+
+"""
+Custom function creating tool transformers from the parsed arguments.
+"""
+def make_tools(main, args, cache=None):
+    options = {'workdir': args.workdir, 'compression': args.compression, 'cache': cache}
+    factories = {
+        'PyCloneVI': lambda: main.PyCloneVI(clusters=args.clusters, density=args.density, restarts=args.restarts, **options),
+        'TitanCNA': lambda: main.TitanCNA(cores=args.titan_cores, **options),
+        'SciClone': lambda: main.SciClone(sample_id=args.sample_id, **options),
+        'FastClone': lambda: main.FastClone(**options),
+    }
+    return [factories[name]() for name in TOOLS if name in args.tools]
+
+"""
+Custom function creating the tool result cache, or None if it is not used.
+"""
+def result_cache(args):
+    if not args.result_cache:
+        return None
+    from cache import ResultCache
+    return ResultCache(args.result_cache, max_bytes=int(args.cache_size * 2**30))
+
+"""
+Custom function preparing input files of all tools and running the tools if given. Returns the prepared variant table.
+With --resume, steps with valid checkpoints in the work directory are skipped (see checkpoint.run_checkpointed).
+
+:param tools: ParallelTools run as the last step
+"""
+def prepare(args, tools=None):
+    import main
+
+    started = time.perf_counter()
+    steps = main.build_steps(main.load_cnv_file(args.cnv, cache=args.table_cache), workdir=args.workdir, sample_id=args.sample_id,
+                             samples=args.samples, percentage=args.percentage, tools=[], compact=args.compact,
+                             compression=args.compression, seed=args.seed, stratify=args.stratify, replicates=args.replicates,
+                             workers=args.workers, contigs=args.contigs)
+    if tools is not None:
+        steps.append(('tools', tools))
+    load = lambda: main.load_vcf_file(args.vcf, chunksize=args.chunksize, regions=args.regions, cache=args.table_cache)
+    if args.resume:
+        import checkpoint
+        source = checkpoint.source_key([args.vcf], {'regions': args.regions})
+        X = checkpoint.run_checkpointed(steps, load, source, os.path.join(args.workdir, '.checkpoints'))
+    else:
+        X = main.run_steps(steps, load())
+    print(f'prepared input files of {len(X)} variants in {args.workdir} ({time.perf_counter() - started:.1f} s)')
+    return X
+
+"""
+Custom function summarizing results of all tools in the work directory (see consensus.summarize_results)
+and waiting for the plots. Returns exit status, 1 if any plot failed.
+"""
+def summarize(args):
+    import consensus
+    import plotting
+
+    table, clusters, _ = consensus.summarize_results(args.workdir, burnin=args.burnin, thin=args.thin)
+    if not len(table):
+        print(f'No tool results found in {os.path.join(args.workdir, "results")}')
+        return 1
+    if len(clusters):
+        print(clusters[['tool', 'other', 'mutations', 'adjusted_rand_index']].to_string(index=False))
+    return 1 if plotting.wait() else 0
+
+"""
+Custom function running the selected tools on prepared input files and summarizing their results.
+Returns exit status, 1 if any tool failed.
+"""
+def run_tools(args):
+    import main
+
+    cache = result_cache(args)
+    tools = main.ParallelTools(make_tools(main, args, cache), cores=args.cores, cache=cache)
+    tools.transform(None)
+    summarize(args)
+    return 0 if tools.report['ok'].all() else 1
+
+def command_prepare(args):
+    prepare(args)
+    return 0
+
+def command_run(args):
+    if not args.resume:
+        prepare(args)
+        return run_tools(args)
+    import main
+
+    # Tools run as the last checkpointed step, which is skipped (and has no report) if all tools succeeded with the same inputs before
+    cache = result_cache(args)
+    tools = main.ParallelTools(make_tools(main, args, cache), cores=args.cores, cache=cache)
+    prepare(args, tools)
+    summarize(args)
+    return 0 if tools.report is None or tools.report['ok'].all() else 1
+
+def command_cohort(args):
+    import cohort
+
+    summary = cohort.run_cohort(args.manifest, root=args.root, jobs=args.jobs, cores=args.cores or 1, samples=args.samples,
+                                percentage=args.percentage, tools=args.tools, cache=result_cache(args), chunksize=args.chunksize,
+                                regions=args.regions, compression=args.compression, clusters=args.clusters, density=args.density,
+                                restarts=args.restarts, titan_cores=args.titan_cores, seed=args.seed, stratify=args.stratify,
+                                replicates=args.replicates, contigs=args.contigs, workers=args.workers, compact=args.compact,
+                                table_cache=args.table_cache)
+    print(summary[['sample_id', 'status', 'variants', 'wall_time']].to_string(index=False))
+    return 0 if (summary['status'] == 'ok').all() else 1
+
+"""
+Custom function building the argument parser with one sub-command per stage.
+"""
+def build_parser():
+    parser = argparse.ArgumentParser(description='Preparation of input files and runs of clonal reconstruction tools.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compressed = argparse.ArgumentParser(add_help=False)
+    compressed.add_argument('--compression', choices=['gzip', 'zstd'], help='compress input files of the tools which read compressed files')
+    common = argparse.ArgumentParser(add_help=False, parents=[compressed])
+    common.add_argument('--workdir', default='.', help='work directory with the inputFiles and results folders')
+    common.add_argument('--sample-id', default='R1', help='sample identifier written into the PyClone-VI input and SciClone results')
+
+    prepare_parser = subparsers.add_parser('prepare', parents=[common], help='prepare input files of all tools')
+    add_prepare_arguments(prepare_parser)
+    prepare_parser.set_defaults(handler=command_prepare)
+
+    tools_parser = subparsers.add_parser('run-tools', parents=[common], help='run tools on prepared input files')
+    add_tool_arguments(tools_parser)
+    add_summary_arguments(tools_parser)
+    tools_parser.set_defaults(handler=run_tools)
+
+    run_parser = subparsers.add_parser('run', parents=[common], help='prepare input files and run tools')
+    add_prepare_arguments(run_parser)
+    add_tool_arguments(run_parser)
+    add_summary_arguments(run_parser)
+    run_parser.set_defaults(handler=command_run)
+
+    summary_parser = subparsers.add_parser('summarize', parents=[common], help='join results of all tools and compute their agreement')
+    add_summary_arguments(summary_parser)
+    summary_parser.set_defaults(handler=summarize)
+
+    cohort_parser = subparsers.add_parser('cohort', parents=[compressed], help='prepare and analyse all samples of a manifest')
+    cohort_parser.add_argument('manifest', help='tab-separated manifest with columns sample_id, vcf, cnv and optional patient')
+    cohort_parser.add_argument('--root', default='./cohort', help='folder of work directories of all samples')
+    cohort_parser.add_argument('--jobs', type=int, help='number of samples processed at once, all cores by default')
+    add_preparation_option_arguments(cohort_parser)
+    cohort_parser.add_argument('--tools', nargs='*', choices=TOOLS, default=TOOLS, help='tools run for every sample, none only prepares input files')
+    cohort_parser.add_argument('--cores', type=int, help='number of cores the tools of one sample may use at once')
+    add_tool_option_arguments(cohort_parser)
+    add_cache_arguments(cohort_parser)
+    cohort_parser.set_defaults(handler=command_cohort)
+    return parser
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    sys.exit(args.handler(args))
@@ -0,0 +1,192 @@
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import time
+
+import pandas as pd
+
+import main
+import writers
+from cli import TOOLS, make_tools
+
+"""
+Cohort mode of the pipeline.
+A manifest lists the samples of a cohort. Every sample is prepared and analysed in its own work directory
+(<root>/samples/<sample_id>/ with the usual inputFiles and results folders), and samples run in a pool of processes.
+Samples of the same patient are additionally analysed together by PyClone-VI, which supports several samples in one input file.
+"""
+
+"""
+Columns every manifest must have. Optional column patient groups samples of one patient.
+"""
+MANIFEST_COLUMNS = ['sample_id', 'vcf', 'cnv']
+
+"""
+Custom function reading a tab-separated manifest with columns sample_id, vcf (VCF file), cnv (copy caller results) and optional patient.
+Relative file paths are resolved against the folder of the manifest.
+"""
+def read_manifest(path):
+    manifest = pd.read_csv(path, sep='\t', dtype=str, comment='#')
+    missing = [column for column in MANIFEST_COLUMNS if column not in manifest.columns]
+    if missing:
+        raise ValueError(f'Manifest {path} has no column ' + ', '.join(missing))
+    duplicated = manifest['sample_id'][manifest['sample_id'].duplicated()]
+    if len(duplicated):
+        raise ValueError(f'Manifest {path} lists samples more than once: ' + ', '.join(duplicated.unique()))
+
+    base = os.path.dirname(os.path.abspath(path))
+    for column in ('vcf', 'cnv'):
+        manifest[column] = [os.path.join(base, value) for value in manifest[column]]
+    return manifest
+
+"""
+Custom function creating the tool transformers of one work directory with the tool options of the cohort,
+as the command line creates them for one sample (see cli.make_tools).
+
+:param names: names of the tools, see cli.TOOLS
+"""
+def sample_tools(names, workdir, sample_id, options):
+    args = Namespace(tools=names, workdir=workdir, sample_id=sample_id, compression=options['compression'], **options['tool_options'])
+    return main.ParallelTools(make_tools(main, args, options['cache']), cores=options['cores'], cache=options['cache'])
+
+"""
+Custom function summarizing tool results into columns of the cohort summary.
+"""
+def tool_summary(report):
+    summary = {'failed_tools': ', '.join(report.loc[~report['ok'], 'tool'])}
+    for row in report.itertuples():
+        summary[f'{row.tool} time'] = row.wall_time
+    return summary
+
+"""
+Custom function preparing input files of one sample and running its tools. Runs in a worker process.
+Errors are reported in the returned summary row instead of being raised, so one broken sample does not stop the cohort.
+"""
+def run_sample(sample_id, vcf, cnv, workdir, options):
+    started = time.perf_counter()
+    row = {'sample_id': sample_id, 'workdir': workdir, 'status': 'ok', 'variants': None, 'prepare_time': None, 'tools_time': None, 'error': None}
+    try:
+        X = main.load_vcf_file(vcf, chunksize=options['chunksize'], regions=options['regions'], cache=options['table_cache'])
+        steps = main.build_steps(main.load_cnv_file(cnv, cache=options['table_cache']), workdir=workdir, sample_id=sample_id,
+                                 samples=options['samples'], percentage=options['percentage'], tools=[],
+                                 compression=options['compression'], **options['step_options'])
+        X = main.run_steps(steps, X)
+        row['variants'] = len(X)
+        row['prepare_time'] = time.perf_counter() - started
+
+        if options['tools']:
+            tools = sample_tools(options['tools'], workdir, sample_id, options)
+            tools.transform(X)
+            row['tools_time'] = time.perf_counter() - started - row['prepare_time']
+            row.update(tool_summary(tools.report))
+            if not tools.report['ok'].all():
+                row['status'] = 'tools failed'
+    except Exception as error:
+        row['status'] = 'error'
+        row['error'] = f'{type(error).__name__}: {error}'
+    row['wall_time'] = time.perf_counter() - started
+    return row
+
+"""
+Custom function writing the multi-sample PyClone-VI input of a patient and running PyClone-VI on it. Runs in a worker process.
+PyClone-VI requires every mutation in every sample, so only mutations found in all samples of the patient are kept.
+"""
+def run_patient(patient, sample_workdirs, workdir, options):
+    started = time.perf_counter()
+    row = {'sample_id': f'patient {patient}', 'workdir': workdir, 'status': 'ok', 'variants': None, 'prepare_time': None, 'tools_time': None, 'error': None}
+    try:
+        data = pd.concat([pd.read_csv(main.tool_input_path(sample_workdir, 'PyCloneVI', options['compression']), sep='\t')
+                          for sample_workdir in sample_workdirs])
+        data = data.drop_duplicates(['mutation_id', 'sample_id'])
+        counts = data.groupby('mutation_id')['sample_id'].nunique()
+        data = data[data['mutation_id'].isin(counts.index[counts == len(sample_workdirs)])]
+        writers.write_table(data, main.tool_input_path(workdir, 'PyCloneVI', options['compression']))
+        row['variants'] = data['mutation_id'].nunique()
+        row['prepare_time'] = time.perf_counter() - started
+
+        tools = sample_tools(['PyCloneVI'], workdir, f'patient {patient}', options)
+        tools.transform(data)
+        row['tools_time'] = time.perf_counter() - started - row['prepare_time']
+        row.update(tool_summary(tools.report))
+        if not tools.report['ok'].all():
+            row['status'] = 'tools failed'
+    except Exception as error:
+        row['status'] = 'error'
+        row['error'] = f'{type(error).__name__}: {error}'
+    row['wall_time'] = time.perf_counter() - started
+    return row
+
+"""
+Custom function running the whole pipeline for every sample of a manifest.
+At most jobs samples are processed at once, and the tools of every sample share cores cores, so the cohort uses at most jobs * cores cores.
+Once all samples of a patient finished, their multi-sample PyClone-VI run is started in the same pool.
+Returns the summary table with status and timings of every sample, which is also written into <root>/cohort_summary.tsv.
+
+:param manifest: path to the manifest or a dataframe in the manifest format
+:param root: folder holding work directories of all samples
+:param jobs: number of samples processed at once, all cores by default
+:param cores: number of cores the tools of one sample may use at once
+:param samples: number of reads sampled for the PyClone input of every sample
+:param percentage: percentage passed to FilterQualityTransformer
+:param tools: names of tools run for every sample, an empty list only prepares input files
+:param cache: ResultCache of tool results shared by all samples
+:param chunksize: chunk size for loading VCF files, None loads them at once
+:param regions: regions of VCF files to load (see load_vcf_file)
+:param compression: compression of tool input files, 'gzip' or 'zstd' (see main.tool_input_path)
+:param clusters: maximum number of PyClone-VI clusters
+:param density: PyClone-VI emission density, 'beta-binomial' or 'binomial'
+:param restarts: number of PyClone-VI restarts
+:param titan_cores: number of cores of TitanCNA
+:param seed: seed of the sampling of the PyClone input of every sample, which is unseeded without it
+:param stratify: strata of the sampling of the PyClone input ('depth', 'vaf', 'copy_number')
+:param replicates: number of independent PyClone input files of every sample
+:param contigs: contigs kept, name of a set in main.CONTIG_SETS or a list of contig names
+:param workers: prepare chromosomes of every sample in this many processes (see main.ShardedPreprocessing)
+:param compact: use the compact schema of the variant table (see main.CompactSchemaTransformer)
+:param table_cache: keep parsed VCF and CNV tables next to the files for later runs (see tablecache)
+"""
+def run_cohort(manifest, root='./cohort', jobs=None, cores=1, samples=300, percentage=90, tools=TOOLS, cache=None, chunksize=None, regions=None,
+               compression=None, clusters=40, density='beta-binomial', restarts=10, titan_cores=1, seed=None, stratify=None, replicates=1,
+               contigs='default', workers=None, compact=False, table_cache=False):
+    if not isinstance(manifest, pd.DataFrame):
+        manifest = read_manifest(manifest)
+    options = {'cores': cores, 'samples': samples, 'percentage': percentage, 'tools': list(tools), 'cache': cache,
+               'chunksize': chunksize, 'regions': regions, 'compression': compression, 'table_cache': table_cache,
+               'step_options': {'seed': seed, 'stratify': stratify, 'replicates': replicates, 'contigs': contigs, 'workers': workers,
+                                'compact': compact},
+               'tool_options': {'clusters': clusters, 'density': density, 'restarts': restarts, 'titan_cores': titan_cores}}
+
+    patients = {}
+    if 'patient' in manifest.columns and 'PyCloneVI' in options['tools']:
+        for patient, group in manifest.dropna(subset=['patient']).groupby('patient'):
+            if len(group) > 1:
+                patients[patient] = set(group['sample_id'])
+
+    rows = []
+    finished = {}
+    with ProcessPoolExecutor(jobs or os.cpu_count()) as executor:
+        futures = [executor.submit(run_sample, sample.sample_id, sample.vcf, sample.cnv,
+                                   os.path.join(root, 'samples', sample.sample_id), options)
+                   for sample in manifest.itertuples()]
+        while futures:
+            future = next(as_completed(futures))
+            futures.remove(future)
+            row = future.result()
+            rows.append(row)
+            finished[row['sample_id']] = row
+
+            # Starting multi-sample runs of patients whose samples are all prepared
+            for patient, sample_ids in list(patients.items()):
+                if sample_ids <= finished.keys():
+                    del patients[patient]
+                    prepared = [finished[sample_id]['workdir'] for sample_id in sorted(sample_ids) if finished[sample_id]['variants'] is not None]
+                    if len(prepared) > 1:
+                        futures.append(executor.submit(run_patient, patient, prepared, os.path.join(root, 'patients', patient), options))
+
+    summary = pd.DataFrame(rows).astype({'variants': 'Int64'})
+    order = {sample_id: i for i, sample_id in enumerate(manifest['sample_id'])}
+    summary = summary.sort_values('sample_id', key=lambda ids: ids.map(lambda sample_id: order.get(sample_id, len(order))), kind='stable')
+    summary = summary.reset_index(drop=True)
+    os.makedirs(root, exist_ok=True)
+    summary.to_csv(os.path.join(root, 'cohort_summary.tsv'), sep='\t', index=False)
+    return summary
@@ -0,0 +1,289 @@
+import glob
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+import plotting
+import writers
+from main import CopyNumberIndex, chromosome_order, work_path
+
+"""
+Ingestion of tool results into one per-mutation table and agreement of the tools.
+Every reader returns a table indexed by mutation_id ('chr1:790733', as in the tool input files) with columns named
+<tool>_<value>, e.g. PyCloneVI_cluster and PyCloneVI_prevalence. Tables of all tools found in the results folder are joined,
+and agreement of cluster assignments and cellular prevalences of every pair of tools is computed over all shared mutations at once.
+"""
+
+"""
+Result file of every tool whose results are read into the per-mutation table. Tools without it (not run or failed) are left out.
+"""
+RESULT_FILES = {
+    'PyCloneVI': 'PyCloneVI.tsv',
+    'PyClone': os.path.join('trace', 'labels.tsv.bz2'),
+    'FastClone': 'scores.csv',
+    'SciClone': 'ResultSciClone',
+}
+
+"""
+Custom function reading PyClone-VI results. With several samples, values of the first sample are kept,
+clusters are the same in all samples.
+"""
+def read_pyclone_vi(path, sample_id=None):
+    data = pd.read_csv(path, sep='\t', dtype={'mutation_id': str, 'sample_id': str})
+    if len(data):
+        data = data[data['sample_id'] == (data['sample_id'].iloc[0] if sample_id is None else sample_id)]
+    data = data.set_index('mutation_id')
+    return pd.DataFrame({'PyCloneVI_cluster': data['cluster_id'].astype('Int64'),
+                         'PyCloneVI_prevalence': data['cellular_prevalence'],
+                         'PyCloneVI_prevalence_std': data['cellular_prevalence_std'],
+                         'PyCloneVI_cluster_prob': data['cluster_assignment_prob']})
+
+"""
+Custom function summarizing a PyClone MCMC trace of cellular prevalences (one column per mutation, one row per iteration).
+The compressed trace is decompressed and parsed chunksize iterations at a time, so memory does not grow with the number of iterations.
+Returns mean and standard deviation of every mutation over iterations kept after burnin and thinning.
+"""
+def summarize_trace(path, burnin=0, thin=1, chunksize=500):
+    total = squares = None
+    count = 0
+    start = 0
+    for chunk in pd.read_csv(path, sep='\t', chunksize=chunksize, dtype=np.float64):
+        values = chunk.values[kept_iterations(start, len(chunk), burnin, thin)]
+        start += len(chunk)
+        if total is None:
+            columns = chunk.columns
+            total = np.zeros(len(columns))
+            squares = np.zeros(len(columns))
+        total += values.sum(axis=0)
+        squares += (values ** 2).sum(axis=0)
+        count += len(values)
+    if total is None or not count:
+        raise ValueError(f'No iterations left in {path} after burnin {burnin}')
+    mean = total / count
+    std = np.sqrt(np.maximum(squares / count - mean ** 2, 0))
+    return pd.DataFrame({'mean': mean, 'std': std}, index=pd.Index(columns, name='mutation_id'))
+
+"""
+Custom function summarizing a PyClone MCMC trace of cluster labels chunk by chunk, as summarize_trace does.
+Returns the most frequent label of every mutation and the fraction of kept iterations with that label.
+"""
+def summarize_labels(path, burnin=0, thin=1, chunksize=500):
+    counts = None
+    start = 0
+    for chunk in pd.read_csv(path, sep='\t', chunksize=chunksize, dtype=np.int64):
+        values = chunk.values[kept_iterations(start, len(chunk), burnin, thin)]
+        start += len(chunk)
+        if counts is None:
+            columns = chunk.columns
+            counts = np.zeros((len(columns), 1), dtype=np.int64)
+        if not len(values):
+            continue
+        # Labels of all mutations are counted at once, with the mutation number in the high part of the code
+        labels = max(counts.shape[1], values.max() + 1)
+        counts = np.pad(counts, ((0, 0), (0, labels - counts.shape[1])))
+        codes = (np.arange(len(columns)) * labels + values).ravel()
+        counts += np.bincount(codes, minlength=counts.size).reshape(counts.shape)
+    if counts is None or not counts.sum():
+        raise ValueError(f'No iterations left in {path} after burnin {burnin}')
+    mode = counts.argmax(axis=1)
+    probability = counts[np.arange(len(mode)), mode] / counts.sum(axis=1)
+    return pd.DataFrame({'label': mode, 'probability': probability}, index=pd.Index(columns, name='mutation_id'))
+
+"""
+Custom function returning mask of iterations kept after burnin and thinning among count iterations starting with iteration start.
+"""
+def kept_iterations(start, count, burnin, thin):
+    iterations = np.arange(start, start + count)
+    return (iterations >= burnin) & ((iterations - burnin) % thin == 0)
+
+"""
+Custom function reading PyClone results from the MCMC traces in the trace folder. Cellular prevalence is the mean of the trace
+of the first sample. Clusters are the ones PyClone built from the traces (tables/loci.tsv), or the most frequent labels
+if the tables were not built.
+"""
+def read_pyclone(directory, burnin=0, thin=1):
+    prevalence = summarize_trace(sorted(glob.glob(os.path.join(glob.escape(directory), 'trace', '*.cellular_prevalence.tsv.bz2')))[0], burnin, thin)
+    labels = summarize_labels(os.path.join(directory, 'trace', 'labels.tsv.bz2'), burnin, thin)
+    loci = os.path.join(directory, 'tables', 'loci.tsv')
+    if os.path.exists(loci):
+        clusters = pd.read_csv(loci, sep='\t', usecols=['mutation_id', 'cluster_id']).drop_duplicates('mutation_id').set_index('mutation_id')['cluster_id']
+        labels['label'] = clusters.reindex(labels.index)
+        labels['probability'] = np.nan
+    return pd.DataFrame({'PyClone_cluster': labels['label'].astype('Int64'),
+                         'PyClone_prevalence': prevalence['mean'],
+                         'PyClone_prevalence_std': prevalence['std'],
+                         'PyClone_cluster_prob': labels['probability']})
+
+"""
+Custom function reading FastClone results. Every mutation belongs to the subclone with its highest score,
+cellular prevalence is the proportion of that subclone.
+"""
+def read_fastclone(directory):
+    scores = pd.read_csv(os.path.join(directory, 'scores.csv'), index_col=0)
+    proportions = pd.read_csv(os.path.join(directory, 'subclones.csv'), index_col=0)['prop']
+    best = scores.values.argmax(axis=1)
+    clusters = scores.columns.astype(int).values[best]
+    return pd.DataFrame({'FastClone_cluster': pd.array(clusters, dtype='Int64'),
+                         'FastClone_prevalence': proportions.reindex(clusters).values,
+                         'FastClone_cluster_prob': scores.values[np.arange(len(best)), best]},
+                        index=pd.Index(scores.index.astype(str), name='mutation_id'))
+
+"""
+Custom function reading SciClone results. SciClone reports variant allele frequencies in percent and clusters of mutations
+with adequate depth only; other mutations have no cluster.
+"""
+def read_sciclone(path):
+    data = pd.read_csv(path, sep='\t', dtype={'chr': str})
+    probabilities = data.filter(like='cluster.prob.')
+    return pd.DataFrame({'SciClone_cluster': data['cluster'].astype('Int64').values,
+                         'SciClone_vaf': data.filter(regex=r'\.vaf$').iloc[:, 0].values / 100,
+                         'SciClone_cluster_prob': probabilities.max(axis=1).values if probabilities.shape[1] else np.nan},
+                        index=pd.Index(data['chr'] + ':' + data['st'].astype(str), name='mutation_id'))
+
+"""
+Custom function assigning TitanCNA segments to mutations. TitanCNA clusters copy number segments, so every mutation
+gets clonal cluster, cellular prevalence and copy number of the segment it lies in (missing outside all segments).
+The per-position table (.titan.txt) holds heterozygous germline positions, which are not the mutations, so segments are used.
+"""
+def read_titancna(path, chroms, positions):
+    segments = pd.read_csv(path, sep='\t', dtype={'Chromosome': str})
+    index = CopyNumberIndex(segments['Chromosome'], segments['Start_Position.bp.'], segments['End_Position.bp.'], np.arange(len(segments)))
+    found = index.lookup(chroms, positions)
+    # Mutations outside all segments get row -1, which is missing, so all their values are missing
+    segments = segments.reindex(np.where(np.isnan(found), -1, found).astype(np.int64))
+    return pd.DataFrame({'TitanCNA_cluster': segments['Clonal_Cluster'].astype('Int64').values,
+                         'TitanCNA_prevalence': segments['Cellular_Prevalence'].values,
+                         'TitanCNA_copy_number': segments['Copy_Number'].values,
+                         'TitanCNA_call': segments['TITAN_call'].values})
+
+"""
+Custom function loading results of all tools found in the results folder of a sample into one table indexed by mutation_id,
+with CHROM and POS of every mutation, in genome order. Mutations missing in results of a tool have missing values of its columns.
+
+:param workdir: work directory of the sample
+:param burnin: number of first PyClone MCMC iterations left out
+:param thin: every thin-th PyClone MCMC iteration is used
+"""
+def load_results(workdir='.', burnin=0, thin=1):
+    results = os.path.join(workdir, 'results')
+    readers = {
+        'PyCloneVI': lambda directory: read_pyclone_vi(os.path.join(directory, 'PyCloneVI.tsv')),
+        'PyClone': lambda directory: read_pyclone(directory, burnin, thin),
+        'FastClone': read_fastclone,
+        'SciClone': lambda directory: read_sciclone(os.path.join(directory, 'ResultSciClone')),
+    }
+    tables = [reader(os.path.join(results, tool)) for tool, reader in readers.items()
+              if os.path.exists(os.path.join(results, tool, RESULT_FILES[tool]))]
+    table = pd.concat(tables, axis=1, join='outer') if tables else pd.DataFrame(index=pd.Index([], dtype=object))
+    table.index.name = 'mutation_id'
+
+    ids = table.index.to_series().astype(str)
+    table.insert(0, 'CHROM', ids.str.rsplit(':', n=1).str[0].values)
+    table.insert(1, 'POS', ids.str.rsplit(':', n=1).str[1].astype(np.int64).values)
+    table = table.iloc[np.lexsort([table['POS'].values, chromosome_order(table['CHROM'])])]
+
+    segments = sorted(glob.glob(os.path.join(glob.escape(results), 'TitanCNA', '*.segs.txt')))
+    if segments:
+        titan = read_titancna(segments[0], table['CHROM'].values, table['POS'].values)
+        table = pd.concat([table, titan.set_index(table.index)], axis=1)
+    return table
+
+"""
+Custom function returning tools with the given column in the results table.
+"""
+def table_tools(table, suffix):
+    return [column[:-len(suffix)] for column in table.columns if column.endswith(suffix)]
+
+"""
+Custom function returning sum of n choose 2 over an array of counts, as an exact integer.
+"""
+def pairs(counts):
+    counts = np.asarray(counts, dtype=np.int64)
+    return int((counts * (counts - 1) // 2).sum())
+
+"""
+Custom function computing agreement of cluster assignments of every pair of tools over mutations clustered by both.
+The Rand index is the fraction of pairs of mutations both tools put together or apart, the adjusted Rand index is corrected
+for chance (1 for the same clusters, around 0 for unrelated ones). Both come from the contingency table of cluster labels,
+counted for all mutations at once.
+"""
+def cluster_concordance(table):
+    rows = []
+    for tool, other in itertools.combinations(table_tools(table, '_cluster'), 2):
+        both = table[[tool + '_cluster', other + '_cluster']].dropna()
+        first, first_labels = pd.factorize(both.iloc[:, 0])
+        second, labels = pd.factorize(both.iloc[:, 1])
+        # Every pair of labels gets one code, so the contingency table is a single bincount
+        together = pairs(np.bincount(first * len(labels) + second))
+        rows_pairs = pairs(np.bincount(first))
+        columns_pairs = pairs(np.bincount(second))
+        total = pairs([len(both)])
+        # Integer pair counts are multiplied by total instead of dividing, so equal indices are exactly equal
+        numerator = 2 * (together * total - rows_pairs * columns_pairs)
+        denominator = (rows_pairs + columns_pairs) * total - 2 * rows_pairs * columns_pairs
+        rows.append({'tool': tool, 'other': other, 'mutations': len(both),
+                     'clusters': len(first_labels), 'other_clusters': len(labels),
+                     'rand_index': (total + 2 * together - rows_pairs - columns_pairs) / total if total else np.nan,
+                     'adjusted_rand_index': numerator / denominator if denominator else (1.0 if total else np.nan)})
+    return pd.DataFrame(rows, columns=['tool', 'other', 'mutations', 'clusters', 'other_clusters', 'rand_index', 'adjusted_rand_index'])
+
+"""
+Custom function computing agreement of cellular prevalences of every pair of tools over mutations with prevalences from both.
+"""
+def prevalence_agreement(table):
+    rows = []
+    for tool, other in itertools.combinations(table_tools(table, '_prevalence'), 2):
+        both = table[[tool + '_prevalence', other + '_prevalence']].dropna().values
+        difference = np.abs(both[:, 0] - both[:, 1])
+        constant = len(both) < 2 or not np.ptp(both[:, 0]) or not np.ptp(both[:, 1])
+        rows.append({'tool': tool, 'other': other, 'mutations': len(both),
+                     'mean_abs_difference': difference.mean() if len(both) else np.nan,
+                     'max_abs_difference': difference.max() if len(both) else np.nan,
+                     'correlation': np.nan if constant else np.corrcoef(both[:, 0], both[:, 1])[0, 1]})
+    return pd.DataFrame(rows, columns=['tool', 'other', 'mutations', 'mean_abs_difference', 'max_abs_difference', 'correlation'])
+
+"""
+Custom function adding consensus columns to the results table: number of tools with a cellular prevalence of the mutation,
+their median (prevalence_consensus) and the difference of the largest and smallest of them (prevalence_spread).
+Both are missing for mutations without a prevalence, e.g. for all mutations if only SciClone results were found.
+"""
+def add_consensus(table):
+    prevalences = table[[tool + '_prevalence' for tool in table_tools(table, '_prevalence')]].to_numpy(dtype=np.float64, na_value=np.nan)
+    table['prevalence_tools'] = (~np.isnan(prevalences)).sum(axis=1)
+    table['prevalence_consensus'] = np.nan
+    table['prevalence_spread'] = np.nan
+    # Mutations without any prevalence are left out, nan functions warn about them and fail on no tools or no rows
+    rows = table['prevalence_tools'].values > 0
+    if prevalences.shape[1] == 0 or not rows.any():
+        return table
+    table.loc[rows, 'prevalence_consensus'] = np.nanmedian(prevalences[rows], axis=1)
+    table.loc[rows, 'prevalence_spread'] = np.nanmax(prevalences[rows], axis=1) - np.nanmin(prevalences[rows], axis=1)
+    return table
+
+"""
+Custom function loading results of all tools of a sample, computing their agreement and writing the tables into
+the results/summary folder (mutations.tsv, cluster_concordance.tsv, prevalence_agreement.tsv).
+The summary plot is drawn in the background (see plotting), call plotting.wait() to wait for it.
+Returns the results table, cluster concordance and prevalence agreement. Without any tool results the tables are written empty
+and no plot is drawn.
+
+:param workdir: work directory of the sample
+:param burnin: number of first PyClone MCMC iterations left out
+:param thin: every thin-th PyClone MCMC iteration is used
+:param plot: draw the summary plot
+"""
+def summarize_results(workdir='.', burnin=0, thin=1, plot=True):
+    table = add_consensus(load_results(workdir, burnin, thin))
+    clusters = cluster_concordance(table)
+    prevalences = prevalence_agreement(table)
+
+    mutations_file = work_path(workdir, 'results', 'summary', 'mutations.tsv')
+    concordance_file = work_path(workdir, 'results', 'summary', 'cluster_concordance.tsv')
+    writers.write_table(table.reset_index(), mutations_file)
+    writers.write_table(clusters, concordance_file)
+    writers.write_table(prevalences, work_path(workdir, 'results', 'summary', 'prevalence_agreement.tsv'))
+    if plot and len(table):
+        plotting.submit(plotting.plot_summary, mutations_file, concordance_file, work_path(workdir, 'results', 'summary', 'summary.png'))
+    return table, clusters, prevalences
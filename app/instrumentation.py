@@ -0,0 +1,203 @@
+from datetime import datetime, timezone
+import json
+import resource
+import sys
+import time
+
+import pandas as pd
+
+from main import TransformerMixin
+
+"""
+Opt-in instrumentation of the transformer pipeline.
+instrument(pipeline) wraps every step, so that running the pipeline records wall time, CPU time, growth of peak RSS,
+row counts and bytes written of every step, together with resource usage of the external tools the step ran.
+"""
+
+"""
+Column order of the summary table.
+"""
+SUMMARY_COLUMNS = ['stage', 'wall_time', 'cpu_time', 'peak_rss_delta', 'rows_in', 'rows_out', 'bytes_written',
+                   'children_cpu_time', 'children_peak_rss', 'failed_tools']
+
+"""
+Custom function converting ru_maxrss into bytes. Linux reports kilobytes, macOS bytes.
+"""
+def maxrss_bytes(usage):
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+"""
+Custom function returning peak RSS of this process in bytes. Where /proc is available it is read from VmHWM, which starts anew
+in every started program, while Linux keeps ru_maxrss of the parent process in processes it starts.
+"""
+def peak_rss_bytes():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return maxrss_bytes(resource.getrusage(resource.RUSAGE_SELF))
+
+"""
+Custom function returning number of bytes the process passed to write calls so far, or None where /proc is not available.
+"""
+def bytes_written():
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+"""
+Custom function returning the number of rows of the data passing through a step, or None for data without rows.
+"""
+def row_count(X):
+    return len(X) if hasattr(X, '__len__') else None
+
+class RunReport:
+    """
+    Measurements of all instrumented steps of one or more pipeline runs.
+    """
+
+    def __init__(self):
+        """
+        Initialize method.
+        """
+        self.started = datetime.now(timezone.utc).isoformat()
+        self.stages = []
+
+    def frame(self):
+        """
+        Function returning measurements of all steps as a dataframe. Times are in seconds, memory and written data in bytes.
+        """
+        frame = pd.DataFrame(self.stages)
+        return frame.reindex(columns=SUMMARY_COLUMNS + [column for column in frame.columns if column not in SUMMARY_COLUMNS])
+
+    def summary(self):
+        """
+        Function returning the summary table as text, with memory and written data in MB.
+        """
+        frame = self.frame()[SUMMARY_COLUMNS].copy()
+        for column in ('peak_rss_delta', 'bytes_written', 'children_peak_rss'):
+            frame[column] = frame[column] / 2**20
+        frame = frame.rename(columns={'peak_rss_delta': 'peak_rss_delta_mb', 'bytes_written': 'written_mb', 'children_peak_rss': 'children_peak_rss_mb'})
+        return frame.to_string(index=False, float_format=lambda value: f'{value:.2f}', na_rep='-')
+
+    def as_dict(self):
+        return {'started': self.started, 'stages': self.stages,
+                'total': {'wall_time': sum(stage['wall_time'] for stage in self.stages),
+                          'cpu_time': sum(stage['cpu_time'] for stage in self.stages)}}
+
+    def to_json(self, path=None):
+        """
+        Function returning the report as JSON, and writing it into a file if path is given.
+
+        :param path: path to the JSON file
+        """
+        text = json.dumps(self.as_dict(), indent=2, default=str)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+class InstrumentedTransformer(TransformerMixin):
+    """
+    A transformer which runs another transformer and records its resource usage into a RunReport.
+    """
+
+    def __init__(self, name, transformer, report, *args, **kwargs):
+        """
+        Initialize method.
+
+        :param name: name of the step, used in the report
+        :param transformer: transformer to run
+        :param report: RunReport receiving the measurements
+        """
+        self.name = name
+        self.transformer = transformer
+        self.report = report
+
+    @property
+    def changes_data(self):
+        """
+        Whether the wrapped transformer changes the table, see checkpoint.py.
+        """
+        return self.transformer.changes_data
+
+    @property
+    def tools(self):
+        """
+        Tools run by the wrapped transformer, so failed tools of instrumented steps are found as those of plain steps (see checkpoint.step_tools).
+        """
+        if hasattr(self.transformer, 'tools'):
+            return self.transformer.tools
+        return [self.transformer] if hasattr(self.transformer, 'task') else []
+
+    def fit(self, X, y=None):
+        """
+        Fits the wrapped transformer over data.
+        """
+        self.transformer.fit(X, y)
+        return self
+
+    def transform(self, X, **transform_params):
+        rows_in = row_count(X)
+        peak_before = peak_rss_bytes()
+        children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        written_before = bytes_written()
+        wall_before = time.perf_counter()
+        cpu_before = time.process_time()
+
+        X = self.transformer.transform(X, **transform_params)
+
+        cpu_time = time.process_time() - cpu_before
+        wall_time = time.perf_counter() - wall_before
+        written_after = bytes_written()
+        peak_after = peak_rss_bytes()
+        children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        # Resource usage of children only covers finished child processes, such as the external tools.
+        # Peak RSS of children is the largest peak of any child so far, so it is only reported for steps which ran children
+        children_cpu = (children_after.ru_utime + children_after.ru_stime) - (children_before.ru_utime + children_before.ru_stime)
+        stage = {
+            'stage': self.name,
+            'transformer': type(self.transformer).__name__,
+            'wall_time': wall_time,
+            'cpu_time': cpu_time,
+            'peak_rss_delta': peak_after - peak_before,
+            'peak_rss': peak_after,
+            'rows_in': rows_in,
+            'rows_out': row_count(X),
+            'bytes_written': None if written_before is None else written_after - written_before,
+            'children_cpu_time': children_cpu,
+            'children_peak_rss': maxrss_bytes(children_after) if children_cpu else None,
+            'failed_tools': None,
+        }
+
+        # Tool transformers keep results of their runs, which are added with exit status and wall time of every tool
+        results = [tool.result for tool in self.tools if tool.result is not None]
+        if results:
+            stage['tools'] = [{key: value for key, value in result.as_dict().items() if key != 'stderr'} for result in results]
+            stage['failed_tools'] = ', '.join(result.name for result in results if not result.ok)
+        self.report.stages.append(stage)
+        return X
+
+"""
+Custom function wrapping every step of a pipeline into InstrumentedTransformer.
+Returns the instrumented pipeline and the RunReport filled by running it.
+
+:param pipeline: sklearn Pipeline of transformers, or list of (name, transformer) pairs (see main.build_steps), which is returned as a list
+:param report: RunReport to append to, a new one by default
+"""
+def instrument(pipeline, report=None):
+    report = RunReport() if report is None else report
+    if isinstance(pipeline, list):
+        return [(name, InstrumentedTransformer(name, step, report)) for name, step in pipeline], report
+    # scikit-learn is imported only for Pipelines, as in main.build_pipeline
+    from sklearn.pipeline import Pipeline
+    return Pipeline([(name, InstrumentedTransformer(name, step, report)) for name, step in pipeline.steps]), report
@@ -1,24 +1,215 @@
 
-from sklearn.base import TransformerMixin
 import numpy as np
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
+from pandas.api.types import union_categoricals
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import csv
+import gzip
 import io
+import multiprocessing
 import os
+import re
+
+import bgzf
+from cache import ResultCache
+import plotting
+from sampling import ReservoirSampler
+from scheduler import ToolScheduler, ToolTask
+import tablecache
+import writers
+
+"""
+Base class of the transformers. Like sklearn.base.TransformerMixin, it adds fit_transform, so the transformers are used in sklearn
+pipelines as before. scikit-learn, seaborn and matplotlib take seconds to import, so scikit-learn is imported only when a Pipeline is built
+and plots are drawn by separate processes (see plotting), and runs which do not need them start quickly (see cli.py).
+"""
+class TransformerMixin:
+    # Transformers which only write files or run tools return the table they got, see checkpoint.py
+    changes_data = True
+
+    def fit_transform(self, X, y=None, **fit_params):
+        return self.fit(X, y, **fit_params).transform(X)
+
+"""
+Column types of the mandatory VCF columns. Every sample column is read as string as well.
+"""
+VCF_DTYPES = {'CHROM': str, 'POS': int, 'ID': str, 'REF': str, 'ALT': str, 'QUAL': str, 'FILTER': str, 'INFO': str, 'FORMAT': str}
+
+"""
+Custom function for skipping the VCF head section.
+Reads the file handle up to and including the #CHROM line, so the handle is left at the first record.
+Returns column names taken from the #CHROM line.
+"""
+def read_vcf_header(f):
+    for line in iter(f.readline, b''):
+        if line.startswith(b'#CHROM'):
+            return line.decode().lstrip('#').rstrip('\r\n').split('\t')
+    raise ValueError('VCF file does not contain #CHROM header line')
+
+"""
+Custom function opening VCF file for reading records. Plain text, gzip and BGZF-compressed (bgzip) files are supported.
+BGZF files are decompressed block-parallel with the given number of threads.
+If regions are given and the BGZF file has a tabix (.tbi) or CSI (.csi) index next to it, only blocks overlapping the regions are read.
+Returns file object positioned at the first record, column names and parsed regions.
+"""
+def open_vcf_file(path, regions=None, threads=None):
+    if regions is not None:
+        regions = [bgzf.parse_region(region) for region in regions]
+
+    if not bgzf.is_bgzf(path):
+        f = gzip.open(path, 'rb') if str(path).endswith('.gz') else open(path, 'rb')
+        return f, read_vcf_header(f), regions
+
+    # Header of indexed files is read block by block, as the rest of the stream is not used
+    index_path = None if regions is None else bgzf.TabixIndex.find(str(path))
+    f = bgzf.open_bgzf(path, threads=threads, batch=64 if index_path is None else 1)
+    columns = read_vcf_header(f)
+    if index_path is None:
+        return f, columns, regions
+    f.close()
+
+    # Matching requested contigs to contig names used in the index, so '1' finds 'chr1' and vice versa
+    index = bgzf.TabixIndex(index_path)
+    names = dict(zip(normalize_contig_names(index.names), index.names))
+    chunks = []
+    for contig, start, end in regions:
+        contig = names.get(normalize_contig_names([contig])[0], contig)
+        chunks.extend(index.chunks(contig, start, end))
+    return bgzf.open_bgzf(path, bgzf.merge_chunks(chunks), threads), columns, regions
+
+"""
+Custom function selecting records whose position lies in any of the parsed regions.
+Index blocks also contain neighbouring records, so records are always filtered after reading.
+"""
+def select_regions(X, regions):
+    chroms = normalize_contig_names(X['CHROM'])
+    mask = np.zeros(len(X), dtype=bool)
+    for contig, start, end in regions:
+        mask |= (chroms == normalize_contig_names([contig])[0]) & (X['POS'].values >= start) & (X['POS'].values <= end)
+    return X[mask]
+
+"""
+Custom loading function for chunked VCF file loading.
+Generator which streams records straight from the file handle and yields typed dataframes of at most chunksize records,
+so the whole VCF is never held in memory. If transformer is given, it is applied to every chunk before it is yielded,
+which lets row-wise transformers (extraction, filtering, copy number merge) reduce the data chunk by chunk.
+Regions ('chr1', 'chr1:1000-2000') restrict loading to the given contigs or intervals, see open_vcf_file.
+"""
+def iter_vcf_chunks(path, chunksize=100000, transformer=None, regions=None, threads=None):
+    f, columns, regions = open_vcf_file(path, regions, threads)
+    with f:
+        dtype = {column: VCF_DTYPES.get(column, str) for column in columns}
+        for chunk in pd.read_csv(f, names=columns, header=None, dtype=dtype, sep='\t', chunksize=chunksize):
+            if regions is not None:
+                chunk = select_regions(chunk, regions)
+            if transformer is not None:
+                chunk = transformer.transform(chunk)
+            yield chunk
+
+"""
+Custom function concatenating transformed chunks.
+Categorical columns are unioned, so they stay categorical even if chunks saw different categories.
+"""
+def concat_chunks(chunks, sort_categories=False):
+    chunks = list(chunks)
+    X = pd.concat(chunks)
+    for column in chunks[0].select_dtypes('category').columns:
+        X[column] = union_categoricals([chunk[column] for chunk in chunks], sort_categories=sort_categories)
+    return X
 
 """
 Custom loading function for VCF file loading. 
 This functions skips entire head section and categorizes data into columns.
 Function creates readable dataframe.
 The function is based on the latest VCF standard.
-Created with an emphasis on low time complexity.
+Created with an emphasis on low time complexity. Records are parsed directly from the file handle.
+If chunksize is given, the file is read in chunks (see iter_vcf_chunks) and transformed chunks are concatenated.
+Compressed files and regions are supported as described in open_vcf_file.
+With cache=True, the parsed records are kept next to the file and later loads map them instead of parsing again (see tablecache).
+Long string columns of a cached table are Arrow-backed strings with the same values.
+"""
+def load_vcf_file(path, chunksize=None, transformer=None, regions=None, threads=None, cache=False):
+    if chunksize is not None:
+        return concat_chunks(iter_vcf_chunks(path, chunksize, transformer, regions, threads))
+    if cache:
+        X = tablecache.load_cached(path, lambda path: load_vcf_file(path, regions=regions, threads=threads), {'table': 'vcf', 'regions': regions})
+        return X if transformer is None else transformer.transform(X)
+
+    f, columns, regions = open_vcf_file(path, regions, threads)
+    with f:
+        dtype = {column: VCF_DTYPES.get(column, str) for column in columns}
+        X = pd.read_csv(f, names=columns, header=None, dtype=dtype, sep='\t')
+    if regions is not None:
+        X = select_regions(X, regions)
+    return X if transformer is None else transformer.transform(X)
+
+"""
+Column names of the CNVpytor copy caller results.
+"""
+CNV_COLUMNS = ['file_name', 'method', 'CNV Type', 'chr', 'CNV Region Start', 'CNV Region End', 'CNV size', 'CNV level',
+               'e-val1', 'e-val2', 'e-val3', 'e-val4', 'q0', 'pN', 'dG']
+
+"""
+Custom loading function for copy caller results in the CNVpytor format, as read in the notebook.
+With cache=True, the parsed table is kept next to the file, as in load_vcf_file.
+"""
+def load_cnv_file(path, cache=False):
+    if cache:
+        return tablecache.load_cached(path, load_cnv_file, {'table': 'cnv'})
+    return pd.read_csv(path, names=CNV_COLUMNS, delimiter=r"\s+")
+
+"""
+Custom function splitting a column of delimited strings with the C parser of pandas, which is much faster than str.split.
+Every value becomes one row, fields beyond the given names must not occur. Values '.' are read as NaN.
+"""
+def read_delimited(values, sep, names, usecols, dtype=None):
+    if len(values) == 0:
+        return pd.DataFrame(columns=usecols, dtype=dtype or object)
+    # A last row with all fields missing makes sure every column exists, even if all values have fewer fields (e.g. trailing keys dropped)
+    text = io.StringIO('\n'.join(values) + '\n' + sep.join('.' * len(names)))
+    return pd.read_csv(text, sep=sep, header=None, names=names, usecols=usecols, dtype=dtype, quoting=csv.QUOTE_NONE,
+                       keep_default_na=False, na_values=['.'], skip_blank_lines=False).iloc[:-1]
+
+"""
+Custom function decoding the sample column according to the FORMAT column of every record.
+FORMAT takes only a few distinct values in a file, so records are grouped by FORMAT and every group is parsed at once.
+Returns dataframe with one string column per requested key. Keys missing in a record's FORMAT, or given as '.', are NaN.
+"""
+def decode_format(formats, samples, keys):
+    result = pd.DataFrame(index=samples.index, columns=keys, dtype=object)
+    codes, layouts = pd.factorize(formats)
+    for code, layout in enumerate(layouts):
+        fields = layout.split(':')
+        wanted = [key for key in keys if key in fields]
+        if not wanted:
+            continue
+        mask = codes == code
+        decoded = read_delimited(samples[mask].fillna('.'), ':', fields, wanted, dtype=str)
+        for key in wanted:
+            result.loc[mask, key] = decoded[key].values
+    return result
+
+"""
+Custom function looking up a key of the INFO column by name. Returns the first value of the key, or NaN if it is missing.
 """
-def load_vcf_file(path):
-    with open(path, 'r') as f:
-        # Skipping lines starting with ## - Head
-        lines = [l for l in f if not l.startswith('##')]
-    return pd.read_csv(io.StringIO(u''.join(lines)), dtype={'#CHROM': str, 'POS': int, 'ID': str, 'REF': str, 'ALT': str, 'QUAL': str, 'FILTER': str, 'INFO': str}, sep='\t').rename(columns={'#CHROM': 'CHROM'})
+def info_field(info, key):
+    return info.str.extract(f'(?:^|;){re.escape(key)}=([^;,]*)', expand=False)
+
+"""
+Custom function converting comma-separated numbers (AD, PL) into integer columns of fixed width.
+Missing values are stored as -1, values beyond the width are ignored.
+"""
+def split_numbers(values, width, dtype='int32'):
+    values = values.fillna('.')
+    fields = max(width, int(values.str.count(',').max()) + 1 if len(values) else width)
+    split = read_delimited(values, ',', range(fields), range(width))
+    return split.apply(pd.to_numeric, errors='coerce').fillna(-1).astype(dtype)
+
+"""
+Custom function converting a column of numbers stored as strings to integers. Missing values are stored as -1.
+"""
+def to_integer(values, dtype='int32'):
+    return pd.to_numeric(values, errors='coerce').fillna(-1).astype(dtype)
 
 class VcfDataExtractionTransformer(TransformerMixin):
     """
@@ -37,20 +228,150 @@ class VcfDataExtractionTransformer(TransformerMixin):
         return self
     
     def transform(self, X, **transform_params):
-        # Splitting sample column according to standardized FORMAT column
-        X[['GENOTYPE', 'ALLELIC DEPTH', 'DEPTH', 'GENOTYPE QUALITY', 'PHRED-SCALED LIKELIHOODS']] = X.iloc[:, 9].str.split(":", expand=True)
+        # Decoding sample column according to FORMAT column of every record, so the order of FORMAT keys does not matter
+        fields = decode_format(X['FORMAT'], X.iloc[:, 9], ['GT', 'AD', 'DP', 'GQ', 'PL', 'AF'])
+        X['GENOTYPE'] = fields['GT'].values
 
         # Retyping into integers to enable numeric operations
-        X["GENOTYPE QUALITY"] = X["GENOTYPE QUALITY"].astype('int')
-        X['POS'] = X['POS'].astype('int')
+        X['DEPTH'] = to_integer(fields['DP']).values
+        X['GENOTYPE QUALITY'] = to_integer(fields['GQ']).values
+        X['POS'] = X['POS'].astype('int32')
+        likelihoods = split_numbers(fields['PL'], 3)
+        X['PL HOM REF'] = likelihoods[0].values
+        X['PL HET'] = likelihoods[1].values
+        X['PL HOM ALT'] = likelihoods[2].values
 
-        # Finding allele frequencies and their respective copy number. Rewriting copy number into usable format
-        temp = X['INFO'].str.split(";", expand=True)
-        X['ALLELIC FREQUENCY'] = temp[1].str[3:]
+        # Splitting allelic depth (reference, alternative) once, so tool-input transformers share the integer counts
+        depth = split_numbers(fields['AD'], 2).clip(lower=0)
+        X['REF COUNT'] = depth[0].values
+        X['ALT COUNT'] = depth[1].values
+        X['VARIANT FREQUENCY'] = X['ALT COUNT'] / (X['REF COUNT'] + X['ALT COUNT'])
+
+        # Creating mutation_id shared by PyClone and FastClone and storing chromosome names as categories
+        X['MUTATION ID'] = X['CHROM'] + ':' + X['POS'].astype(str)
+        X['CHROM'] = X['CHROM'].astype('category')
+        X['CONTIG'] = contig_codes(X['CHROM'])
+
+        # Finding allele frequencies (per-sample AF if present, otherwise AF from INFO) and their respective copy number
+        frequency = fields['AF'].fillna(info_field(X['INFO'], 'AF'))
+        X['ALLELIC FREQUENCY'] = pd.to_numeric(frequency, errors='coerce').values
         X['MINOR ALLELE COPY NUMBER'] = np.where(X['GENOTYPE'] == '0/1', 0, 1)
         X['MAJOR ALLELE COPY NUMBER'] = np.where(X['GENOTYPE'] == '0/1', 2, 1)
         return X
     
+"""
+Compact column types of the variant table. Only columns read by the transformers after VcfDataExtractionTransformer are listed.
+COPY NUMBER is added by CopyCallsMergeTransformer.
+"""
+COMPACT_SCHEMA = {
+    'CHROM': 'category',
+    'CONTIG': 'int8',
+    'POS': 'int32',
+    'REF': 'category',
+    'ALT': 'category',
+    'GENOTYPE': 'category',
+    'GENOTYPE QUALITY': 'int16',
+    'REF COUNT': 'int32',
+    'ALT COUNT': 'int32',
+    'VARIANT FREQUENCY': 'float64',
+    'MUTATION ID': 'object',
+    'MINOR ALLELE COPY NUMBER': 'uint8',
+    'MAJOR ALLELE COPY NUMBER': 'uint8',
+    'COPY NUMBER': 'uint8',
+}
+
+"""
+Custom function converting numbers into a narrower integer type. The column keeps its type if any value does not fit,
+so unusual values (e.g. genotype quality above 32767) are never wrapped around.
+"""
+def narrow(values, dtype):
+    info = np.iinfo(dtype)
+    numbers = values.to_numpy()
+    if len(numbers) and not (numbers.min() >= info.min and numbers.max() <= info.max and np.array_equal(numbers, np.round(numbers))):
+        return values
+    return values.astype(dtype)
+
+class CompactSchemaTransformer(TransformerMixin):
+    """
+    A transformer reducing memory of the variant table. Drops columns no later transformer reads and converts the rest
+    into compact types (see COMPACT_SCHEMA). Exported files do not change.
+    """
+
+    def __init__(self, *args, drop=True, arrow=False, **kwargs):
+        """
+        Initialize method.
+
+        :param drop: drop columns which are not in COMPACT_SCHEMA (original VCF columns, PL, DEPTH, ...)
+        :param arrow: store string columns as Arrow-backed strings, requires pyarrow
+        """
+        self.drop = drop
+        self.arrow = arrow
+
+    def fit(self, X, y=None):
+        """
+        Fits transformer over data.
+        """
+        return self
+
+    def transform(self, X, **transform_params):
+        if self.drop:
+            X = X[[column for column in X.columns if column in COMPACT_SCHEMA]]
+        X = X.copy()
+        for column in X.columns.intersection(list(COMPACT_SCHEMA)):
+            dtype = COMPACT_SCHEMA[column]
+            if dtype == 'object':
+                if self.arrow:
+                    X[column] = X[column].astype('string[pyarrow]')
+            elif dtype == 'category' or dtype.startswith('float'):
+                X[column] = X[column].astype(dtype)
+            else:
+                X[column] = narrow(X[column], dtype)
+        return X
+
+"""
+Custom function returning memory of every column of a dataframe in bytes, including contents of Python strings.
+"""
+def memory_usage(X):
+    return X.memory_usage(deep=True, index=False)
+
+class MemoryReportTransformer(TransformerMixin):
+    """
+    A transformer printing memory of every column of the data passing through it. The data is not changed.
+    """
+    changes_data = False
+
+    def __init__(self, stage, *args, **kwargs):
+        """
+        Initialize method.
+
+        :param stage: name of the preceding pipeline step, printed in the report
+        """
+        self.stage = stage
+        self.report = None
+
+    def fit(self, X, y=None):
+        """
+        Fits transformer over data.
+        """
+        return self
+
+    def transform(self, X, **transform_params):
+        self.report = memory_usage(X)
+        print(f'{self.stage}: {len(X)} rows, {self.report.sum() / 2**20:.1f} MB')
+        print((self.report / 2**20).round(2).to_string())
+        return X
+
+"""
+Custom function returning a copy of the pipeline with a MemoryReportTransformer after every step.
+"""
+def with_memory_report(pipeline):
+    from sklearn.pipeline import Pipeline
+    steps = []
+    for name, step in pipeline.steps:
+        steps.append((name, step))
+        steps.append((name + 'Memory', MemoryReportTransformer(name)))
+    return Pipeline(steps)
+
 class FilterQualityTransformer(TransformerMixin):
     """
     A tranformer for filtering only quality reads.
@@ -79,18 +400,238 @@ class FilterQualityTransformer(TransformerMixin):
         X = X[X["GENOTYPE QUALITY"] >= self.percentage]
         return X
 
+"""
+Custom function for normalizing contig names.
+Strips chr/ch prefixes and unifies letter case so that CNV segments named '1' match VCF records named 'chr1'.
+Only distinct names are normalized, so the cost does not grow with the number of records.
+"""
+def normalize_contig_names(values):
+    codes, names = pd.factorize(pd.Series(values))
+    names = pd.Series(np.asarray(names)).astype(str).str.replace(r'^(?i:chr|ch)', '', regex=True).str.upper().values
+    return names[codes]
+
+"""
+Canonical contigs. Every contig is identified by an integer code, its position in this list starting from 1, whatever its naming style
+('chr1', 'ch1', '1'; 'chrX', 'x'; 'chrM', 'MT'). Other contigs (alt contigs, decoys, unplaced scaffolds) get code 0.
+"""
+CONTIGS = [str(number) for number in range(1, 23)] + ['X', 'Y', 'MT']
+CONTIG_CODES = dict(zip(CONTIGS, range(1, len(CONTIGS) + 1)), M=len(CONTIGS))
+
+"""
+Named contig sets kept by transformers which filter contigs. The default set are autosomes and sex chromosomes, which the pipeline
+always kept; 'all' also keeps the mitochondrial genome and other contigs.
+"""
+CONTIG_SETS = {
+    'autosomes': CONTIGS[:22],
+    'default': CONTIGS[:24],
+    'canonical': CONTIGS,
+    'all': None,
+}
+
+"""
+Custom function mapping contig names to integer contig codes (see CONTIGS). Only distinct names are normalized, and categorical
+columns are not hashed again, so the cost is one pass over the codes.
+"""
+def contig_codes(values):
+    codes, names = pd.factorize(pd.Series(values))
+    # Missing names (code -1) take the last entry, which is 0
+    lookup = np.array([CONTIG_CODES.get(name, 0) for name in normalize_contig_names(names)] + [0], dtype=np.int8)
+    return lookup[codes]
+
+"""
+Custom function returning contig codes of the variant table, computed by VcfDataExtractionTransformer or from CHROM if missing.
+"""
+def variant_contigs(X):
+    return X['CONTIG'].values if 'CONTIG' in X.columns else contig_codes(X['CHROM'])
+
+"""
+Custom function returning mask of codes belonging to a contig set.
+
+:param codes: contig codes (see contig_codes)
+:param contigs: name of a set in CONTIG_SETS or a list of contig names in any naming style
+"""
+def contig_mask(codes, contigs='default'):
+    if isinstance(contigs, str) and contigs not in CONTIG_SETS:
+        raise ValueError(f'Unknown contig set {contigs!r}, expected one of ' + ', '.join(CONTIG_SETS))
+    names = CONTIG_SETS[contigs] if isinstance(contigs, str) else contigs
+    if names is None:
+        return np.ones(len(codes), dtype=bool)
+    wanted = contig_codes(names)
+    if not wanted.all():
+        raise ValueError('Unknown contigs: ' + ', '.join(str(name) for name, code in zip(names, wanted) if not code))
+    return np.isin(codes, wanted)
+
+class CopyNumberIndex:
+    """
+    Per-chromosome interval index over copy number segments.
+    Segments are flattened into sorted, non-overlapping elementary intervals once,
+    so that any number of positions can be assigned a copy number with one searchsorted call per chromosome.
+    Where segments overlap, the segment listed first in the copy caller results wins.
+    """
+
+    def __init__(self, chroms, starts, ends, values):
+        """
+        Initialize method. Builds the index.
+
+        :param chroms: chromosome of every segment
+        :param starts: first position covered by every segment (inclusive)
+        :param ends: last position covered by every segment (inclusive)
+        :param values: copy number of every segment
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        order = np.arange(len(starts))
+
+        # Canonical contigs are keyed by their integer code, other contigs by their normalized name
+        self.index = {}
+        for key, mask in self._contig_masks(chroms):
+            self.index[key] = self._flatten(starts[mask], ends[mask], values[mask], order[mask])
+
+    @staticmethod
+    def _contig_masks(chroms, codes=None, keys=None):
+        """
+        Generator of (key, mask) pairs of every contig, or only of the given keys. Names of other contigs are normalized only if present.
+        """
+        codes = contig_codes(chroms) if codes is None else np.asarray(codes)
+        present = pd.unique(codes)
+        for code in present[present > 0]:
+            if keys is None or code in keys:
+                yield code, codes == code
+        if (present == 0).any():
+            names = np.where(codes == 0, normalize_contig_names(chroms), '')
+            for name in pd.unique(names[codes == 0]):
+                if keys is None or name in keys:
+                    yield name, names == name
+
+    @staticmethod
+    def _flatten(starts, ends, values, order):
+        """
+        Function that turns possibly overlapping segments into elementary intervals [bounds[i], bounds[i + 1]).
+        Returns boundaries and the value of every elementary interval (NaN where no segment covers it).
+        """
+        # Sorting segments by start to detect the common case of disjoint segments
+        by_start = np.argsort(starts, kind='stable')
+        starts, ends, values, order = starts[by_start], ends[by_start], values[by_start], order[by_start]
+
+        if np.all(starts[1:] > ends[:-1]):
+            # Disjoint segments map directly onto boundaries, uncovered gaps in between stay NaN
+            bounds = np.empty(2 * len(starts), dtype=np.int64)
+            bounds[0::2] = starts
+            bounds[1::2] = ends + 1
+            filled = np.full(len(bounds) - 1, np.nan)
+            filled[0::2] = values
+            return bounds, filled
+
+        # Overlapping segments are painted in reverse priority, so the first listed segment is written last
+        bounds = np.unique(np.concatenate([starts, ends + 1]))
+        filled = np.full(len(bounds) - 1, np.nan)
+        first = np.searchsorted(bounds, starts)
+        last = np.searchsorted(bounds, ends + 1)
+        for i in np.argsort(order)[::-1]:
+            filled[first[i]:last[i]] = values[i]
+        return bounds, filled
+
+    def lookup(self, chroms, positions, codes=None):
+        """
+        Function that finds the copy number for every position in a single pass.
+        Positions outside all segments get NaN.
+
+        :param chroms: chromosome of every position
+        :param positions: positions to look up
+        :param codes: contig codes of chroms if already known (see contig_codes)
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        result = np.full(len(positions), np.nan)
+
+        for chrom, mask in self._contig_masks(chroms, codes, self.index):
+            bounds, filled = self.index[chrom]
+            # Locating elementary interval of every position, positions before the first boundary or after the last one stay NaN
+            slot = np.searchsorted(bounds, positions[mask], side='right') - 1
+            inside = (slot >= 0) & (slot < len(filled))
+            found = np.full(len(slot), np.nan)
+            found[inside] = filled[slot[inside]]
+            result[mask] = found
+        return result
+
+"""
+Custom function returning integer sort keys of chromosome names in the natural order 1-22, X, Y, M, followed by other contigs by name.
+Names with and without the chr prefix get the same order, so chr2 is sorted before chr10.
+"""
+def chromosome_order(values):
+    codes, names = pd.factorize(pd.Series(values))
+    normalized = normalize_contig_names(names)
+    # Canonical contigs are ordered by their code, other contigs by their number if they have one
+    canonical = contig_codes(names)
+    rank = np.where(canonical > 0, canonical, pd.to_numeric(pd.Series(normalized), errors='coerce').fillna(26).values)
+    order = np.lexsort((normalized, rank))
+    keys = np.empty(len(names), dtype=np.int64)
+    keys[order] = np.arange(len(names))
+    return keys[codes]
+
+"""
+Custom function filling gaps between copy number segments with the default copy number.
+Segments are sorted by chromosome in natural order and by start, and gaps are computed per chromosome on the sorted arrays without any row loop.
+Every chromosome is tiled from position 1 to its last segment end; a gap covers the positions between the furthest end of
+the preceding segments and the next start, so overlapping segments do not create gaps.
+Returns dataframe with columns chr, start, end, logR, where gaps are listed right before the segment that follows them.
+"""
+def fill_segment_gaps(chroms, starts, ends, values, default=2):
+    # Chromosome names are replaced by their sort keys, so all work is done on integer arrays
+    codes, names = pd.factorize(pd.Series(chroms))
+    names = np.asarray(names)
+    order_keys = chromosome_order(names)
+    keys = order_keys[codes]
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    values = np.asarray(values)
+
+    # Sorting by one combined key of chromosome and start; copy callers report segments sorted already, then sorting is skipped
+    combined = (keys << 40) + starts
+    if not np.all(combined[1:] >= combined[:-1]):
+        order = np.argsort(combined, kind='stable')
+        keys, starts, ends, values = keys[order], starts[order], ends[order], values[order]
+
+    # Marking first segments of chromosomes and numbering chromosomes in the sorted order
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    group = np.cumsum(first) - 1
+
+    # Running maximum of ends within every chromosome; offsetting chromosomes keeps the maximum from crossing their boundaries
+    offset = group << 40
+    covered = np.maximum.accumulate(ends + offset) - offset
+    gap_starts = np.ones(len(starts), dtype=np.int64)
+    gap_starts[1:] = covered[:-1] + 1
+    gap_starts[first] = 1
+    gap_ends = starts - 1
+
+    # Interleaving every gap with the segment after it keeps the tiling sorted
+    keep = np.ones(2 * len(keys), dtype=bool)
+    keep[0::2] = gap_ends >= gap_starts
+    names_by_key = np.empty(len(names), dtype=object)
+    names_by_key[order_keys] = names
+    return pd.DataFrame({
+        'chr': pd.Categorical.from_codes(np.repeat(keys, 2)[keep], names_by_key),
+        'start': np.column_stack([gap_starts, starts]).ravel()[keep],
+        'end': np.column_stack([gap_ends, ends]).ravel()[keep],
+        'logR': np.column_stack([np.full(len(values), default, dtype=values.dtype), values]).ravel()[keep],
+    })
+
 class CopyCallsMergeTransformer(TransformerMixin):
     """
     A tranformer for merging copy number results with VCF file.
     """
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, contigs='default', **kwargs):
         """
         Initialize method.
 
         :param *args: dataset created from copy caller results
+        :param contigs: contigs kept, name of a set in CONTIG_SETS or a list of contig names
         """
         self.data = args[0]
+        self.contigs = contigs
+        self.index = None
         
     def fit(self, X, y=None):
         """
@@ -98,116 +639,267 @@ class CopyCallsMergeTransformer(TransformerMixin):
         """
         return self
     
-    """
-    Custom function for finding suitable copy number segments.
-    This function takes reads from the VCF file and searches CNV segments 
-    to check if it finds a suitable segment which it can assign this read to.
-    
-    """
-    def find_range(self, pos):
-        for i, row in self.data.iterrows():
-            if row[4] <= pos <= row[5]:
-                return row[7]
-        return None
-
-    
     def transform(self, X, **transform_params):
-        # Retyping formats into integers to enable numerical operations
-        self.data['CNV level'] = self.data['CNV level'].apply(np.round) 
-        self.data['CNV level'] = self.data['CNV level'].astype('int')
-        self.data['CNV Region Start'] = self.data['CNV Region Start'].astype('int')
-        self.data['CNV Region End'] = self.data['CNV Region End'].astype('int')
+        # Segments are prepared and indexed in the first call only, as they do not change (ShardedPreprocessing reuses the index for every shard)
+        if self.index is None:
+            # Retyping formats into integers to enable numerical operations
+            self.data['CNV level'] = self.data['CNV level'].round()
+            self.data['CNV level'] = self.data['CNV level'].astype('int')
+            self.data['CNV Region Start'] = self.data['CNV Region Start'].astype('int')
+            self.data['CNV Region End'] = self.data['CNV Region End'].astype('int')
+
+            # Filtering out segments with lost data
+            self.data = self.data[self.data['CNV level'] != 0]
 
-        # Filtering out segments with lost data
-        self.data = self.data[self.data['CNV level'] != 0]
+            # Building chromosome-aware index of segments
+            self.index = CopyNumberIndex(self.data['chr'], self.data['CNV Region Start'], self.data['CNV Region End'], self.data['CNV level'])
 
-        # Finding suitable segments for reads
-        X['COPY NUMBER'] = X['POS'].apply(self.find_range)
+        # Finding suitable segments for reads in one pass
+        codes = variant_contigs(X)
+        X['COPY NUMBER'] = self.index.lookup(X['CHROM'], X['POS'], codes)
 
         # Filling segments without CNVs with default value
         X['COPY NUMBER'] = X['COPY NUMBER'].fillna(2.0)
 
         # Fitlering out unwanted chromosomes
-        X = X.loc[X['CHROM'].isin(['chr1', 'chr2', 'chr3','chr4','chr5','chr6','chr7','chr8','chr9','chr10', 'chr11','chr12','chr13','chr14','chr15','chr16','chr17','chr18','chr19','chr20','chr21','chr22','chr22', 'chrX' , 'chrY', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10','11', '12', '13', '14', '15','16','17','18', '19', '20','21','22','X','Y','x','y', 'ch1', 'ch2', 'ch3','ch4','ch5','ch6','ch7','ch8','ch9', 'ch10', 'ch11','ch12','ch13','ch14','ch15','ch16','ch17','ch18','ch19','ch20','ch21','ch22','ch22', 'chX' , 'chY'])]
+        X = X.loc[contig_mask(codes, self.contigs)]
         return X
     
+"""
+Variant table and steps of the running ShardedPreprocessing. Worker processes are forked while it is set, so they read their shards
+from the memory inherited from the parent and the table is never pickled.
+"""
+SHARDING = None
+
+"""
+Custom function running the steps over one shard of the variant table. Runs in a worker process.
+Rows are indexed by their position in the whole table, so the parent can restore the original order.
+"""
+def transform_shard(positions, X=None, steps=None):
+    if X is None:
+        X, steps = SHARDING
+    shard = X.iloc[positions].copy()
+    shard.index = positions
+    for _, step in steps:
+        shard = step.transform(shard)
+    return shard
+
+class ShardedPreprocessing(TransformerMixin):
+    """
+    A transformer which runs row-wise steps (extraction, quality filter, copy number merge) over every chromosome
+    in a separate process and joins the results. The result is the same as running the steps one after another on the whole table.
+    """
+
+    def __init__(self, steps, *args, workers=None, **kwargs):
+        """
+        Initialize method.
+
+        :param steps: list of (name, transformer) pairs, every step must transform rows independently of other rows
+        :param workers: number of worker processes, all cores by default
+        """
+        self.steps = steps
+        self.workers = workers
+
+    def fit(self, X, y=None):
+        """
+        Fits transformer over data.
+        """
+        return self
+
+    def transform(self, X, **transform_params):
+        """
+        This function splits the variant table by CHROM and transforms the chromosomes in a process pool, largest first.
+        Rows are returned in their original order, which for sorted VCF files is the genome order.
+        """
+        global SHARDING
+
+        # Steps run once over no rows in this process, so their effects on shared data (e.g. CopyCallsMergeTransformer
+        # rounding the copy numbers read by the exporters) are the same as in the serial run, and columns are known without shards
+        empty = transform_shard(np.arange(0), X, self.steps)
+
+        codes, _ = pd.factorize(X['CHROM'])
+        order = np.argsort(codes, kind='stable')
+        shards = np.split(order, np.flatnonzero(np.diff(codes[order])) + 1) if len(order) else []
+        shards.sort(key=len, reverse=True)
+
+        # Forked workers inherit the table; where fork is not available, shards are pickled to the workers
+        fork = 'fork' in multiprocessing.get_all_start_methods()
+        SHARDING = (X, self.steps)
+        try:
+            with ProcessPoolExecutor(self.workers or os.cpu_count(), mp_context=multiprocessing.get_context('fork') if fork else None) as executor:
+                futures = [executor.submit(transform_shard, positions) if fork else
+                           executor.submit(transform_shard, np.arange(len(positions)), X.iloc[positions], self.steps) for positions in shards]
+                results = [future.result() for future in futures]
+        finally:
+            SHARDING = None
+        if not fork:
+            for result, positions in zip(results, shards):
+                result.index = positions[result.index]
+
+        # Categories are sorted as astype('category') sorts them in the serial run. The empty result only gives the columns:
+        # concatenated with the shards, it could change their types
+        if results:
+            result = concat_chunks(results, sort_categories=True)[empty.columns].sort_index(kind='stable')
+        else:
+            result = empty
+        result.index = X.index[result.index]
+        return result
+
+"""
+Custom function returning path of a file inside the work directory of a sample and creating its folder.
+With the default work directory '.', paths are the ones the pipeline always used, e.g. './inputFiles/PyClone/PyCloneInput.tsv'.
+A path ending with an empty part is a folder, e.g. work_path('.', 'results', 'TitanCNA', '') is './results/TitanCNA/'.
+"""
+def work_path(workdir, *parts):
+    path = os.path.join(workdir, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+"""
+Input files of the tools: folder in the inputFiles folder, file name and compressions accepted by the tool reading the file.
+PyClone-VI and FastClone read their input with pandas and SciClone with read.table, which all read compressed files.
+PyClone and TitanCNA only read plain files.
+"""
+TOOL_INPUTS = {
+    'PyClone': ('PyClone', 'PyCloneInput.tsv', ()),
+    'PyCloneVI': ('PyCloneVI', 'PyCloneVIInput.tsv', ('gzip', 'zstd')),
+    'SciCloneVaf': ('SciClone', 'ScicloneVafFile.tsv', ('gzip',)),
+    'SciCloneCopy': ('SciClone', 'ScicloneCopyFile.tsv', ('gzip',)),
+    'TitanCNAHet': ('TitanCNA', 'Titancna.het', ()),
+    'TitanCNACn': ('TitanCNA', 'Titancna.cn', ()),
+    'FastClone': ('FastClone', 'FastCloneInput.tsv', ('gzip', 'zstd')),
+}
+
+"""
+Custom function returning path of a tool input file in the work directory.
+The file is compressed only if the tool reading it accepts the compression, otherwise it is written plain.
+"""
+def tool_input_path(workdir, name, compression=None):
+    folder, file_name, accepted = TOOL_INPUTS[name]
+    return writers.compressed_path(work_path(workdir, 'inputFiles', folder, file_name), compression if compression in accepted else None)
+
+"""
+Custom function returning path of a replicate of an input file, e.g. PyCloneInput.replicate2.tsv. The first replicate keeps the original path.
+"""
+def replicate_path(path, replicate):
+    if replicate == 0:
+        return path
+    root, extension = os.path.splitext(path)
+    return f'{root}.replicate{replicate}{extension}'
+
 class PyCloneTransformer(TransformerMixin):
     """
     A tranformer for preparing input files for tools PyClone and PyClone-VI
     """
+    changes_data = False
     
-    def __init__(self, samples, *args, **kwargs):
+    def __init__(self, samples, *args, workdir='.', sample_id='R1', compression=None, seed=None, stratify=None, replicates=1,
+                 allocation='equal', **kwargs):
         """
         Initialize method.
 
         :param samples: the number of samples that the transformer randomly selects for the PyClone input file
+        :param workdir: work directory of the sample, input files are written into its inputFiles folder
+        :param sample_id: sample identifier written into the PyClone-VI input file
+        :param compression: compression of input files, 'gzip' or 'zstd'; files of tools which do not accept it are written plain
+        :param seed: seed of the sampling, None gives a different sample in every run
+        :param stratify: strata of the sampling ('depth', 'vaf', 'copy_number'), None samples uniformly
+        :param replicates: number of independent PyClone input files, e.g. for bootstrap runs of PyClone
+        :param allocation: division of samples among strata, 'equal' or 'proportional' (see sampling.allocate)
         """
         self.samples = samples
+        self.workdir = workdir
+        self.sample_id = sample_id
+        self.compression = compression
+        self.seed = seed
+        self.stratify = stratify
+        self.replicates = replicates
+        self.allocation = allocation
+        self.sampler = None
         
     def fit(self, X, y=None):
         """
         Fits transformer over data.
         """
         return self
-    
-    def transform(self, X, **transform_params):
-        """
-        Function to prepare dataframe suitable for PyClone and PyClone-VI.
-        Subsequently this dataframes are exported into .tsv files.
-        """
-
-        pyclone_df = pd.DataFrame()
-        # Create custom mutation_id according to PyClone docu
-        pyclone_df['mutation_id'] = X['CHROM'] + ':' + X['POS'].astype(str)
 
-        # Extract allelic counts and divide them into singular columns
-        pyclone_df[['var_counts', 'ref_counts', 'none']] = X['ALLELIC DEPTH'].str.split(',',expand=True)
+    def new_sampler(self):
+        return ReservoirSampler(self.samples, seed=self.seed, strata=self.stratify, replicates=self.replicates, allocation=self.allocation)
 
-        # Retype into integer to allow numeric operations
-        pyclone_df['var_counts'] = pyclone_df['var_counts'].astype(int)
-        pyclone_df['ref_counts'] = pyclone_df['ref_counts'].astype(int)
+    def partial_fit(self, X, y=None):
+        """
+        Function adding a chunk of the variant table to the sampled loci, so the PyClone input can be sampled from chunked
+        loading (see iter_vcf_chunks) without holding the whole table. write_samples writes the sampled loci afterwards.
+        """
+        if self.sampler is None:
+            self.sampler = self.new_sampler()
+        self.sampler.update(self.pyclone_frame(X))
+        return self
 
-        # Copy needed values
-        pyclone_df['minor_cn'] = X['MINOR ALLELE COPY NUMBER'].values
-        pyclone_df['major_cn'] = X['MAJOR ALLELE COPY NUMBER'].values
-        pyclone_df['normal_cn'] = X['COPY NUMBER'].values
-        pyclone_df['normal_cn'] = pyclone_df['normal_cn'].astype(int)
+    def write_samples(self):
+        """
+        Function writing the sampled loci into the PyClone input file, and every further replicate into PyCloneInput.replicate<i>.tsv.
+        """
+        for replicate, sampled_data in enumerate(self.sampler.samples()):
+            writers.write_table(sampled_data, replicate_path(tool_input_path(self.workdir, 'PyClone', self.compression), replicate))
 
-        # Count Variant frequency
-        pyclone_df['variant_freq'] = pyclone_df['var_counts'] / (pyclone_df['ref_counts'] + pyclone_df['var_counts']) 
+    def pyclone_frame(self, X):
+        """
+        Function to prepare dataframe suitable for PyClone from the parsed variant table.
+        """
+        # Copy needed values from the parsed variant table
+        pyclone_df = pd.DataFrame({
+            'mutation_id': X['MUTATION ID'].values,
+            'var_counts': X['ALT COUNT'].values,
+            'ref_counts': X['REF COUNT'].values,
+            'minor_cn': X['MINOR ALLELE COPY NUMBER'].values,
+            'major_cn': X['MAJOR ALLELE COPY NUMBER'].values,
+            'normal_cn': X['COPY NUMBER'].values.astype(int),
+            'variant_freq': X['VARIANT FREQUENCY'].values,
+        })
 
         # Reformat Genotype 
-        pyclone_df['genotype'] = X['GENOTYPE']
         pyclone_df['genotype'] = np.where(X['GENOTYPE'] == '0/1', 'AB', 'BB')
-        pyclone_df = pyclone_df.drop('none', axis=1)
-
-        # Take 300 random samples
-        sampled_data = pyclone_df.sample(n=self.samples)
+        return pyclone_df
+    
+    def transform(self, X, **transform_params):
+        """
+        Function to prepare dataframe suitable for PyClone and PyClone-VI.
+        Subsequently this dataframes are exported into .tsv files.
+        """
+        pyclone_df = self.pyclone_frame(X)
 
-        # Export into .tsv
-        sampled_data.to_csv('./inputFiles/PyClone/PyCloneInput.tsv', sep="\t", index=False)
+        # Take 300 random samples, stratified if requested
+        self.sampler = self.new_sampler()
+        self.sampler.update(pyclone_df)
+        self.write_samples()
 
         # Add needed columns for PyClone-VI and rename existing ones
-        pyclone_df['sample_id'] = 'R1'
+        pyclone_df['sample_id'] = self.sample_id
         pyclone_df['alt_counts'] = pyclone_df['var_counts']
         pyclone_df = pyclone_df.drop('var_counts', axis=1)
 
         # Export into .tsv
-        pyclone_df.to_csv('./inputFiles/PyCloneVI/PyCloneVIInput.tsv', sep="\t", index=False)
+        writers.write_table(pyclone_df, tool_input_path(self.workdir, 'PyCloneVI', self.compression))
         return X
     
 class SciCloneTransformer(TransformerMixin):
     """
     A tranformer for preparing input file for tool SciClone.
     """
+    changes_data = False
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, workdir='.', compression=None, **kwargs):
         """
         Initialize method.
 
         :param *args: dataset created from copy caller results
+        :param workdir: work directory of the sample, input files are written into its inputFiles folder
+        :param compression: compression of input files, 'gzip' or 'zstd'; files of tools which do not accept it are written plain
         """
         self.data = args[0]
+        self.workdir = workdir
+        self.compression = compression
         
     def fit(self, X, y=None):
         """
@@ -216,34 +908,20 @@ class SciCloneTransformer(TransformerMixin):
         return self
     
     def transform(self, X, **transform_params):
-        # Creating empty dataframes
-        sciclone_df = pd.DataFrame()
+        # Creating empty dataframe
         sciclone_df2 = pd.DataFrame()
-        temp = pd.DataFrame()
-
-        # Copy values into dataframe
-        sciclone_df['chr'] = X['CHROM'].values
-        sciclone_df['pos'] = X['POS'].values
-
-        # Create temporary dataframe for storing splitted data to prevent wrong column order
-        temp[['var_counts', 'ref_counts', 'none']] = X['ALLELIC DEPTH'].str.split(',',expand=True)
-        temp['ref_counts'] = temp['ref_counts'].astype(int)
-        temp['var_counts'] = temp['var_counts'].astype(int)
-
-        # Copy splitted data from temporary dataframe
-        sciclone_df['ref_reads'] = temp['ref_counts'].values
-        sciclone_df['var_reads'] = temp['var_counts'].values
 
-        # Count variant frequency
-        temp['variant_freq'] = temp['var_counts'] / (temp['ref_counts'] + temp['var_counts']) 
-        sciclone_df['vaf'] = temp['variant_freq'].values * 100
-
-        # Retype columns to integer
-        sciclone_df['ref_reads'] = sciclone_df['ref_reads'].astype(int)
-        sciclone_df['var_reads'] = sciclone_df['var_reads'].astype(int)
+        # Copy values from the parsed variant table
+        sciclone_df = pd.DataFrame({
+            'chr': X['CHROM'].values,
+            'pos': X['POS'].values,
+            'ref_reads': X['REF COUNT'].values,
+            'var_reads': X['ALT COUNT'].values,
+            'vaf': X['VARIANT FREQUENCY'].values * 100,
+        })
 
         # Exporting into .tsv file
-        sciclone_df.to_csv('./inputFiles/SciClone/ScicloneVafFile.tsv', sep="\t", index=False, header=False)
+        writers.write_table(sciclone_df, tool_input_path(self.workdir, 'SciCloneVaf', self.compression), header=False)
 
         # Creating new dataframe with correct order of needed columns and correct names
         sciclone_df2['chr'] = self.data['chr'].values
@@ -254,21 +932,28 @@ class SciCloneTransformer(TransformerMixin):
         sciclone_df2['segment_mean'] = sciclone_df2['segment_mean'].astype('int')
 
         # Exporting into .tsv file
-        sciclone_df2.to_csv('./inputFiles/SciClone/ScicloneCopyFile.tsv', sep="\t", header=False, index=False)
+        writers.write_table(sciclone_df2, tool_input_path(self.workdir, 'SciCloneCopy', self.compression), header=False)
         return X
     
 class CoverageFileTransformer(TransformerMixin):
     """
     A tranformer for creating coverage file. This file is later used in tool TitanCNA.
     """
+    changes_data = False
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, workdir='.', compression=None, contigs='default', **kwargs):
         """
         Initialize method.
 
         :param *args: dataset created from copy caller results
+        :param workdir: work directory of the sample, input files are written into its inputFiles folder
+        :param compression: compression of input files, 'gzip' or 'zstd'; files of tools which do not accept it are written plain
+        :param contigs: contigs kept, name of a set in CONTIG_SETS or a list of contig names
         """
         self.data = args[0]
+        self.workdir = workdir
+        self.compression = compression
+        self.contigs = contigs
         
     def fit(self, X, y=None):
         """
@@ -277,64 +962,44 @@ class CoverageFileTransformer(TransformerMixin):
         return self
     
     def transform(self, X, **transform_params):
-        # Create empty dataframes
-        temp = pd.DataFrame()
-        temp2 = pd.DataFrame()
-        coverage_df = pd.DataFrame()
-
-        # Copy needed values into temporary dataframe so we later switch this dataframe by one row
-        temp['chr'] = self.data['chr'].values
-        temp['start'] = self.data['CNV Region Start'].values
-        temp['stop'] = self.data['CNV Region End'].values
-        temp['segment_mean'] = self.data['CNV level'].values
-        temp['segment_mean'] = temp['segment_mean'].fillna(2.0)
-        temp['segment_mean'] = temp['segment_mean'].apply(np.round)
-        temp['segment_mean'] = temp['segment_mean'].astype('int')
-
-        # Filter segments without copy number information
-        temp = temp[temp['segment_mean'] != 0]  
-        """
-        Shift segment ends by one row. This creates new segments where start represents stop of the segment and vice versa.
-        By this quick approach we supply missing segments.
-        """
-        temp['prev_end'] = temp['stop'].shift()
-        new_df = pd.DataFrame({'chr': temp['chr'],'end': temp['start'],'start': temp['prev_end'], })
-
-        # Add original segments
-        temp2['chr'] = temp['chr'].values
-        temp2['start'] = temp['start'].values
-        temp2['end'] = temp['stop'].values
-        temp2['logR'] =  temp['segment_mean'].values
-
-        # Merge segments into one dataframe and sort them
-        merge_result = pd.concat([temp2, new_df])
-        merge_result = merge_result.sort_values(by=['chr'])
-
-        # Copy values into new dataframe in correct order
-        coverage_df['chr'] = merge_result['chr'].values
-        coverage_df['start'] = merge_result['start'].values
-        coverage_df['end'] = merge_result['end'].values
-        coverage_df['logR'] = merge_result['logR'].values
-        coverage_df['logR'] = coverage_df['logR'].fillna(2.0)
-        coverage_df['logR'] = coverage_df['logR'].astype('int')
-
-        # Filter little segments and unwanted chromosomes
-        coverage_df = coverage_df[coverage_df['end'] - coverage_df['start'] > 2]
-        coverage_df = coverage_df.loc[coverage_df['chr'].isin(['chr1', 'chr2', 'chr3','chr4','chr5','chr6','chr7','chr8','chr9','chr10', 'chr11','chr12','chr13','chr14','chr15','chr16','chr17','chr18','chr19','chr20','chr21','chr22','chr22', 'chrX' , 'chrY', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10','11', '12', '13', '14', '15','16','17','18', '19', '20','21','22','X','Y','x','y', 'ch1', 'ch2', 'ch3','ch4','ch5','ch6','ch7','ch8','ch9', 'ch10', 'ch11','ch12','ch13','ch14','ch15','ch16','ch17','ch18','ch19','ch20','ch21','ch22','ch22', 'chX' , 'chY'])]
-        
+        # Copy needed values and round copy numbers into integers, segments without copy number get the default value
+        segments = pd.DataFrame({
+            'chr': self.data['chr'].values,
+            'start': self.data['CNV Region Start'].values,
+            'end': self.data['CNV Region End'].values,
+            'logR': self.data['CNV level'].fillna(2.0).round().astype('int').values,
+        })
+
+        # Filter segments without copy number information, they are covered by gaps with the default value
+        segments = segments[segments['logR'] != 0]
+
+        # Filter unwanted chromosomes
+        segments = segments.loc[contig_mask(contig_codes(segments['chr']), self.contigs)]
+
+        # Supply missing segments with the default copy number, chromosome by chromosome
+        coverage_df = fill_segment_gaps(segments['chr'], segments['start'], segments['end'], segments['logR'], default=2)
+
         # Export file into .cn format
-        coverage_df.to_csv('./inputFiles/TitanCNA/Titancna.cn', sep="\t", index=False)
+        writers.write_table(coverage_df, tool_input_path(self.workdir, 'TitanCNACn', self.compression))
         return X
 
 class TitanCNATransformer(TransformerMixin):
     """
     A tranformer for preapring input files for TitanCNA.
     """
+    changes_data = False
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, workdir='.', compression=None, contigs='default', **kwargs):
         """
-        Initialize method. No parameters were needed
+        Initialize method.
+
+        :param workdir: work directory of the sample, input files are written into its inputFiles folder
+        :param compression: compression of input files, 'gzip' or 'zstd'; files of tools which do not accept it are written plain
+        :param contigs: contigs kept, name of a set in CONTIG_SETS or a list of contig names
         """
+        self.workdir = workdir
+        self.compression = compression
+        self.contigs = contigs
         
     def fit(self, X, y=None):
         """
@@ -343,41 +1008,38 @@ class TitanCNATransformer(TransformerMixin):
         return self
     
     def transform(self, X, **transform_params):
-        # Create ampty dataframes
-        titnacna_df = pd.DataFrame()
-        temp = pd.DataFrame()
-        
-        # Extract allelic depth
-        temp[['var_counts', 'ref_counts', 'none']] = X['ALLELIC DEPTH'].str.split(',',expand=True)
-
-        # Retype values into integer to enable numeric operations
-        temp['ref_counts'] = temp['ref_counts'].astype(int)
-        temp['var_counts'] = temp['var_counts'].astype(int)
-
-        # Copy all needed values
-        titnacna_df['chr'] = X['CHROM'].values
-        titnacna_df['posn'] = X['POS'].values
-        titnacna_df['ref'] = X['REF'].values
-        titnacna_df['refCount'] = temp['ref_counts'].values
-        titnacna_df['Nref'] = X['ALT'].values
-        titnacna_df['NrefCount'] = temp['var_counts'].values
+        # Copy all needed values from the parsed variant table
+        titnacna_df = pd.DataFrame({
+            'chr': X['CHROM'].values,
+            'posn': X['POS'].values,
+            'ref': X['REF'].values,
+            'refCount': X['REF COUNT'].values,
+            'Nref': X['ALT'].values,
+            'NrefCount': X['ALT COUNT'].values,
+        })
 
         # Filter unwanted chromosomes
-        titnacna_df = titnacna_df.loc[titnacna_df['chr'].isin(['chr1', 'chr2', 'chr3','chr4','chr5','chr6','chr7','chr8','chr9','chr10', 'chr11','chr12','chr13','chr14','chr15','chr16','chr17','chr18','chr19','chr20','chr21','chr22','chr22', 'chrX' , 'chrY', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10','11', '12', '13', '14', '15','16','17','18', '19', '20','21','22','X','Y','x','y', 'ch1', 'ch2', 'ch3','ch4','ch5','ch6','ch7','ch8','ch9', 'ch10', 'ch11','ch12','ch13','ch14','ch15','ch16','ch17','ch18','ch19','ch20','ch21','ch22','ch22', 'chX' , 'chY'])]
+        titnacna_df = titnacna_df.loc[contig_mask(variant_contigs(X), self.contigs)]
         
         # Export into .het file
-        titnacna_df.to_csv('./inputFiles/TitanCNA/Titancna.het', sep="\t", index=False)
+        writers.write_table(titnacna_df, tool_input_path(self.workdir, 'TitanCNAHet', self.compression))
         return X
 
 class FastCloneTransformer(TransformerMixin):
     """
     A tranformer to create input data for FastClone tool.
     """
+    changes_data = False
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, workdir='.', compression=None, **kwargs):
         """
         Initialize method.
+
+        :param workdir: work directory of the sample, input files are written into its inputFiles folder
+        :param compression: compression of input files, 'gzip' or 'zstd'; files of tools which do not accept it are written plain
         """
+        self.workdir = workdir
+        self.compression = compression
         
     def fit(self, X, y=None):
         """
@@ -386,107 +1048,180 @@ class FastCloneTransformer(TransformerMixin):
         return self
     
     def transform(self, X, **transform_params):
-        fastclone_df = pd.DataFrame()
-
-        # Create custom mutation_id according to FastClone docu
-        fastclone_df['mutation_id'] = X['CHROM'] + ':' + X['POS'].astype(str)
-        fastclone_df[['ref_counts', 'var_counts', 'none']] = X['ALLELIC DEPTH'].str.split(',',expand=True)
-
-        # Retype columns into integer to enable numeric operations
-        fastclone_df['var_counts'] = fastclone_df['var_counts'].astype(int)
-        fastclone_df['ref_counts'] = fastclone_df['ref_counts'].astype(int)
-        
-        # Copy needed values
-        fastclone_df['minor_cn'] = X['MINOR ALLELE COPY NUMBER'].values
-        fastclone_df['major_cn'] = X['MAJOR ALLELE COPY NUMBER'].values
-        fastclone_df['normal_cn'] = X['COPY NUMBER'].values
-        fastclone_df['normal_cn'] = fastclone_df['normal_cn'].astype(int)
-
-        # Count variant frequency
-        fastclone_df['variant_freq'] = fastclone_df['var_counts'] / (fastclone_df['ref_counts'] + fastclone_df['var_counts']) 
+        # Copy needed values from the parsed variant table
+        fastclone_df = pd.DataFrame({
+            'mutation_id': X['MUTATION ID'].values,
+            'ref_counts': X['REF COUNT'].values,
+            'var_counts': X['ALT COUNT'].values,
+            'minor_cn': X['MINOR ALLELE COPY NUMBER'].values,
+            'major_cn': X['MAJOR ALLELE COPY NUMBER'].values,
+            'normal_cn': X['COPY NUMBER'].values.astype(int),
+            'variant_freq': X['VARIANT FREQUENCY'].values,
+        })
 
         # Copy and reformat genotype
-        fastclone_df['genotype'] = X['GENOTYPE']
         fastclone_df['genotype'] = np.where(X['GENOTYPE'] == '0/1', 'AB', 'BB')
-        fastclone_df = fastclone_df.drop('none', axis=1)
 
         # Export into .tsv file
-        fastclone_df.to_csv('./inputFiles/FastClone/FastCloneInput.tsv', sep="\t", index=False)
+        writers.write_table(fastclone_df, tool_input_path(self.workdir, 'FastClone', self.compression))
         return X
 
     
+"""
+Custom function running a single tool task and reporting a failure.
+Returns ToolResult with the exit status, wall time and standard error of the tool.
+With a ResultCache, unchanged inputs and parameters restore the previous results instead of running the tool.
+"""
+def run_tool(task, cache=None):
+    result = ToolScheduler(cache=cache).run([task])[0]
+    if not result.ok:
+        print(result.describe())
+    return result
+
 class TitanCNA(TransformerMixin):
     """
     A transfomer which runs TitanCNA script.
     """
+    changes_data = False
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, cores=1, cache=None, workdir='.', compression=None, **kwargs):
         """
-        Initialize method. No arguments were needed
+        Initialize method.
+
+        :param cores: number of cores TitanCNA uses
+        :param cache: ResultCache of tool results, None always runs the tool
+        :param workdir: work directory of the sample with the inputFiles and results folders
+        :param compression: compression of input files written by the exporters, see tool_input_path
         """
+        self.cores = cores
+        self.workdir = workdir
+        self.compression = compression
+        self.cache = cache
+        self.result = None
         
     def fit(self, X, y=None):
         """
         Fits transformer over data.
         """
         return self
+
+    def task(self):
+        """
+        Function describing the TitanCNA run. Het file is created by TitanCNATransformer and Cn file is created by CoverageFileTransformer.
+        """
+        het_file = tool_input_path(self.workdir, 'TitanCNAHet', self.compression)
+        cn_file = tool_input_path(self.workdir, 'TitanCNACn', self.compression)
+        output_dir = work_path(self.workdir, 'results', 'TitanCNA', '')
+        return ToolTask('TitanCNA', [['Rscript', './scripts/titanCNA.R', '--id', 'TitanCNA', '--hetFile', het_file,
+                                      '--cnFile', cn_file, '--chrs', 'c(1:22, "X")', '--estimatePloidy', 'TRUE',
+                                      '--numCores', str(self.cores), '--outDir', output_dir]],
+                        [het_file, cn_file, './scripts/titanCNA.R'], cores=self.cores, output_dir=output_dir)
+
+    def postprocess(self):
+        """
+        TitanCNA creates all its plots by itself.
+        """
     
     def transform(self, X, **transform_params):
         """
         This function runs TitanCNA R script and takes as input file prepared data files.
-        Het file is created by TitanCNATransforme anc Cn file is created by CoverageFileTransformer.
         """
-        os.system('Rscript ./scripts/titanCNA.R --id TitanCNA --hetFile ./inputFiles/TitanCNA/Titancna.het --cnFile ./inputFiles/TitanCNA/Titancna.cn --chrs "c(1:22, \\"X\\")" --estimatePloidy TRUE --outDir ./results/TitanCNA/')
+        self.result = run_tool(self.task(), self.cache)
         return X
     
 class SciClone(TransformerMixin):
     """
     A transfomer which runs SciClone script.
     """
+    changes_data = False
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, cache=None, workdir='.', sample_id='Sample1', compression=None, **kwargs):
         """
-        Initialize method. No arguments were needed
+        Initialize method.
+
+        :param cache: ResultCache of tool results, None always runs the tool
+        :param workdir: work directory of the sample with the inputFiles and results folders
+        :param sample_id: sample name used by SciClone in its results
+        :param compression: compression of input files written by the exporters, see tool_input_path
         """
+        self.cache = cache
+        self.workdir = workdir
+        self.compression = compression
+        self.sample_id = sample_id
+        self.result = None
         
     def fit(self, X, y=None):
         """
         Fits transformer over data.
         """
         return self
+
+    def task(self):
+        """
+        Function describing the SciClone run. R script loads input files prepared by SciCloneTransfomer from the given paths.
+        """
+        vaf_file = tool_input_path(self.workdir, 'SciCloneVaf', self.compression)
+        copy_file = tool_input_path(self.workdir, 'SciCloneCopy', self.compression)
+        output_dir = work_path(self.workdir, 'results', 'SciClone', '')
+        return ToolTask('SciClone', [['Rscript', './scripts/sciClone.R', vaf_file, copy_file, self.sample_id, output_dir]],
+                        [vaf_file, copy_file, './scripts/sciClone.R'], output_dir=output_dir)
+
+    def postprocess(self):
+        """
+        SciClone creates its plot by itself.
+        """
     
     def transform(self, X, **transform_params):
         """
         This function runs SciClone R script and does not take any extra arguments. 
-        R script loads all input files by itself.
-        All input files were prepared by SciCloneTransfomer.
         """
-        os.system('Rscript ./scripts/sciClone.R')
+        self.result = run_tool(self.task(), self.cache)
         return X
     
 class FastClone(TransformerMixin):
     """
     A function that runs FastClone tool.
     """
+    changes_data = False
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, cache=None, workdir='.', compression=None, **kwargs):
         """
-        Initialize method. No arguments were needed.
+        Initialize method.
+
+        :param cache: ResultCache of tool results, None always runs the tool
+        :param workdir: work directory of the sample with the inputFiles and results folders
+        :param compression: compression of input files written by the exporters, see tool_input_path
         """
+        self.cache = cache
+        self.workdir = workdir
+        self.compression = compression
+        self.result = None
         
     def fit(self, X, y=None):
         """
         Fits transformer over data.
         """
         return self
+
+    def task(self):
+        """
+        Function describing the FastClone run. All input files were prepared by FastCloneTransformer.
+        """
+        input_file = tool_input_path(self.workdir, 'FastClone', self.compression)
+        output_dir = work_path(self.workdir, 'results', 'FastClone', '')
+        return ToolTask('FastClone', [['fastclone', 'load-pyclone', 'prop', input_file, 'None', 'solve', output_dir]],
+                        [input_file], output_dir=output_dir)
+
+    def postprocess(self):
+        """
+        FastClone writes its results by itself.
+        """
     
     def transform(self, X, **transform_params):
         """
         This function runs FastClone and takes created data files as input.
-        All input files were prepared by FastCloneTransformer.
         """
-
-        os.system('fastclone load-pyclone prop ./inputFiles/FastClone/FastCloneInput.tsv None solve ./results/FastClone/')
+        self.result = run_tool(self.task(), self.cache)
         return X
     
 
@@ -495,29 +1230,209 @@ class PyCloneVI(TransformerMixin):
     """
     A function that runs PyClone-VI tool.
     """
+    changes_data = False
     
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, clusters=40, density='beta-binomial', restarts=10, cache=None, workdir='.', compression=None, **kwargs):
         """
-        Initialize method. No arguments were needed
+        Initialize method.
+
+        :param clusters: maximum number of clusters PyClone-VI considers
+        :param density: emission density, beta-binomial or binomial
+        :param restarts: number of random restarts of variational inference
+        :param cache: ResultCache of tool results, None always runs the tool
+        :param workdir: work directory of the sample with the inputFiles and results folders
+        :param compression: compression of input files written by the exporters, see tool_input_path
         """
+        self.clusters = clusters
+        self.density = density
+        self.restarts = restarts
+        self.cache = cache
+        self.workdir = workdir
+        self.compression = compression
+        self.result = None
         
     def fit(self, X, y=None):
         """
         Fits transformer over data.
         """
         return self
+
+    def task(self):
+        """
+        Function describing the PyClone-VI run. Input file was prepared by PyCloneTransformer.
+        Fitted model is written into the results table read by postprocess.
+        """
+        input_file = tool_input_path(self.workdir, 'PyCloneVI', self.compression)
+        output_dir = work_path(self.workdir, 'results', 'PyCloneVI', '')
+        return ToolTask('PyCloneVI', [['pyclone-vi', 'fit', '-i', input_file, '-o', output_dir + 'PyCloneVI.h5',
+                                       '-c', str(self.clusters), '-d', self.density, '-r', str(self.restarts)],
+                                      ['pyclone-vi', 'write-results-file', '-i', output_dir + 'PyCloneVI.h5', '-o', output_dir + 'PyCloneVI.tsv']],
+                        [input_file], output_dir=output_dir)
+
+    def postprocess(self):
+        """
+        This function prepares histplot which serves as a great display of cellular prevalence.
+        The histplot is drawn in the background by a separate process (see plotting), so the run does not wait for it.
+        """
+        output_dir = work_path(self.workdir, 'results', 'PyCloneVI', '')
+        plotting.submit(plotting.plot_pyclone_vi, output_dir + 'PyCloneVI.tsv', output_dir + 'PyCloneVI_Plot.png')
     
     def transform(self, X, **transform_params):
         """
         This function runs PyClone-VI tool and takes as input prepared data files by PyCloneTransformer.
         Subsequently, this function prepares histplot which serves as a great display of cellular prevalence.
         """
+        self.result = run_tool(self.task(), self.cache)
+        if self.result.ok:
+            self.postprocess()
+        return X
 
-        os.system('pyclone-vi fit -i ./inputFiles/PyCloneVI/PyCloneVIInput.tsv -o ./results/PyCloneVI/PyCloneVI.h5 -c 40 -d beta-binomial -r 10')
-        
-        # Reading results and creating histplot. Subsequently exporting histplot.
-        data = pd.read_csv('./results/PyCloneVI/PyCloneVI.tsv', sep="\t")
-        sns.histplot(data=data, x='cellular_prevalence', hue='cluster_id', multiple='stack', kde=False)
-        plt.savefig('./results/PyCloneVI/PyCloneVI_Plot.png')
+class ParallelExport(TransformerMixin):
+    """
+    A transformer which prepares input files of all tools at once instead of one after another.
+    Exporters only read the variant table and the copy numbers, so they share them without copies.
+    Most of the time is spent writing files, which releases the GIL, so threads are enough.
+    """
+    changes_data = False
+
+    def __init__(self, steps, *args, threads=None, **kwargs):
+        """
+        Initialize method.
+
+        :param steps: list of (name, transformer) pairs of exporters
+        :param threads: number of files prepared at once, one thread per exporter by default
+        """
+        self.steps = steps
+        self.threads = threads
+
+    def fit(self, X, y=None):
+        """
+        Fits transformer over data.
+        """
+        return self
+
+    def transform(self, X, **transform_params):
+        """
+        This function runs all exporters concurrently and raises the first error of any of them.
+        """
+        with ThreadPoolExecutor(self.threads or len(self.steps)) as executor:
+            futures = [executor.submit(transformer.transform, X) for _, transformer in self.steps]
+            for future in futures:
+                future.result()
         return X
-    
\ No newline at end of file
+
+class ParallelTools(TransformerMixin):
+    """
+    A transformer which runs several tools at once instead of one after another.
+    Every tool starts as soon as its input files exist and enough cores are free.
+    """
+    changes_data = False
+
+    def __init__(self, tools, *args, cores=None, cache=None, **kwargs):
+        """
+        Initialize method.
+
+        :param tools: list of tool transformers (PyCloneVI, TitanCNA, SciClone, FastClone)
+        :param cores: number of cores all tools may use at once, all cores by default
+        :param cache: ResultCache shared by all tools, None always runs the tools
+        """
+        self.tools = tools
+        self.cores = cores
+        self.cache = cache
+        self.report = None
+
+    def fit(self, X, y=None):
+        """
+        Fits transformer over data.
+        """
+        return self
+
+    def transform(self, X, **transform_params):
+        """
+        This function runs all tools concurrently and post-processes results of the successful ones.
+        Exit status, wall time and standard error of every tool are stored in report.
+        """
+        scheduler = ToolScheduler(cores=self.cores, cache=self.cache)
+        results = scheduler.run([tool.task() for tool in self.tools])
+        for tool, result in zip(self.tools, results):
+            tool.result = result
+            if result.ok:
+                tool.postprocess()
+            else:
+                print(result.describe())
+
+        self.report = scheduler.report()
+        print(self.report[['tool', 'returncode', 'wall_time', 'cached']].to_string(index=False))
+        return X
+
+"""
+Custom function building the steps of the whole preparation pipeline of one sample, as assembled in the notebook.
+All input files and results are written into the work directory of the sample. Tools run concurrently through ParallelTools.
+Returns list of (name, transformer) pairs, see build_pipeline and run_steps.
+
+:param cnv_df: copy caller results of the sample (see load_cnv_file)
+:param workdir: work directory of the sample
+:param sample_id: sample identifier used in the PyClone-VI input and SciClone results
+:param samples: number of reads sampled for the PyClone input
+:param percentage: percentage passed to FilterQualityTransformer
+:param tools: tool transformers to run, all four tools by default; an empty list only prepares input files
+:param cores: number of cores all tools of the sample may use at once
+:param cache: ResultCache of tool results
+:param compact: add CompactSchemaTransformer after the extraction and after merging copy numbers
+:param arrow: store string columns of the compact table as Arrow-backed strings
+:param compression: compression of input files ('gzip' or 'zstd'), used for tools which read compressed files
+:param parallel_export: prepare input files of all tools at once in one ParallelExport step
+:param seed: seed of the sampling of the PyClone input
+:param stratify: strata of the sampling of the PyClone input ('depth', 'vaf', 'copy_number')
+:param replicates: number of independent PyClone input files
+:param workers: run extraction, filtering and copy number merge per chromosome in this many processes (see ShardedPreprocessing)
+:param contigs: contigs kept, name of a set in CONTIG_SETS or a list of contig names
+"""
+def build_steps(cnv_df, workdir='.', sample_id='R1', samples=300, percentage=90, tools=None, cores=None, cache=None,
+                compact=False, arrow=False, compression=None, parallel_export=True,
+                seed=None, stratify=None, replicates=1, workers=None, contigs='default'):
+    # One copy shared by all transformers, as in the notebook, where CopyCallsMergeTransformer rounds the levels for the others
+    cnv_df = cnv_df.copy()
+    if tools is None:
+        tools = [PyCloneVI(workdir=workdir, compression=compression), TitanCNA(workdir=workdir, compression=compression),
+                 SciClone(workdir=workdir, sample_id=sample_id, compression=compression), FastClone(workdir=workdir, compression=compression)]
+    exporters = [
+        ('pyCloneDataPreparation', PyCloneTransformer(samples=samples, workdir=workdir, sample_id=sample_id, compression=compression,
+                                                               seed=seed, stratify=stratify, replicates=replicates)),
+        ('sciCloneDataPreparation', SciCloneTransformer(cnv_df, workdir=workdir, compression=compression)),
+        ('coverageFilePreparation', CoverageFileTransformer(cnv_df, workdir=workdir, compression=compression, contigs=contigs)),
+        ('titanCNADataPreparation', TitanCNATransformer(workdir=workdir, compression=compression, contigs=contigs)),
+        ('fastCloneDataPreparation', FastCloneTransformer(workdir=workdir, compression=compression)),
+    ]
+    steps = [
+        ('vcfDataExtraction', VcfDataExtractionTransformer()),
+        ('filterQuality', FilterQualityTransformer(percentage=percentage)),
+        ('copyCallsMerge', CopyCallsMergeTransformer(cnv_df, contigs=contigs)),
+    ]
+    if compact:
+        steps.insert(1, ('compactSchema', CompactSchemaTransformer(arrow=arrow)))
+        steps.insert(4, ('compactCopyNumbers', CompactSchemaTransformer(arrow=arrow)))
+    if workers is not None:
+        steps = [('shardedPreprocessing', ShardedPreprocessing(steps, workers=workers))]
+    steps += [('dataPreparation', ParallelExport(exporters))] if parallel_export else exporters
+    if tools:
+        steps.append(('tools', ParallelTools(tools, cores=cores, cache=cache)))
+    return steps
+
+"""
+Custom function building the whole preparation pipeline of one sample as a sklearn Pipeline. Parameters are the ones of build_steps.
+
+:param memory_report: print memory of every column after every step
+"""
+def build_pipeline(cnv_df, *args, memory_report=False, **kwargs):
+    from sklearn.pipeline import Pipeline
+    pipeline = Pipeline(build_steps(cnv_df, *args, **kwargs))
+    return with_memory_report(pipeline) if memory_report else pipeline
+
+"""
+Custom function running steps one after another, as Pipeline.transform does, without importing scikit-learn.
+"""
+def run_steps(steps, X):
+    for _, step in steps:
+        X = step.transform(X)
+    return X
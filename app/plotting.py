@@ -0,0 +1,115 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+"""
+Plots rendered off the main path.
+Every plot is drawn by a separate Python process running this module, so a run never waits for matplotlib and seaborn
+to be imported or for a figure to be drawn, and plotting never shares a process with the threads of the pipeline.
+Plot functions take only paths: they read their data from files written before and write the figure into a file.
+
+    python plotting.py plot_pyclone_vi results/PyCloneVI/PyCloneVI.tsv results/PyCloneVI/PyCloneVI_Plot.png
+"""
+
+"""
+Plot processes started by submit and not waited for yet, with names of their plot functions and files with their error output.
+Processes which are not waited for finish their plots after the pipeline exits.
+"""
+PENDING = []
+
+"""
+Custom function starting a plot process. Returns the process.
+
+:param function: plot function of this module, called with the given paths
+"""
+def submit(function, *paths):
+    # Error output goes into a file, a pipe could fill up and stop the process until it is waited for
+    errors = tempfile.TemporaryFile('w+')
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), function.__name__, *map(str, paths)],
+                               stdout=subprocess.DEVNULL, stderr=errors)
+    PENDING.append((function.__name__, process, errors))
+    return process
+
+"""
+Custom function waiting until all started plots are drawn. Plots which failed are reported and do not raise.
+Returns number of failed plots.
+"""
+def wait():
+    failed = 0
+    while PENDING:
+        name, process, errors = PENDING.pop(0)
+        process.wait()
+        errors.seek(0)
+        lines = errors.read().strip().splitlines()
+        errors.close()
+        if process.returncode:
+            print(f'{name} failed with exit status {process.returncode}' + (f': {lines[-1]}' if lines else ''))
+            failed += 1
+    return failed
+
+"""
+Custom function drawing the histplot of cellular prevalence of PyClone-VI results, stacked by clusters.
+"""
+def plot_pyclone_vi(results_file, plot_file):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import pandas as pd
+    import seaborn as sns
+
+    data = pd.read_csv(results_file, sep='\t')
+    figure = plt.figure()
+    sns.histplot(data=data, x='cellular_prevalence', hue='cluster_id', multiple='stack', kde=False)
+    figure.savefig(plot_file)
+    plt.close(figure)
+
+"""
+Custom function drawing the summary of results of all tools: distributions of cellular prevalence of every tool
+and adjusted Rand indices of cluster assignments of every pair of tools (see consensus.summarize_results).
+"""
+def plot_summary(mutations_file, concordance_file, plot_file):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import numpy as np
+    import pandas as pd
+
+    mutations = pd.read_csv(mutations_file, sep='\t')
+    concordance = pd.read_csv(concordance_file, sep='\t')
+    figure, (left, right) = plt.subplots(1, 2, figsize=(12, 5))
+
+    for column in [column for column in mutations.columns if column.endswith('_prevalence')]:
+        values = mutations[column].dropna()
+        if len(values):
+            left.hist(values, bins=np.linspace(0, 1, 41), histtype='step', label=f'{column[:-len("_prevalence")]} ({len(values)})')
+    left.set_xlabel('cellular prevalence')
+    left.set_ylabel('mutations')
+    if left.has_data():
+        left.legend()
+
+    tools = list(pd.unique(concordance[['tool', 'other']].values.ravel()))
+    right.set_title('adjusted Rand index of clusters')
+    if tools:
+        matrix = np.eye(len(tools))
+        for row in concordance.itertuples():
+            i, j = tools.index(row.tool), tools.index(row.other)
+            matrix[i, j] = matrix[j, i] = row.adjusted_rand_index
+        image = right.imshow(matrix, vmin=-1, vmax=1, cmap='RdBu')
+        right.set_xticks(range(len(tools)), tools, rotation=45, ha='right')
+        right.set_yticks(range(len(tools)), tools)
+        for i in range(len(tools)):
+            for j in range(len(tools)):
+                right.text(j, i, f'{matrix[i, j]:.2f}', ha='center', va='center')
+        figure.colorbar(image, ax=right)
+    else:
+        # Fewer than two tools clustered the mutations, there is no pair to compare
+        right.set_axis_off()
+        right.text(0.5, 0.5, 'fewer than two tools with clusters', ha='center', va='center')
+
+    figure.tight_layout()
+    figure.savefig(plot_file)
+    plt.close(figure)
+
+if __name__ == '__main__':
+    globals()[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+"""
+Sampling of loci for the PyClone input.
+ReservoirSampler keeps a bounded reservoir of rows while tables are fed to it chunk by chunk, so the whole variant table
+never has to be held in memory. Every row gets a random key and the rows with the smallest keys are kept, which is a uniform
+sample of all rows seen so far. Keys are drawn row by row from one seeded generator, so the sample does not depend on the chunk size.
+"""
+
+"""
+Upper edges of depth bins (reference plus alternative reads) and of variant allele frequency bins used for stratification.
+"""
+DEPTH_BINS = [20, 50, 100]
+VAF_BINS = [0.1, 0.25, 0.5, 0.75]
+
+"""
+Strata supported by ReservoirSampler, with the columns of the PyClone input table defining them.
+Copy number is the level of the copy caller segment (normal_cn, set by CopyCallsMergeTransformer); major_cn and minor_cn
+only follow the genotype, so they are not used.
+"""
+STRATA = {
+    'depth': ['_depth_bin'],
+    'vaf': ['_vaf_bin'],
+    'copy_number': ['normal_cn'],
+}
+
+"""
+Custom function dividing size rows among strata with the given numbers of rows.
+Proportional allocation follows the sizes of strata (largest remainders get the rounding), equal allocation gives every stratum
+the same number of rows and passes rows that small strata cannot fill on to the larger ones.
+"""
+def allocate(counts, size, allocation='equal'):
+    counts = counts.astype('int64')
+    if size >= counts.sum():
+        return counts
+    if allocation == 'proportional':
+        exact = counts * size / counts.sum()
+        result = np.floor(exact).astype('int64')
+        remainder = (exact - result).sort_values(ascending=False, kind='stable')
+        result[remainder.index[:size - result.sum()]] += 1
+        return result
+
+    result = pd.Series(0, index=counts.index, dtype='int64')
+    remaining = size
+    ordered = counts.sort_values(kind='stable')
+    for i, (stratum, count) in enumerate(ordered.items()):
+        result[stratum] = min(count, remaining // (len(ordered) - i))
+        remaining -= result[stratum]
+    return result
+
+class ReservoirSampler:
+    """
+    Bounded-memory sampler of rows of tables in the PyClone input format, optionally stratified by depth, VAF bin and copy number.
+    Several independent samples (replicates) can be drawn in one pass, e.g. for bootstrap runs of PyClone.
+    """
+
+    def __init__(self, size, seed=None, strata=None, replicates=1, allocation='equal', depth_bins=DEPTH_BINS, vaf_bins=VAF_BINS):
+        """
+        Initialize method.
+
+        :param size: number of rows of every sample
+        :param seed: seed of the random generator, None gives a different sample every time
+        :param strata: list of strata ('depth', 'vaf', 'copy_number'), None samples uniformly from all rows
+        :param replicates: number of independent samples drawn at once
+        :param allocation: division of the sample among strata, 'equal' or 'proportional'
+        :param depth_bins: upper edges of depth bins
+        :param vaf_bins: upper edges of variant allele frequency bins
+        """
+        unknown = [stratum for stratum in strata or [] if stratum not in STRATA]
+        if unknown:
+            raise ValueError('Unknown strata: ' + ', '.join(unknown))
+        if allocation not in ('equal', 'proportional'):
+            raise ValueError(f'Unknown allocation {allocation}')
+        self.size = size
+        self.strata = list(strata or [])
+        self.replicates = replicates
+        self.allocation = allocation
+        self.depth_bins = depth_bins
+        self.vaf_bins = vaf_bins
+        self.by = [column for stratum in self.strata for column in STRATA[stratum]]
+        self.rng = np.random.default_rng(seed)
+        self.rows = 0
+        self.counts = None
+        self.columns = None
+        self.reservoirs = [None] * replicates
+
+    def update(self, frame):
+        """
+        Function adding rows of a table to the reservoirs. Every reservoir keeps at most size rows of every stratum,
+        as equal allocation may give a whole sample to a single stratum.
+
+        :param frame: table in the PyClone input format
+        """
+        if self.columns is None:
+            self.columns = list(frame.columns)
+        if not len(frame):
+            return
+        frame = frame.assign(_row=np.arange(self.rows, self.rows + len(frame)))
+        if 'depth' in self.strata:
+            frame['_depth_bin'] = np.searchsorted(self.depth_bins, frame['ref_counts'].values + frame['var_counts'].values, side='right')
+        if 'vaf' in self.strata:
+            frame['_vaf_bin'] = np.searchsorted(self.vaf_bins, frame['variant_freq'].values, side='right')
+        self.rows += len(frame)
+
+        counts = frame.groupby(self.by, sort=False).size() if self.by else pd.Series([len(frame)])
+        self.counts = counts if self.counts is None else self.counts.add(counts, fill_value=0)
+
+        keys = self.rng.random((len(frame), self.replicates))
+        for replicate in range(self.replicates):
+            candidates = frame.assign(_key=keys[:, replicate])
+            if self.reservoirs[replicate] is not None:
+                candidates = pd.concat([self.reservoirs[replicate], candidates])
+            # Sorted by key, the first rows of every stratum are the ones to keep
+            candidates = candidates.sort_values('_key', kind='stable')
+            self.reservoirs[replicate] = candidates.groupby(self.by, sort=False).head(self.size) if self.by else candidates.head(self.size)
+
+    def samples(self):
+        """
+        Function returning one sample of at most size rows for every replicate, with rows in the order they were added.
+        """
+        if self.counts is None:
+            return [pd.DataFrame(columns=self.columns) for _ in range(self.replicates)]
+        limits = allocate(self.counts, self.size, self.allocation).rename('_limit')
+        samples = []
+        for reservoir in self.reservoirs:
+            if self.by:
+                rank = reservoir.groupby(self.by, sort=False).cumcount().values
+                reservoir = reservoir[rank < reservoir.join(limits, on=self.by)['_limit'].values]
+            samples.append(reservoir.sort_values('_row')[self.columns].reset_index(drop=True))
+        return samples
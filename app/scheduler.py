@@ -0,0 +1,215 @@
+import os
+import subprocess
+import tempfile
+import time
+
+import pandas as pd
+
+from cache import directory_snapshot
+
+"""
+Concurrent execution of the external clonal tools.
+Every tool is described by a ToolTask listing the input files it reads. ToolScheduler starts a task as soon as
+all its input files exist and enough cores of the core budget are free, and records how every task ended.
+"""
+
+class ToolTask:
+    """
+    A run of an external tool: one or more commands executed one after another, and the files they depend on.
+    """
+
+    def __init__(self, name, commands, inputs, cores=1, output_dir=None):
+        """
+        Initialize method.
+
+        :param name: name of the tool, used in reports
+        :param commands: list of commands, every command is a list of arguments
+        :param inputs: paths of files which must exist before the task starts
+        :param cores: number of cores the tool uses
+        :param output_dir: directory the tool writes its results into, tasks without it are never cached
+        """
+        self.name = name
+        self.commands = commands
+        self.inputs = inputs
+        self.cores = cores
+        self.output_dir = output_dir
+
+    def ready(self):
+        """
+        Function checking whether all input files of the task exist.
+        """
+        return all(os.path.exists(path) for path in self.inputs)
+
+class ToolResult:
+    """
+    Outcome of a ToolTask: exit status, wall time and captured standard error.
+    """
+
+    def __init__(self, name, returncode, wall_time, stderr, command=None, cached=False):
+        """
+        Initialize method.
+
+        :param name: name of the tool
+        :param returncode: exit status of the failed command, or of the last command; None if the task never started
+        :param wall_time: seconds from the start of the first command to the end of the last one
+        :param stderr: standard error of all commands
+        :param command: command which failed, None on success
+        :param cached: whether results were restored from the cache instead of running the tool
+        """
+        self.name = name
+        self.returncode = returncode
+        self.wall_time = wall_time
+        self.stderr = stderr
+        self.command = command
+        self.cached = cached
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    def describe(self):
+        if self.returncode is None:
+            return f'{self.name} did not start: {self.stderr}'
+        if self.cached:
+            return f'{self.name} restored from cache'
+        if self.ok:
+            return f'{self.name} finished in {self.wall_time:.1f} s'
+        return f'{self.name} failed with exit status {self.returncode}:\n{self.stderr}'
+
+    def as_dict(self):
+        return {'tool': self.name, 'returncode': self.returncode, 'ok': self.ok, 'wall_time': self.wall_time,
+                'cached': self.cached, 'failed_command': ' '.join(self.command) if self.command else None, 'stderr': self.stderr}
+
+class RunningTask:
+    """
+    A task whose commands are being executed. Standard error is written to a temporary file,
+    so a tool writing a lot of diagnostics never blocks on a full pipe.
+    """
+
+    def __init__(self, task):
+        """
+        Initialize method. Starts the first command.
+
+        :param task: ToolTask to run
+        """
+        self.task = task
+        self.remaining = list(task.commands)
+        self.stderr = tempfile.TemporaryFile()
+        self.started = time.perf_counter()
+        self.process = None
+        self.error = None
+        self.start_next()
+
+    def start_next(self):
+        self.command = self.remaining.pop(0)
+        try:
+            self.process = subprocess.Popen(self.command, stderr=self.stderr)
+        except OSError as error:
+            # Missing executables are reported like a failed command instead of stopping other tools
+            self.process = None
+            self.stderr.write(f'{error}\n'.encode())
+            self.error = 127
+
+    def poll(self):
+        """
+        Function advancing the task. Returns ToolResult once the task finished, otherwise None.
+        """
+        returncode = self.error if self.process is None else self.process.poll()
+        if returncode is None:
+            return None
+        if returncode == 0 and self.remaining:
+            self.start_next()
+            return None
+
+        self.stderr.seek(0)
+        stderr = self.stderr.read().decode(errors='replace')
+        self.stderr.close()
+        return ToolResult(self.task.name, returncode, time.perf_counter() - self.started, stderr,
+                          None if returncode == 0 else self.command)
+
+class ToolScheduler:
+    """
+    Runs ToolTasks concurrently as subprocesses within a core budget.
+    """
+
+    def __init__(self, cores=None, poll_interval=0.2, input_timeout=0, cache=None):
+        """
+        Initialize method.
+
+        :param cores: number of cores tools may use at once, all cores by default
+        :param poll_interval: seconds between checks of running tools and input files
+        :param input_timeout: seconds to wait for missing input files when no tool is running
+        :param cache: ResultCache used to skip tasks whose inputs and parameters did not change, None disables caching
+        """
+        self.cores = cores or os.cpu_count()
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self.input_timeout = input_timeout
+        self.results = []
+
+    def run(self, tasks):
+        """
+        Function running all tasks and returning their results in the order the tasks were given.
+        A task whose inputs never appear is reported as not started (returncode None).
+        A task needing more cores than the budget runs alone.
+        With a cache, a task whose results are cached is restored without running and successful results are stored.
+
+        :param tasks: list of ToolTasks
+        """
+        pending = list(tasks)
+        running = []
+        results = {}
+        keys = {}
+        snapshots = {}
+        waiting_since = None
+
+        while pending or running:
+            # Starting every task whose inputs exist, as long as cores are free
+            used = sum(task.task.cores for task in running)
+            for task in list(pending):
+                if task.ready() and self.cache is not None and task.output_dir is not None and task.name not in keys:
+                    # Hashing inputs once they exist; the same key is used to store results after the run
+                    keys[task.name] = self.cache.key(task)
+                    if self.cache.restore(keys[task.name], task.output_dir):
+                        results[task.name] = ToolResult(task.name, 0, 0.0, '', cached=True)
+                        pending.remove(task)
+                        continue
+                if task.ready() and (used + task.cores <= self.cores or not running):
+                    if task.name in keys:
+                        # Files already in the output directory are left by earlier runs, only files the task writes are stored
+                        snapshots[task.name] = directory_snapshot(task.output_dir)
+                    running.append(RunningTask(task))
+                    pending.remove(task)
+                    used += task.cores
+
+            for task in list(running):
+                result = task.poll()
+                if result is not None:
+                    results[task.task.name] = result
+                    running.remove(task)
+                    if result.ok and task.task.name in keys:
+                        self.cache.store(keys[task.task.name], task.task.output_dir, snapshots[task.task.name])
+
+            # Giving up on tasks whose inputs are missing once nothing else can produce them
+            if pending and not running and not any(task.ready() for task in pending):
+                waiting_since = waiting_since or time.perf_counter()
+                if time.perf_counter() - waiting_since >= self.input_timeout:
+                    for task in pending:
+                        missing = [path for path in task.inputs if not os.path.exists(path)]
+                        results[task.name] = ToolResult(task.name, None, 0.0, 'Missing input files: ' + ', '.join(missing))
+                    pending = []
+            else:
+                waiting_since = None
+
+            if pending or running:
+                time.sleep(self.poll_interval)
+
+        self.results = [results[task.name] for task in tasks]
+        return self.results
+
+    def report(self):
+        """
+        Function returning results of the last run as a dataframe.
+        """
+        return pd.DataFrame([result.as_dict() for result in self.results],
+                            columns=['tool', 'returncode', 'ok', 'wall_time', 'cached', 'failed_command', 'stderr']).astype({'returncode': 'Int64'})
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import pandas as pd
+
+from cache import file_digest
+from writers import UMASK, arrow_module
+
+"""
+Cache of parsed tables between sessions.
+A parsed VCF or copy caller table is stored next to its source file as an uncompressed Arrow IPC (Feather v2) file,
+which later loads map into memory instead of parsing the text again. Numbers and long string columns are used straight
+from the mapped file; short repeated strings (chromosomes, alleles, FORMAT) are stored as dictionaries.
+The cache requires pyarrow. Without it, tables are always parsed.
+"""
+
+"""
+Version of the cache layout. Caches written by other versions are ignored.
+"""
+CACHE_VERSION = '1'
+
+"""
+Custom function returning path of the cache file of a source file. Different loader options (e.g. regions) get different files.
+"""
+def cache_path(path, options=None):
+    digest = hashlib.sha256(json.dumps(options, sort_keys=True, default=str).encode()).hexdigest()[:12]
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f'.{name}.{digest}.arrow')
+
+"""
+Custom function describing the source file in the cache metadata.
+"""
+def source_metadata(path):
+    stat = os.stat(path)
+    return {'version': CACHE_VERSION, 'size': str(stat.st_size), 'mtime_ns': str(stat.st_mtime_ns), 'sha256': file_digest(path)}
+
+"""
+Custom function checking the cache metadata against the source file. Size and modification time are compared first,
+the content hash only if the file was touched without changing size, e.g. by copying it.
+"""
+def is_fresh(metadata, path):
+    stat = os.stat(path)
+    if metadata.get('version') != CACHE_VERSION or metadata.get('size') != str(stat.st_size):
+        return False
+    return metadata.get('mtime_ns') == str(stat.st_mtime_ns) or metadata.get('sha256') == file_digest(path)
+
+"""
+Custom function reading a cached table from a memory map. Returns None if the cache is missing, stale or unreadable.
+"""
+def read_cache(cache, path):
+    pa, pa_ipc = arrow_module(), arrow_module('pyarrow.ipc')
+    try:
+        reader = pa_ipc.open_file(pa.memory_map(cache, 'r'))
+        metadata = {key.decode(): value.decode() for key, value in (reader.schema.metadata or {}).items()}
+        if not is_fresh(metadata, path):
+            return None
+        table = reader.read_all()
+    except (OSError, pa.ArrowException):
+        return None
+
+    # Dictionary columns return to the object columns of the parsed table; categories share their strings, so this is cheap
+    frame = table.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow'), pa.large_string(): pd.StringDtype('pyarrow')}.get)
+    for column in frame.columns:
+        if isinstance(frame[column].dtype, pd.CategoricalDtype):
+            frame[column] = frame[column].astype(object)
+    return frame
+
+"""
+Custom function writing a table into the cache atomically. String columns with few distinct values are dictionary-encoded.
+Returns False if the cache cannot be written, e.g. in a read-only folder.
+
+:param metadata: description of the source file taken before parsing it (see source_metadata)
+"""
+def write_cache(frame, cache, metadata):
+    pa, pa_ipc = arrow_module(), arrow_module('pyarrow.ipc')
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    columns = []
+    for column in table.columns:
+        if pa.types.is_string(column.type):
+            encoded = column.dictionary_encode()
+            if sum(len(chunk.dictionary) for chunk in encoded.chunks) <= len(column) // 2:
+                column = encoded
+        columns.append(column)
+    table = pa.Table.from_arrays(columns, names=table.column_names).replace_schema_metadata(metadata)
+
+    directory = os.path.dirname(cache)
+    try:
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=os.path.basename(cache) + '.', suffix='.tmp')
+    except OSError:
+        return False
+    try:
+        with os.fdopen(descriptor, 'wb') as f, pa_ipc.new_file(f, table.schema) as writer:
+            writer.write_table(table)
+        # mkstemp creates files readable only by their owner, the cache gets the permissions of other new files, as tool inputs do
+        os.chmod(temporary, 0o666 & ~UMASK)
+        os.replace(temporary, cache)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return True
+
+"""
+Custom function loading a table through the cache. The table is parsed by parse(path) if pyarrow is missing
+or the cache is missing or stale, and the cache is then written for the next load.
+
+:param path: source file
+:param parse: function parsing the source file into a dataframe
+:param options: loader options changing the parsed table, part of the cache file name
+"""
+def load_cached(path, parse, options=None):
+    if arrow_module() is None:
+        return parse(path)
+    cache = cache_path(path, options)
+    frame = read_cache(cache, path)
+    if frame is None:
+        # The source is described before parsing, so changes made while it is parsed make the cache stale
+        metadata = source_metadata(path)
+        frame = parse(path)
+        write_cache(frame, cache, metadata)
+    return frame
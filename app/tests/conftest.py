@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules of the pipeline are imported from the app folder, as the notebook and cli.py do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
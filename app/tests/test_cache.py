@@ -0,0 +1,43 @@
+import sys
+
+from cache import ResultCache
+from scheduler import ToolScheduler, ToolTask
+
+def output_task(tmp_path, content):
+    output_dir = tmp_path / 'results' / 'Tool'
+    source = tmp_path / 'input.tsv'
+    source.write_text(content)
+    # The tool writes out.tsv and a file named after its input, which differs between runs with different inputs
+    code = (f'import os; os.makedirs({str(output_dir)!r}, exist_ok=True); content = open({str(source)!r}).read(); '
+            f'open(os.path.join({str(output_dir)!r}, "out.tsv"), "w").write(content); open(os.path.join({str(output_dir)!r}, content + ".log"), "w").close()')
+    return ToolTask('Tool', [[sys.executable, '-c', code]], [str(source)], output_dir=str(output_dir) + '/'), output_dir
+
+def test_only_files_written_by_the_task_are_stored(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    task, output_dir = output_task(tmp_path, 'first')
+    output_dir.mkdir(parents=True)
+    (output_dir / 'stale.tsv').write_text('left by an earlier run')
+
+    result, = ToolScheduler(cores=1, cache=cache, poll_interval=0.05).run([task])
+    assert result.ok and not result.cached
+    entry = tmp_path / 'cache' / cache.key(task)
+    assert sorted(path.name for path in entry.iterdir()) == ['first.log', 'out.tsv']
+
+def test_restore_replaces_only_files_of_the_tool(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    scheduler = ToolScheduler(cores=1, cache=cache, poll_interval=0.05)
+    first, output_dir = output_task(tmp_path, 'first')
+    scheduler.run([first])
+    second, _ = output_task(tmp_path, 'second')
+    scheduler.run([second])
+    # Files the tool did not write, e.g. of other tools sharing the folder, are kept
+    (output_dir / 'notes.txt').write_text('written by the user')
+    (output_dir / 'other').mkdir()
+    (output_dir / 'other' / 'result.tsv').write_text('written by another tool')
+
+    first, _ = output_task(tmp_path, 'first')
+    result, = scheduler.run([first])
+    assert result.cached
+    assert sorted(str(path.relative_to(output_dir)) for path in output_dir.rglob('*') if path.is_file()) == \
+           ['first.log', 'notes.txt', 'other/result.tsv', 'out.tsv']
+    assert (output_dir / 'out.tsv').read_text() == 'first'
@@ -0,0 +1,42 @@
+import benchmark
+import cli
+import cohort
+import main
+
+def test_cohort_tools_get_command_line_options():
+    args = cli.build_parser().parse_args(['cohort', 'manifest.tsv', '--tools', 'PyCloneVI', 'TitanCNA', 'SciClone',
+                                          '--restarts', '20', '--density', 'binomial', '--clusters', '8', '--titan-cores', '3'])
+    options = {'compression': 'gzip', 'cache': None, 'cores': 2,
+               'tool_options': {'clusters': args.clusters, 'density': args.density, 'restarts': args.restarts, 'titan_cores': args.titan_cores}}
+    pyclone, titan, sciclone = cohort.sample_tools(args.tools, 'cohort/samples/T1', 'T1', options).tools
+
+    assert (pyclone.clusters, pyclone.density, pyclone.restarts) == (8, 'binomial', 20)
+    assert titan.cores == 3
+    assert sciclone.sample_id == 'T1'
+    assert all(tool.workdir == 'cohort/samples/T1' and tool.compression == 'gzip' for tool in (pyclone, titan, sciclone))
+
+def write_manifest(directory):
+    rows = ['sample_id\tvcf\tcnv']
+    for i, sample_id in enumerate(['T1', 'T2']):
+        benchmark.write_synthetic_vcf(str(directory / f'{sample_id}.vcf'), 3000, seed=i)
+        benchmark.write_synthetic_cnv(str(directory / f'{sample_id}.tsv'), 100000, seed=i)
+        rows.append(f'{sample_id}\t{sample_id}.vcf\t{sample_id}.tsv')
+    (directory / 'manifest.tsv').write_text('\n'.join(rows) + '\n')
+    return str(directory / 'manifest.tsv')
+
+def test_cohort_samples_get_preparation_options(tmp_path):
+    manifest = write_manifest(tmp_path)
+    args = cli.build_parser().parse_args(['cohort', manifest, '--tools', '--seed', '7', '--replicates', '2', '--table-cache',
+                                          '--samples', '50', '--contigs', 'autosomes'])
+    inputs = []
+    for root in ('first', 'second'):
+        args.root = str(tmp_path / root)
+        assert cli.command_cohort(args) == 0
+        pyclone = main.tool_input_path(str(tmp_path / root / 'samples' / 'T1'), 'PyClone')
+        inputs.append([open(main.replicate_path(pyclone, replicate)).read() for replicate in range(2)])
+
+    # Seeded samples are reproduced by the second run, and replicates differ
+    assert inputs[0] == inputs[1]
+    assert inputs[0][0] != inputs[0][1]
+    assert len(inputs[0][0].splitlines()) == 51
+    assert len(list(tmp_path.glob('.T1.vcf.*.arrow'))) == 1
@@ -0,0 +1,32 @@
+import argparse
+
+import cli
+import consensus
+import plotting
+
+def write_sciclone(workdir):
+    directory = workdir / 'results' / 'SciClone'
+    directory.mkdir(parents=True)
+    (directory / 'ResultSciClone').write_text('chr\tst\tadequateDepth\tT1.vaf\tcluster\tcluster.prob.1\tcluster.prob.2\n'
+                                              '1\t100\t1\t40\t1\t0.9\t0.1\n'
+                                              '2\t200\t1\t20\t2\t0.2\t0.8\n')
+
+def test_summary_of_empty_results_folder(tmp_path):
+    table, clusters, prevalences = consensus.summarize_results(str(tmp_path), plot=False)
+    assert len(table) == 0 and len(clusters) == 0 and len(prevalences) == 0
+    assert (tmp_path / 'results' / 'summary' / 'mutations.tsv').exists()
+
+    args = argparse.Namespace(workdir=str(tmp_path), burnin=0, thin=1)
+    assert cli.summarize(args) == 1
+
+def test_summary_without_prevalences(tmp_path):
+    write_sciclone(tmp_path)
+    table, clusters, _ = consensus.summarize_results(str(tmp_path))
+    assert plotting.wait() == 0
+
+    assert list(table.index) == ['1:100', '2:200']
+    assert list(table['SciClone_cluster']) == [1, 2]
+    assert list(table['prevalence_tools']) == [0, 0]
+    assert table['prevalence_consensus'].isna().all() and table['prevalence_spread'].isna().all()
+    assert len(clusters) == 0
+    assert (tmp_path / 'results' / 'summary' / 'summary.png').exists()
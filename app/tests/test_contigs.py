@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+
+import cli
+import main
+
+def test_unknown_contig_set_lists_valid_names():
+    with pytest.raises(ValueError, match='expected one of autosomes, default, canonical, all'):
+        main.contig_mask(np.array([1, 2]), 'chromosomes')
+
+def test_contig_option_accepts_every_contig_set():
+    parser = cli.build_parser()
+    arguments = ['prepare', '--vcf', 'sample.vcf', '--cnv', 'cnv.tsv', '--contigs']
+    for name in main.CONTIG_SETS:
+        assert parser.parse_args(arguments + [name]).contigs == name
+    with pytest.raises(SystemExit):
+        parser.parse_args(arguments + ['chromosomes'])
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+import benchmark
+import checkpoint
+import instrumentation
+import main
+
+
+def test_instrumented_steps_resume_from_checkpoints(tmp_path):
+    vcf, cnv = str(tmp_path / 'sample.vcf'), str(tmp_path / 'cnv.tsv')
+    benchmark.write_synthetic_vcf(vcf, 2000)
+    benchmark.write_synthetic_cnv(cnv, 100000)
+    source = checkpoint.source_key([vcf])
+
+    outputs = []
+    for _ in range(2):
+        steps, report = instrumentation.instrument(main.build_steps(main.load_cnv_file(cnv), workdir=str(tmp_path), tools=[], seed=1))
+        assert isinstance(steps, list)
+        outputs.append(checkpoint.run_checkpointed(steps, lambda: main.load_vcf_file(vcf), source, str(tmp_path / '.checkpoints')))
+
+    assert outputs[0].equals(outputs[1])
+    # The second run resumes from checkpoints: only skipped data steps run, over no rows
+    assert all(stats['rows_in'] == 0 for stats in report.stages)
+
+
+def test_instrumentation_does_not_import_sklearn():
+    code = 'import sys, instrumentation; sys.exit("sklearn" in sys.modules)'
+    assert subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(instrumentation.__file__)).returncode == 0
+
+
+def test_instrumented_transformer_forwards_step_attributes():
+    wrapped = instrumentation.InstrumentedTransformer('export', main.ParallelExport([]), instrumentation.RunReport())
+    assert wrapped.changes_data is False
+    assert wrapped.tools == []
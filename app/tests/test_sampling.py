@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from sampling import ReservoirSampler
+
+def pyclone_table(rows, normal_cn, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'mutation_id': [f'chr1:{position}' for position in range(rows)],
+        'var_counts': rng.integers(1, 30, size=rows),
+        'ref_counts': rng.integers(1, 30, size=rows),
+        'minor_cn': 0,
+        'major_cn': 2,
+        'normal_cn': normal_cn,
+        'variant_freq': rng.random(rows),
+    })
+
+def test_copy_number_strata_cover_both_levels():
+    # 5 % of the loci lie in an amplified segment, with a single genotype everywhere
+    table = pyclone_table(2000, np.where(np.arange(2000) % 20 == 0, 4, 2))
+    sampler = ReservoirSampler(40, seed=1, strata=['copy_number'])
+    for start in range(0, len(table), 300):
+        sampler.update(table.iloc[start:start + 300])
+    sample, = sampler.samples()
+    assert sample['normal_cn'].value_counts().to_dict() == {2: 20, 4: 20}
+
+def test_sample_does_not_depend_on_chunks():
+    table = pyclone_table(1000, 2)
+    whole = ReservoirSampler(50, seed=3)
+    whole.update(table)
+    chunked = ReservoirSampler(50, seed=3)
+    for start in range(0, len(table), 70):
+        chunked.update(table.iloc[start:start + 70])
+    pd.testing.assert_frame_equal(whole.samples()[0], chunked.samples()[0])
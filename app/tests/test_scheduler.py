@@ -0,0 +1,25 @@
+import sys
+
+from scheduler import ToolScheduler, ToolTask
+
+def write_task(name, tmp_path, inputs, cores=1):
+    output = tmp_path / name
+    command = [sys.executable, '-c', f'import time; time.sleep(0.2); open({str(output)!r}, "w").write("done")']
+    return ToolTask(name, [command], [str(path) for path in inputs], cores=cores), output
+
+def test_ready_tasks_wait_for_cores(tmp_path):
+    source = tmp_path / 'input.tsv'
+    source.write_text('x')
+    first, first_output = write_task('first', tmp_path, [source])
+    second, second_output = write_task('second', tmp_path, [source])
+
+    results = ToolScheduler(cores=1, poll_interval=0.05).run([first, second])
+    assert [result.ok for result in results] == [True, True]
+    assert first_output.read_text() == 'done' and second_output.read_text() == 'done'
+
+def test_task_with_missing_inputs_is_not_started(tmp_path):
+    task, output = write_task('missing', tmp_path, [tmp_path / 'absent.tsv'])
+    result, = ToolScheduler(cores=1, poll_interval=0.05).run([task])
+    assert result.returncode is None
+    assert 'Missing input files' in result.stderr
+    assert not output.exists()
@@ -0,0 +1,37 @@
+import warnings
+
+import pandas as pd
+import pytest
+
+import benchmark
+import main
+
+@pytest.fixture(scope='module')
+def sample(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('sample')
+    benchmark.write_synthetic_vcf(str(directory / 'sample.vcf'), 20000)
+    benchmark.write_synthetic_cnv(str(directory / 'cnv.tsv'), 100000)
+    return str(directory / 'sample.vcf'), main.load_cnv_file(str(directory / 'cnv.tsv'))
+
+def preprocessing_steps(cnv_df):
+    return [('vcfDataExtraction', main.VcfDataExtractionTransformer()),
+            ('compactSchema', main.CompactSchemaTransformer()),
+            ('filterQuality', main.FilterQualityTransformer(percentage=90)),
+            ('copyCallsMerge', main.CopyCallsMergeTransformer(cnv_df.copy()))]
+
+def test_sharded_preprocessing_matches_serial_run(sample):
+    vcf, cnv_df = sample
+    serial = main.run_steps(preprocessing_steps(cnv_df), main.load_vcf_file(vcf))
+    with warnings.catch_warnings():
+        # Concatenating the empty result with the shards could change column types
+        warnings.filterwarnings('error', message='The behavior of DataFrame concatenation with empty', category=FutureWarning)
+        sharded = main.ShardedPreprocessing(preprocessing_steps(cnv_df), workers=2).transform(main.load_vcf_file(vcf))
+    pd.testing.assert_frame_equal(sharded, serial)
+
+def test_sharded_preprocessing_without_rows(sample):
+    vcf, cnv_df = sample
+    X = main.load_vcf_file(vcf).iloc[:0]
+    sharded = main.ShardedPreprocessing(preprocessing_steps(cnv_df), workers=2).transform(X.copy())
+    serial = main.run_steps(preprocessing_steps(cnv_df), X.copy())
+    assert len(sharded) == 0
+    assert list(sharded.columns) == list(serial.columns)
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+import main
+
+"""
+Libraries which take long to import and are imported only where they are used.
+"""
+HEAVY = ['sklearn', 'seaborn', 'matplotlib', 'scipy', 'pyarrow']
+
+def imported_modules(code):
+    output = subprocess.run([sys.executable, '-c', code + '\nprint(",".join(sorted(sys.modules)))'], capture_output=True, text=True,
+                            check=True, cwd=os.path.dirname(main.__file__))
+    return {module for module in output.stdout.strip().split(',') if module.split('.')[0] in HEAVY}
+
+def test_main_and_cli_do_not_import_heavy_libraries():
+    loaded = imported_modules('import sys, main, cli')
+    # pandas imports pyarrow itself when it is installed, so only pyarrow modules pandas does not import count
+    loaded -= imported_modules('import sys, pandas')
+    assert loaded == set()
+
+def test_plotting_and_machine_learning_libraries_are_not_imported():
+    loaded = imported_modules('import sys, main, cli')
+    assert not {module for module in loaded if not module.startswith('pyarrow')}
@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+
+import benchmark
+import main
+
+@pytest.fixture(scope='module')
+def vcf_files(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('vcf')
+    paths = {}
+    for variants in (40000, 160000):
+        paths[variants] = str(directory / f'{variants}.vcf')
+        benchmark.write_synthetic_vcf(paths[variants], variants)
+    return paths
+
+def test_streamed_loading_keeps_peak_memory_flat(vcf_files):
+    # Both inputs span several chunks of 10000 variants, the larger one is four times larger
+    small = benchmark.loading_peak_rss(vcf_files[40000], 'stream', chunksize=10000)
+    large = benchmark.loading_peak_rss(vcf_files[160000], 'stream', chunksize=10000)
+    assert (small[0], large[0]) == (40000, 160000)
+    assert large[1] <= small[1] * 1.1
+
+def test_chunked_loading_returns_the_whole_table(vcf_files):
+    # A chunk size which does not divide the number of variants leaves a shorter last chunk
+    chunked = main.load_vcf_file(vcf_files[40000], chunksize=7000)
+    pd.testing.assert_frame_equal(chunked.reset_index(drop=True), main.load_vcf_file(vcf_files[40000]))
+
+def test_chunked_loading_takes_no_more_memory_than_loading_at_once(vcf_files):
+    rows, chunked = benchmark.loading_peak_rss(vcf_files[160000], 'chunked', chunksize=10000)
+    _, direct = benchmark.loading_peak_rss(vcf_files[160000], 'direct')
+    assert rows == 160000
+    assert chunked <= direct * 1.1
@@ -0,0 +1,19 @@
+import os
+import stat
+
+import pandas as pd
+
+import benchmark
+import main
+import tablecache
+import writers
+
+def test_cache_file_gets_permissions_of_new_files(tmp_path):
+    vcf = str(tmp_path / 'sample.vcf')
+    benchmark.write_synthetic_vcf(vcf, 1000)
+    X = main.load_vcf_file(vcf, cache=True)
+
+    cache = tablecache.cache_path(vcf, {'table': 'vcf', 'regions': None})
+    assert stat.S_IMODE(os.stat(cache).st_mode) == 0o666 & ~writers.UMASK
+    # Long strings of a cached table are Arrow-backed, values are the same
+    pd.testing.assert_frame_equal(main.load_vcf_file(vcf, cache=True).astype(object), X.astype(object))
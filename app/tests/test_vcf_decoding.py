@@ -0,0 +1,53 @@
+import pandas as pd
+
+import main
+
+HEADER = '##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE\n'
+
+def write_vcf(path, records):
+    path.write_text(HEADER + ''.join('\t'.join(map(str, record)) + '\n' for record in records))
+    return str(path)
+
+def test_decode_format_without_requested_key():
+    formats = pd.Series(['GT:AD:DP:GQ', 'GT:AD:DP:GQ'])
+    samples = pd.Series(['0/1:3,4:7:50', '1/1:0,9:9:60'])
+    fields = main.decode_format(formats, samples, ['GT', 'AD', 'DP', 'GQ', 'PL'])
+    assert list(fields['GT']) == ['0/1', '1/1']
+    assert list(fields['AD']) == ['3,4', '0,9']
+    assert fields['PL'].isna().all()
+
+def test_decode_format_only_missing_keys():
+    fields = main.decode_format(pd.Series(['GT']), pd.Series(['0/1']), ['AD', 'PL'])
+    assert fields.isna().all().all()
+
+def test_extraction_of_mixed_formats(tmp_path):
+    path = write_vcf(tmp_path / 'mixed.vcf', [
+        ('chr1', 100, '.', 'A', 'T', '.', 'PASS', 'AF=0.5', 'GT:AD:DP:GQ:PL', '0/1:3,4:7:50:10,0,20'),
+        ('chr1', 200, '.', 'C', 'G', '.', 'PASS', 'AF=0.5', 'GT:AD:DP:GQ', '0/1:5,5:10:40'),
+        ('chr2', 300, '.', 'G', 'A', '.', 'PASS', 'AF=0.5', 'GT:DP:GQ:PL', '1/1:8:30:30,10,0'),
+    ])
+    X = main.VcfDataExtractionTransformer().transform(main.load_vcf_file(path))
+    assert list(X['REF COUNT'].iloc[:2]) == [3, 5]
+    assert list(X['ALT COUNT'].iloc[:2]) == [4, 5]
+    # Missing numbers are stored as -1, missing allelic depth counts as no reads
+    assert X['PL HET'].iloc[1] == -1
+    assert X['PL HET'].iloc[2] == 10
+    assert X['REF COUNT'].iloc[2] == 0 and X['ALT COUNT'].iloc[2] == 0
+    assert list(X['DEPTH']) == [7, 10, 8]
+
+def test_extraction_without_pl(tmp_path):
+    path = write_vcf(tmp_path / 'no_pl.vcf', [
+        ('chr1', 100, '.', 'A', 'T', '.', 'PASS', 'AF=0.5', 'GT:AD:DP:GQ', '0/1:3,4:7:50'),
+        ('chr1', 200, '.', 'C', 'G', '.', 'PASS', 'AF=0.5', 'GT:AD:DP:GQ', '0/1:5,5:10:40'),
+    ])
+    X = main.VcfDataExtractionTransformer().transform(main.load_vcf_file(path))
+    assert list(X['PL HOM REF']) == [-1, -1]
+    assert list(X['ALT COUNT']) == [4, 5]
+
+def test_extraction_without_ad(tmp_path):
+    path = write_vcf(tmp_path / 'no_ad.vcf', [
+        ('chr1', 100, '.', 'A', 'T', '.', 'PASS', 'AF=0.5', 'GT:DP:GQ:PL', '0/1:7:50:10,0,20'),
+    ])
+    X = main.VcfDataExtractionTransformer().transform(main.load_vcf_file(path))
+    assert list(X['REF COUNT']) == [0] and list(X['ALT COUNT']) == [0]
+    assert list(X['PL HOM ALT']) == [20]
@@ -0,0 +1,53 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+import benchmark
+import main
+import writers
+
+def pandas_writer(name='pyarrow'):
+    return None
+
+def test_engines_write_same_text():
+    frame = pd.DataFrame({
+        'chr': pd.Categorical(['1', '2', 'X', 'Y']),
+        'pos': np.array([1620001, 10, 5, 7], dtype='int64'),
+        'depth': pd.array([3, None, 0, 12], dtype='Int64'),
+        'vaf': [1e-05, 2.0, np.nan, -0.0],
+        'cn': np.array([0.5, 1e+17, 1 / 3, 123456789.123], dtype='float32'),
+        'het': [True, False, True, False],
+        'id': ['a', 'b', 'c', 'd'],
+    })
+    arrow = io.BytesIO()
+    writers.write_arrow(frame, arrow, '\t', True)
+    text = io.BytesIO()
+    frame.to_csv(text, sep='\t', index=False)
+    assert arrow.getvalue().decode() == text.getvalue().decode()
+
+def test_exported_files_do_not_depend_on_engine(tmp_path, monkeypatch):
+    benchmark.write_synthetic_vcf(str(tmp_path / 'sample.vcf'), 5000)
+    benchmark.write_synthetic_cnv(str(tmp_path / 'cnv.tsv'), 100000)
+    cnv_df = main.load_cnv_file(str(tmp_path / 'cnv.tsv'))
+
+    written = []
+    write_arrow = writers.write_arrow
+    def recorded_write_arrow(frame, *args):
+        write_arrow(frame, *args)
+        written.append(frame)
+    monkeypatch.setattr(writers, 'write_arrow', recorded_write_arrow)
+
+    files = {}
+    for engine in ['arrow', 'pandas']:
+        if engine == 'pandas':
+            monkeypatch.setattr(writers, 'arrow_module', pandas_writer)
+        workdir = tmp_path / engine
+        workdir.mkdir()
+        steps = main.build_steps(cnv_df, workdir=str(workdir), tools=[], seed=0)
+        main.run_steps(steps, main.load_vcf_file(str(tmp_path / 'sample.vcf')))
+        files[engine] = {path.relative_to(workdir): path.read_bytes() for path in workdir.rglob('*') if path.is_file()}
+
+    # Every file of the first run was written by Arrow, none fell back to pandas
+    assert len(written) == len(files['arrow']) > 0
+    assert files['arrow'] == files['pandas']
@@ -0,0 +1,157 @@
+import contextlib
+import filecmp
+import functools
+import gzip
+import importlib
+import os
+import tempfile
+
+import numpy as np
+
+"""
+Writing of tab-separated tool input files.
+Tables are written by the CSV writer of Arrow when pyarrow is installed, which is several times faster than pandas
+and releases the GIL, so several files can be written at once from threads. Otherwise pandas is used.
+pyarrow is imported with the first table written, so importing the pipeline stays quick.
+Files are written into a temporary file in the target folder and renamed afterwards, so a tool waiting for the file
+never reads it half-written. A file whose content would not change is left alone, so its modification time stays as it was.
+"""
+
+"""
+Permission mask of the process, read once, as changing the mask to read it is not safe while other threads create files.
+"""
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+"""
+Custom function importing a module of pyarrow on first use, e.g. 'pyarrow.csv'. Returns None if pyarrow is not installed.
+"""
+@functools.lru_cache(maxsize=None)
+def arrow_module(name='pyarrow'):
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+"""
+Lists collecting paths written by write_table, one for every active recording() (see checkpoint.py).
+"""
+RECORDINGS = []
+
+"""
+Custom context manager collecting paths of all files written by write_table, from any thread, while it is active.
+"""
+@contextlib.contextmanager
+def recording():
+    paths = []
+    RECORDINGS.append(paths)
+    try:
+        yield paths
+    finally:
+        RECORDINGS.remove(paths)
+
+"""
+File suffixes of the supported compressions. Compression of a file is chosen by its suffix, as pandas does.
+"""
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+"""
+Custom function returning the path with the suffix of the given compression, or the path itself without compression.
+"""
+def compressed_path(path, compression=None):
+    return path if compression is None else path + COMPRESSION_SUFFIXES[compression]
+
+"""
+Custom function returning compression of a file according to its suffix, None for plain files.
+"""
+def path_compression(path):
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+"""
+Custom function opening a compressed stream over a binary file object. Returns the file object itself without compression.
+Gzip headers carry no modification time, so the same table always gives the same file (see cache.ResultCache).
+"""
+def open_compressed(raw, compression):
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6, mtime=0)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError('zstd compression requires the zstandard package') from None
+        return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+    return raw
+
+"""
+Custom function returning a float or boolean column as Arrow strings formatted as pandas writes them (e.g. 1e-05, 2.0
+and True, where Arrow would write 0.00001, 2 and true). Returns None for other columns, which both write the same.
+"""
+def pandas_text(column):
+    pa = arrow_module()
+    if column.dtype == bool:
+        return pa.array(np.where(column.to_numpy(), 'True', 'False'))
+    if column.dtype.kind == 'f':
+        values = column.to_numpy() if isinstance(column.dtype, np.dtype) else column.to_numpy(np.float64, na_value=np.nan)
+        # pandas formats floats by numpy and writes missing values as empty fields
+        return pa.array(values.astype(str), mask=np.isnan(values), type=pa.string())
+    return None
+
+"""
+Custom function writing a dataframe with the CSV writer of Arrow. Values which would need quotes raise an error,
+as tool inputs are never quoted. Numbers are written as pandas writes them, so both engines give the same file.
+"""
+def write_arrow(frame, stream, sep, header):
+    pa, pa_csv = arrow_module(), arrow_module('pyarrow.csv')
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    for position, (_, column) in enumerate(frame.items()):
+        text = pandas_text(column)
+        if text is not None:
+            table = table.set_column(position, table.column_names[position], text)
+    # Arrow always quotes column names, so the header is written as pandas writes it
+    if header:
+        stream.write((sep.join(str(column) for column in frame.columns) + '\n').encode())
+    pa_csv.write_csv(table, stream, pa_csv.WriteOptions(include_header=False, delimiter=sep, quoting_style='none'))
+
+"""
+Custom function writing a dataframe into a file atomically, optionally compressed according to the file suffix (.gz, .zst).
+Arrow and pandas write the same text for the same frame, so the engine does not change the file.
+"""
+def write_table(frame, path, sep='\t', header=True):
+    compression = path_compression(path)
+    directory = os.path.dirname(path) or '.'
+    pa = arrow_module()
+    engines = ['arrow', 'pandas'] if pa is not None else ['pandas']
+
+    for engine in engines:
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as raw:
+                stream = open_compressed(raw, compression)
+                if engine == 'arrow':
+                    write_arrow(frame, stream, sep, header)
+                else:
+                    frame.to_csv(stream, sep=sep, header=header, index=False)
+                if stream is not raw:
+                    stream.close()
+        except Exception as error:
+            os.unlink(temporary)
+            # Tables Arrow cannot write (e.g. mixed types or values needing quotes) are written by pandas
+            if engine == 'arrow' and isinstance(error, (pa.ArrowException, TypeError, ValueError)):
+                continue
+            raise
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+        for paths in RECORDINGS:
+            paths.append(path)
+        if os.path.isfile(path) and filecmp.cmp(temporary, path, shallow=False):
+            os.unlink(temporary)
+            return path
+        # mkstemp creates files readable only by the owner, the final file gets the usual permissions
+        os.chmod(temporary, 0o666 & ~UMASK)
+        os.replace(temporary, path)
+        return path